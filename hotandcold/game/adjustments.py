@@ -0,0 +1,58 @@
+"""Game adjustments used in game app.
+
+Used for changing games which have already been counted, when their score
+is changed (see the rescore_participations command) or they are deleted
+with their Event (see archive.delete_events). Every total a game was
+counted in when it was saved (see submissions.save_game), the points of
+the player, their statistics, the rollups and the score of their team, is
+changed by the same amount, so they all keep agreeing with the games, and
+with the reconcile_points command.
+
+Games which are archived are not changed, they still count.
+"""
+
+from collections import Counter, namedtuple
+
+from django.db import transaction
+from django.db.models import F
+
+from . import leaderboards, profiles, stats, teams
+from .models import Player
+
+
+# Change to a game already counted: who played it, when and for which
+# team, and the change to its score and to the number of games (-1 for a
+# game taken away).
+GameChange = namedtuple("GameChange", ["player_id", "team_id", "created",
+    "score", "games"])
+
+
+def adjust_games(changes):
+    """Apply changes to games already counted to every total.
+
+    Must be called after the games have been changed or deleted, as the
+    best scores are found again from the games left.
+
+    Arguments:
+    changes (list) - GameChange of each game.
+
+    Returns:
+    None.
+    """
+    if not changes:
+        return
+
+    with transaction.atomic():
+        points = Counter()
+        for change in changes:
+            points[change.player_id] += change.score
+        for player_id, difference in points.items():
+            Player.objects.filter(pk=player_id).update(
+                    points=F("points") + difference)
+
+        stats.adjust_stats(changes)
+        leaderboards.adjust_rollups(changes)
+        teams.adjust_team_scores(changes)
+
+        # Stop showing the old totals on the profiles of the players.
+        profiles.bump_players(points)
@@ -5,11 +5,26 @@ Adds models to admin dashboard.
 
 from django.contrib import admin
 
-from .models import Player, Event, Participation, TreasureChest
+from .models import Player, Event, Participation, TreasureChest, \
+    ChestClaim, EventChest, PlayerStats, DailyScore, WeeklyScore, \
+    HeatmapCell, Task, ArchivedEvent, ArchivedParticipation, Team, \
+    EventTeam, ChestCluster
 
 
-# Add Player, Event and Participation models to the admin dashboard.
+# Add every game model to the admin dashboard.
 admin.site.register(Player)
 admin.site.register(Event)
 admin.site.register(Participation)
+admin.site.register(ArchivedEvent)
+admin.site.register(ArchivedParticipation)
+admin.site.register(Team)
+admin.site.register(EventTeam)
+admin.site.register(PlayerStats)
+admin.site.register(DailyScore)
+admin.site.register(WeeklyScore)
 admin.site.register(TreasureChest)
+admin.site.register(ChestClaim)
+admin.site.register(EventChest)
+admin.site.register(HeatmapCell)
+admin.site.register(ChestCluster)
+admin.site.register(Task)
@@ -0,0 +1,587 @@
+"""JSON API used in game app.
+
+Version 1 of the JSON API, used by the mobile app and map client to get the
+same resources as the pages without the HTML. Every endpoint is under
+/api/v1/ and needs a logged in session. POST requests need the CSRF token
+in the X-CSRFToken header, the same as the pages.
+
+Lists are paged with cursors (see pagination.py). A page gives "results"
+and "next", the cursor of the next page to pass back as ?cursor=, or null
+on the last page. ?limit= sets the number of results on a page.
+
+?fields= takes a comma separated list of the fields to include, and only
+the columns those fields need are read from the database.
+
+Errors are given as {"error": message} with a 4xx status.
+"""
+
+import functools
+import json
+
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from . import clusters, heatmap, leaderboards, nearby, presence
+from .batch import apply_batch
+from .caches import get_leaderboard, get_live_events
+from .chests import chest_payload
+from .models import Event, HeatmapCell, Participation, TreasureChest
+from .pagination import paginate, parse_limit
+from .ratelimit import ratelimit
+from .routers import use_replica
+from .scoring import parse_pings
+from .submissions import submit_game
+
+
+# Fields of each resource, name to (columns needed, function giving the
+# value from a row).
+EVENT_FIELDS = {
+    "id": (["id"], lambda event: event.id),
+    "title": (["title"], lambda event: event.title),
+    "description": (["description"], lambda event: event.description),
+    "start": (["start"], lambda event: event.start),
+    "end": (["end"], lambda event: event.end),
+    "latitude": (["latitude"], lambda event: float(event.latitude)),
+    "longitude": (["longitude"], lambda event: float(event.longitude)),
+    "game_bound": (["game_bound"], lambda event: event.game_bound),
+    "status": (["start", "end"], lambda event: event.get_status()),
+}
+
+CHEST_FIELDS = {
+    "id": (["id"], lambda chest: chest.id),
+    "name": (["name"], lambda chest: chest.name),
+    "points": (["points"], lambda chest: chest.points),
+    "latitude": (["latitude"], lambda chest: float(chest.latitude)),
+    "longitude": (["longitude"], lambda chest: float(chest.longitude)),
+}
+
+# Event scores are read with .values(), so rows are dictionaries.
+SCORE_FIELDS = {
+    "id": (["id"], lambda row: row["id"]),
+    "username": (["player__user__username"],
+        lambda row: row["player__user__username"]),
+    "score": (["score"], lambda row: row["score"]),
+    "created": (["created"], lambda row: row["created"]),
+}
+
+PROFILE_FIELDS = {
+    "username": lambda user, stats: user.username,
+    "points": lambda user, stats: user.player.points,
+    "is_game_master": lambda user, stats: user.player.is_game_master,
+    "games_played": lambda user, stats: stats.games_played if stats else 0,
+    "total_score": lambda user, stats: stats.total_score if stats else 0,
+    "best_score": lambda user, stats: stats.best_score if stats else None,
+    "average_score": lambda user, stats:
+        stats.get_average_score() if stats else None,
+    "events_won": lambda user, stats: stats.events_won if stats else 0,
+    "last_played": lambda user, stats: stats.last_played if stats else None,
+}
+
+
+def error(message, status=400):
+    """Return a JSON error response.
+
+    Arguments:
+    message (str) - description of the error.
+    status (int) - HTTP status code.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    return JsonResponse({"error": message}, status=status)
+
+
+def api_view(methods=("GET",)):
+    """Decorator for an API view.
+
+    Gives JSON errors for clients which are not logged in, methods which
+    are not allowed, bad requests, missing objects and denied permissions.
+
+    Arguments:
+    methods (tuple) - HTTP methods the view accepts.
+
+    Returns:
+    decorator - function wrapping the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return error("Authentication required.", 401)
+
+            if request.method not in methods:
+                response = error("Method not allowed.", 405)
+                response["Allow"] = ", ".join(methods)
+                return response
+
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest as exception:
+                return error(str(exception))
+            except PermissionDenied:
+                return error("Permission denied.", 403)
+            except Http404:
+                return error("Not found.", 404)
+
+        return wrapped_view
+
+    return decorator
+
+
+def get_fields(request, available):
+    """Return the fields asked for with the "fields" parameter.
+
+    Arguments:
+    request - Django object containing request information.
+    available (dict) - fields of the resource.
+
+    Returns:
+    fields (list) - names of the fields, every field if none were asked for.
+    """
+    if not request.GET.get("fields"):
+        return list(available)
+
+    fields = request.GET["fields"].split(",")
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise BadRequest("Unknown fields: " + ", ".join(unknown) + ".")
+
+    return fields
+
+
+def get_columns(fields, available, ordering=()):
+    """Return the columns needed for some fields.
+
+    Arguments:
+    fields (list) - names of the fields.
+    available (dict) - fields of the resource.
+    ordering (list) - fields the rows are ordered by, which are needed for
+    the cursor.
+
+    Returns:
+    columns (list) - names of the columns.
+    """
+    columns = {field.lstrip("-") for field in ordering}
+    for field in fields:
+        columns.update(available[field][0])
+
+    return sorted(columns)
+
+
+def serialize(row, fields, available):
+    """Return the chosen fields of a row.
+
+    Arguments:
+    row - model instance or dictionary.
+    fields (list) - names of the fields.
+    available (dict) - fields of the resource.
+
+    Returns:
+    data (dict) - field name to value.
+    """
+    return {field: available[field][1](row) for field in fields}
+
+
+def page_response(request, queryset, ordering, fields, available):
+    """Return a page of a list as a JSON response.
+
+    Arguments:
+    request - Django object containing request information.
+    queryset (QuerySet) - rows of the list, only reading the needed columns.
+    ordering (list) - fields to order by, ending with a unique field.
+    fields (list) - names of the fields to include.
+    available (dict) - fields of the resource.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    try:
+        limit = parse_limit(request.GET.get("limit"))
+        rows, next_cursor = paginate(queryset, ordering,
+                request.GET.get("cursor"), limit)
+    except ValueError as exception:
+        raise BadRequest(str(exception))
+
+    return JsonResponse({
+        "results": [serialize(row, fields, available) for row in rows],
+        "next": next_cursor,
+    })
+
+
+def filter_status(queryset, status):
+    """Filter events by status.
+
+    Arguments:
+    queryset (QuerySet) - Events to filter.
+    status (str) - "live", "past" or "future".
+
+    Returns:
+    queryset (QuerySet) - Events with the status.
+    """
+    now = timezone.now()
+    if status == "live":
+        return queryset.filter(start__lte=now, end__gte=now)
+    if status == "past":
+        return queryset.filter(end__lt=now)
+    if status == "future":
+        return queryset.filter(start__gt=now)
+
+    raise BadRequest("Status must be live, past or future.")
+
+
+@use_replica
+@api_view()
+def event_list(request):
+    """Events list endpoint.
+
+    Events are ordered by when they end, as on the events page. The
+    "status" parameter gives only "live", "past" or "future" events.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    fields = get_fields(request, EVENT_FIELDS)
+    ordering = ["end", "id"]
+
+    queryset = Event.objects.only(*get_columns(fields, EVENT_FIELDS,
+        ordering))
+    if request.GET.get("status"):
+        queryset = filter_status(queryset, request.GET["status"])
+
+    return page_response(request, queryset, ordering, fields, EVENT_FIELDS)
+
+
+@use_replica
+@api_view()
+def nearby_events(request):
+    """Nearby live events endpoint.
+
+    Takes the "latitude" and "longitude" of the player, and optionally the
+    "radius" in metres to look within. Gives the closest live events with
+    their "distance" in metres, closest first.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    fields = get_fields(request, EVENT_FIELDS)
+    try:
+        latitude, longitude, radius = nearby.parse_location(request.GET)
+        limit = parse_limit(request.GET.get("limit"), nearby.DEFAULT_LIMIT)
+    except ValueError as exception:
+        raise BadRequest(str(exception))
+
+    return JsonResponse({"results": [dict(serialize(event, fields,
+        EVENT_FIELDS), distance=distance) for event, distance
+        in nearby.live_events_near(latitude, longitude, radius, limit)]})
+
+
+@api_view()
+def event_presence(request):
+    """Live presence endpoint.
+
+    Gives the number of players active right now in every live event, in
+    one call (see presence.py).
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    event_ids = [event.id for event in get_live_events()]
+    counts = presence.get_counts(event_ids)
+    return JsonResponse({"results": [{"id": event_id,
+        "active": counts[event_id]} for event_id in event_ids]})
+
+
+@use_replica
+@api_view()
+def event_details(request, event_id):
+    """Event details endpoint.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    fields = get_fields(request, EVENT_FIELDS)
+    event = get_object_or_404(Event.objects.only(*get_columns(fields,
+        EVENT_FIELDS)), pk=event_id)
+
+    return JsonResponse(serialize(event, fields, EVENT_FIELDS))
+
+
+@api_view()
+def event_chests(request, event_id):
+    """Event treasure chests endpoint.
+
+    Gives the compact treasure chest payload of an event, the same as the
+    game page uses (see chests.chest_payload), including the "since"
+    parameter for only getting changes. Only game masters can see the
+    treasure chests of events which are not live.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    event = get_object_or_404(Event.objects.only("start", "end",
+        "chest_version"), pk=event_id)
+    if (not event.get_status() == "Live"
+            and not request.user.player.is_game_master):
+        raise PermissionDenied
+
+    try:
+        since = int(request.GET["since"])
+    except KeyError:
+        since = None
+    except ValueError:
+        raise BadRequest("Since must be a chest version.")
+
+    return JsonResponse(chest_payload(event, since))
+
+
+@use_replica
+@api_view()
+def event_leaderboard(request, event_id):
+    """Event leaderboard endpoint.
+
+    Every game played in an event, highest score first.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    fields = get_fields(request, SCORE_FIELDS)
+    ordering = ["-score", "id"]
+
+    # Check the event exists.
+    if not Event.objects.filter(pk=event_id).exists():
+        raise Http404
+
+    # Read the columns with .values(), which joins the players and users
+    # only when the usernames are needed.
+    queryset = Participation.objects.filter(event_id=event_id).values(
+            *get_columns(fields, SCORE_FIELDS, ordering))
+
+    return page_response(request, queryset, ordering, fields, SCORE_FIELDS)
+
+
+@api_view()
+def treasure_chest_list(request):
+    """Treasure chests list endpoint.
+
+    Only game masters can see every treasure chest.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    if not request.user.player.is_game_master:
+        raise PermissionDenied
+
+    fields = get_fields(request, CHEST_FIELDS)
+    ordering = ["id"]
+
+    queryset = TreasureChest.objects.only(*get_columns(fields, CHEST_FIELDS,
+        ordering))
+
+    return page_response(request, queryset, ordering, fields, CHEST_FIELDS)
+
+
+@use_replica
+@api_view()
+def treasure_chest_clusters(request, zoom, x, y):
+    """Treasure chest clusters endpoint for game masters.
+
+    Gives the treasure chests in a web map tile as a compact list of
+    [latitude, longitude, count, points] clusters, a bounded number for any
+    tile (see clusters.py).
+
+    Arguments:
+    request - Django object containing request information.
+    zoom (int) - zoom level of the tile.
+    x (int) - column of the tile, from the west.
+    y (int) - row of the tile, from the north.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    if not request.user.player.is_game_master:
+        raise PermissionDenied
+
+    try:
+        tile = clusters.get_tile(zoom, x, y)
+    except ValueError as exception:
+        raise BadRequest(str(exception))
+
+    return JsonResponse({"zoom": zoom, "x": x, "y": y, "clusters": tile})
+
+
+@use_replica
+@api_view()
+def leaderboard(request):
+    """Leaderboard endpoint.
+
+    The top players, from the same cache as the leaderboard page. The
+    "window" parameter can be "day" or "week" to rank players by their
+    points today or this week.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    window = request.GET.get("window", "all")
+    if window != "all" and window not in leaderboards.WINDOWS:
+        raise BadRequest("Window must be day, week or all.")
+
+    return JsonResponse({"window": window, "results": [
+        {"rank": rank, "username": player.user.username, "points": points}
+        for rank, (player, points) in enumerate(get_leaderboard(window), 1)]})
+
+
+@use_replica
+@api_view()
+def heatmap_cells(request):
+    """Play activity heatmap endpoint for game masters.
+
+    Gives the cells of a map view as a compact list of [latitude,
+    longitude, count] for a map overlay. Takes the "bbox" of the view as
+    "min_lat,min_lng,max_lat,max_lng", the "kind" of activity ("ping" or
+    "claim") and the "precision" of the cells (see heatmap.PRECISIONS).
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    if not request.user.player.is_game_master:
+        raise PermissionDenied
+
+    kind = request.GET.get("kind", HeatmapCell.PING)
+    if kind not in (HeatmapCell.PING, HeatmapCell.CLAIM):
+        raise BadRequest("Kind must be ping or claim.")
+
+    try:
+        precision = int(request.GET.get("precision", 6))
+        bounds = [float(value) for value in request.GET["bbox"].split(",")]
+    except (KeyError, ValueError):
+        raise BadRequest("Bbox must be min_lat,min_lng,max_lat,max_lng.")
+    if precision not in heatmap.PRECISIONS or len(bounds) != 4:
+        raise BadRequest("Precision must be one of {} and bbox must have "
+                "4 values.".format(", ".join(map(str, heatmap.PRECISIONS))))
+
+    return JsonResponse({"kind": kind, "precision": precision,
+        "cells": heatmap.get_cells(kind, precision, bounds)})
+
+
+@use_replica
+@api_view()
+def user_details(request, username):
+    """User profile endpoint.
+
+    The user, player and statistics are read in one query.
+
+    Arguments:
+    request - Django object containing request information.
+    username (str) - username of the user.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    fields = get_fields(request, PROFILE_FIELDS)
+    show_user = get_object_or_404(User.objects.select_related(
+        "player__stats"), username=username, player__isnull=False)
+
+    stats = getattr(show_user.player, "stats", None)
+    return JsonResponse({field: PROFILE_FIELDS[field](show_user, stats)
+        for field in fields})
+
+
+@api_view(methods=("POST",))
+def batch(request, batch_type):
+    """Batch changes endpoint for game masters.
+
+    Takes a JSON object of events or treasure chests to create, update and
+    delete (see batch.apply_batch). The batch is applied in one transaction
+    only if every item is valid, otherwise nothing is changed and the
+    response has a 400 status. Either way it gives the result of each item.
+
+    Arguments:
+    request - Django object containing request information.
+    batch_type (str) - "events" or "treasure_chests".
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    if not request.user.player.is_game_master:
+        raise PermissionDenied
+
+    try:
+        results, applied = apply_batch(batch_type, json.loads(request.body))
+    except ValueError as exception:
+        raise BadRequest(str(exception))
+
+    return JsonResponse({"applied": applied, "results": results},
+            status=200 if applied else 400)
+
+
+@api_view(methods=("POST",))
+@ratelimit("game")
+def submit_score(request, event_id):
+    """Game submission endpoint.
+
+    Takes a JSON object with the "score" and the "pings", a list of
+    [latitude, longitude] of each button press, which the score is worked
+    out from instead (see submissions.submit_game). Games without pings, or
+    for an event which is not live, get a 400 response. A game sent again
+    with the same Idempotency-Key header gives the same response without
+    saving it twice.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event the game was played in.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    event = get_object_or_404(Event, pk=event_id)
+
+    # Read the game.
+    try:
+        data = json.loads(request.body)
+        score = int(data["score"])
+    except (KeyError, TypeError, ValueError):
+        raise BadRequest("Body must be a JSON object with a whole number "
+                "score.")
+    pings = parse_pings(json.dumps(data.get("pings") or []))
+    key = request.headers.get("Idempotency-Key") or None
+
+    try:
+        participation, claimed = submit_game(request.user, event, score,
+                pings, key)
+    except ValueError as exception:
+        raise BadRequest(str(exception))
+    return JsonResponse({"id": participation.id, "score": participation.score,
+        "claimed": claimed}, status=201)
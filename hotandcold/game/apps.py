@@ -6,3 +6,7 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        """Connect the signal receivers once the app is loaded."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,167 @@
+"""Event archival used in game app.
+
+Used for moving Events which finished long ago, together with their
+Participations, out of the tables read by the pages, leaderboards and games
+into archive tables (see the archive_events command). Keeping those tables
+small keeps their indexes small and their queries fast.
+
+Archiving does not change the statistics, rollups or points of any player,
+which were counted when the games were played. The rebuild commands read
+the archive tables as well, so rebuilding gives the same results.
+
+Events are deleted normally, so their delete signals are sent, after their
+Participations are deleted in chunks, which keeps the rows Django reads to
+delete them (and free the treasure chests claimed in them) to a chunk at a
+time.
+
+Deleted games no longer count: deleting an Event which was not archived
+takes its games away from the points, statistics, rollups and team scores
+they were counted in (see adjustments.py), and its win away from the
+player who won it, so they agree with the games left (and the
+reconcile_points command). Archived games still count, so archiving an
+Event leaves them all as they were.
+"""
+
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import profiles
+from .adjustments import GameChange, adjust_games
+from .models import ArchivedEvent, ArchivedParticipation, Event, \
+    Participation, PlayerStats
+
+
+# Number of days after an Event ends that it is archived when none is given.
+DEFAULT_RETENTION_DAYS = 180
+
+# Columns copied into the archive tables.
+EVENT_COLUMNS = ["id", "title", "description", "start", "end", "latitude",
+        "longitude", "game_bound"]
+PARTICIPATION_COLUMNS = ["id", "player_id", "event_id", "score", "pings",
+        "created", "team_id"]
+
+
+def delete_events(event_ids, archived=False, chunk_size=500):
+    """Delete Events and every row which belongs to them.
+
+    Arguments:
+    event_ids (list) - IDs of the Events to delete.
+    archived (bool) - True if the Events have been copied to the archive,
+    so their games and wins still count.
+    chunk_size (int) - number of Participations to delete at a time.
+
+    Returns:
+    count (int) - number of Events deleted.
+    """
+    with transaction.atomic():
+        events = Event.objects.filter(pk__in=event_ids)
+        if not archived:
+            take_wins(events)
+
+        # Delete the games a chunk at a time. The treasure chests claimed,
+        # which belong to the player, are kept without the game they were
+        # claimed in.
+        participations = Participation.objects.filter(event_id__in=event_ids)
+        while True:
+            chunk = list(participations.values_list("id", "player_id",
+                "team_id", "created", "score")[:chunk_size])
+            if not chunk:
+                break
+            Participation.objects.filter(pk__in=[row[0]
+                for row in chunk]).delete()
+
+            # Take the deleted games away from every total.
+            if not archived:
+                adjust_games([GameChange(row[1], row[2], row[3], -row[4], -1)
+                    for row in chunk])
+
+        # The treasure chests in play and teams are deleted with them.
+        _, counts = events.delete()
+
+    return counts.get(Event._meta.label, 0)
+
+
+def take_wins(events):
+    """Take Events away from the wins of the players who won them.
+
+    Arguments:
+    events (QuerySet) - Events about to be deleted.
+
+    Returns:
+    None.
+    """
+    winners = (events.filter(winner__isnull=False).values("winner")
+            .annotate(won=Count("id")).order_by())
+    for row in winners:
+        PlayerStats.objects.filter(pk=row["winner"]).update(
+                events_won=F("events_won") - row["won"])
+
+    # Stop showing the cached profiles of the winners.
+    profiles.bump_players(row["winner"] for row in winners)
+
+
+def archive_chunk(before, chunk_size):
+    """Archive the first Events which ended before a time.
+
+    The Events are locked while they are copied, so no game can be added to
+    them before they are deleted.
+
+    Arguments:
+    before (datetime) - Events which ended before this are archived.
+    chunk_size (int) - largest number of Events to archive.
+
+    Returns:
+    events (int) - number of Events archived.
+    participations (int) - number of Participations archived.
+    """
+    with transaction.atomic():
+        events = list(Event.objects.select_for_update()
+                .filter(end__lt=before).order_by("end", "id")
+                .values(*EVENT_COLUMNS)[:chunk_size])
+        if not events:
+            return 0, 0
+
+        # Copy the Events and their Participations.
+        event_ids = [row["id"] for row in events]
+        ArchivedEvent.objects.bulk_create([ArchivedEvent(**row)
+            for row in events])
+
+        rows = (Participation.objects.filter(event_id__in=event_ids)
+                .values(*PARTICIPATION_COLUMNS))
+        participations = [ArchivedParticipation(**row)
+                for row in rows.iterator(chunk_size=chunk_size)]
+        ArchivedParticipation.objects.bulk_create(participations,
+                batch_size=chunk_size)
+
+        delete_events(event_ids, archived=True, chunk_size=chunk_size)
+
+    return len(events), len(participations)
+
+
+def archive_events(days=DEFAULT_RETENTION_DAYS, chunk_size=500):
+    """Archive every Event which ended more than a number of days ago.
+
+    Each chunk is archived in its own transaction, so rows are only locked
+    for a short time and a stopped run can carry on where it left off.
+
+    Arguments:
+    days (int) - number of days after an Event ends that it is archived.
+    chunk_size (int) - number of Events to archive at a time.
+
+    Returns:
+    events (int) - number of Events archived.
+    participations (int) - number of Participations archived.
+    """
+    before = timezone.now() - datetime.timedelta(days=days)
+
+    total_events = total_participations = 0
+    while True:
+        events, participations = archive_chunk(before, chunk_size)
+        if not events:
+            return total_events, total_participations
+
+        total_events += events
+        total_participations += participations
@@ -0,0 +1,235 @@
+"""Batch changes used in game app.
+
+Used for creating, updating and deleting many events or treasure chests in
+one request, such as laying out a whole chest hunt. Every item is validated
+with the same form as the pages, and the batch is only applied if all of
+them are valid, in one transaction.
+
+A batch is a dictionary with any of:
+"create" - list of objects with the form fields.
+"update" - list of objects with an "id" and the form fields to change.
+"delete" - list of IDs.
+
+The result has a list for each operation, with an entry for each item in
+the same order. Each entry has the "id" of the object and a "status" of
+"ok", "invalid" (with "errors" by field) or "not found".
+
+Bulk queries skip the post_save signals, so the treasure chests in play,
+the treasure chest clusters and the search index are updated for the saved
+objects afterwards.
+"""
+
+import copy
+import functools
+
+from django.db import connection, transaction
+
+from .archive import delete_events
+from .caches import clear_live_events
+from .chests import update_chest_events, update_event_chests
+from .clusters import update_clusters
+from .forms import EventCreationForm, TreasureChestCreationForm
+from .models import Event, TreasureChest
+from .search import event_changed
+
+
+# Largest number of items allowed in a batch.
+MAX_BATCH_SIZE = 500
+
+# Model, form and function updating the treasure chests in play for each
+# kind of object.
+BATCH_TYPES = {
+    "events": (Event, EventCreationForm, update_event_chests),
+    "treasure_chests": (TreasureChest, TreasureChestCreationForm,
+        update_chest_events),
+}
+
+
+def parse_batch(data):
+    """Check the shape of a batch and return its operations.
+
+    Arguments:
+    data - batch decoded from JSON.
+
+    Returns:
+    creates (list) - objects to create.
+    updates (list) - objects to update.
+    deletes (list) - IDs to delete.
+
+    Raises:
+    ValueError - if the batch is malformed or too big.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Batch must be a JSON object.")
+
+    creates = data.get("create", [])
+    updates = data.get("update", [])
+    deletes = data.get("delete", [])
+    if not all(isinstance(items, list) for items in (creates, updates,
+            deletes)):
+        raise ValueError("Create, update and delete must be lists.")
+
+    if not all(isinstance(item, dict) for item in creates + updates):
+        raise ValueError("Created and updated items must be objects.")
+    # JSON true and false are ints in Python, but not IDs.
+    if not all(type(item.get("id")) is int for item in updates) \
+            or not all(type(item) is int for item in deletes):
+        raise ValueError("IDs must be whole numbers.")
+
+    if len(creates) + len(updates) + len(deletes) > MAX_BATCH_SIZE:
+        raise ValueError("Batches can have at most {} items.".format(
+            MAX_BATCH_SIZE))
+
+    return creates, updates, deletes
+
+
+def chest_row(chest):
+    """Return what the clusters of a treasure chest depend on.
+
+    Arguments:
+    chest (TreasureChest) - the TreasureChest.
+
+    Returns:
+    row (tuple) - latitude, longitude and points of the TreasureChest.
+    """
+    return chest.latitude, chest.longitude, chest.points
+
+
+def get_errors(form):
+    """Return the error messages of an invalid form.
+
+    Arguments:
+    form - Django form which failed validation.
+
+    Returns:
+    errors (dict) - field name to list of messages.
+    """
+    return {field: [error["message"] for error in errors]
+            for field, errors in form.errors.get_json_data().items()}
+
+
+def apply_batch(batch_type, data):
+    """Validate a batch and apply it if every item is valid.
+
+    Objects being updated are locked while the batch is validated, so they
+    cannot change before it is applied.
+
+    Arguments:
+    batch_type (str) - "events" or "treasure_chests".
+    data - batch decoded from JSON.
+
+    Returns:
+    results (dict) - result of each item for each operation.
+    applied (bool) - True if the batch was valid and applied.
+
+    Raises:
+    ValueError - if the batch is malformed or too big.
+    """
+    model, form_class, update_memberships = BATCH_TYPES[batch_type]
+    creates, updates, deletes = parse_batch(data)
+    fields = list(form_class.base_fields)
+
+    results = {"create": [], "update": [], "delete": []}
+    valid = True
+
+    with transaction.atomic():
+        # Validate the new objects.
+        new_objects = []
+        for item in creates:
+            form = form_class(item)
+            if form.is_valid():
+                new_objects.append(model(**form.cleaned_data))
+                results["create"].append({"id": None, "status": "ok"})
+            else:
+                valid = False
+                results["create"].append({"id": None, "status": "invalid",
+                    "errors": get_errors(form)})
+
+        # Validate the changes, keeping the fields which are not given.
+        existing = model.objects.select_for_update().in_bulk(
+                [item["id"] for item in updates] + deletes)
+        originals = {pk: copy.copy(instance)
+                for pk, instance in existing.items()}
+        deleted_ids = set(deletes)
+        changed_objects = []
+        for item in updates:
+            instance = existing.get(item["id"])
+            if instance is None:
+                valid = False
+                results["update"].append({"id": item["id"],
+                    "status": "not found"})
+                continue
+            if item["id"] in deleted_ids:
+                valid = False
+                results["update"].append({"id": item["id"],
+                    "status": "invalid",
+                    "errors": {"id": ["Updated and deleted in one batch."]}})
+                continue
+
+            form = form_class(dict({field: getattr(instance, field)
+                for field in fields}, **item))
+            if form.is_valid():
+                for field, value in form.cleaned_data.items():
+                    setattr(instance, field, value)
+                changed_objects.append(instance)
+                results["update"].append({"id": item["id"], "status": "ok"})
+            else:
+                valid = False
+                results["update"].append({"id": item["id"],
+                    "status": "invalid", "errors": get_errors(form)})
+
+        # Check the objects being deleted exist.
+        for object_id in deletes:
+            if object_id in existing:
+                results["delete"].append({"id": object_id, "status": "ok"})
+            else:
+                valid = False
+                results["delete"].append({"id": object_id,
+                    "status": "not found"})
+
+        if not valid:
+            return results, False
+
+        # Delete first, so the new and changed objects are not matched
+        # with objects which are going away. Events are deleted with their
+        # games in chunks, treasure chests through their pre_delete signal.
+        if model is Event:
+            delete_events(deletes)
+        else:
+            model.objects.filter(pk__in=deletes).delete()
+
+        # Save the changes.
+        model.objects.bulk_update(changed_objects, fields)
+        for instance in changed_objects:
+            update_memberships(instance)
+
+        # Create the new objects. MySQL cannot give back the IDs of bulk
+        # inserted rows, so there they are saved one at a time, which runs
+        # the post_save signals instead.
+        if connection.features.can_return_rows_from_bulk_insert:
+            model.objects.bulk_create(new_objects)
+            for instance in new_objects:
+                update_memberships(instance)
+            bulk_created = new_objects
+        else:
+            for instance in new_objects:
+                instance.save()
+            bulk_created = []
+
+        # Move the changed and bulk created treasure chests between
+        # clusters.
+        if model is TreasureChest:
+            update_clusters(removed=[chest_row(originals[instance.pk])
+                for instance in changed_objects],
+                added=[chest_row(instance)
+                    for instance in changed_objects + bulk_created])
+        for result, instance in zip(results["create"], new_objects):
+            result["id"] = instance.id
+
+    if model is Event:
+        clear_live_events()
+        for instance in changed_objects + new_objects:
+            transaction.on_commit(functools.partial(event_changed,
+                instance.id, instance.title, instance.description))
+
+    return results, True
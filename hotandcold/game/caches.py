@@ -0,0 +1,234 @@
+"""Cached queries used in game app.
+
+Used for the busiest read-only pages, the live games list and the
+leaderboards, which are kept in the configured cache for a short time. The
+warmup handler fills them before a new instance takes traffic.
+
+The live events are cached as every event which is live or starts before
+the cache expires, and filtered by the current time when read, so events
+still go live on time. They are cleared whenever an Event is saved or
+deleted. Leaderboards are allowed to be up to LEADERBOARD_TIMEOUT seconds
+out of date.
+
+Values are computed by only one worker at a time (see get_or_compute), so
+when a value expires under heavy load, such as everyone opening the
+leaderboard as an event ends, the query is run once rather than by every
+request.
+"""
+
+import datetime
+import functools
+import math
+import random
+import secrets
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import leaderboards
+from .models import Event
+
+
+# Seconds to cache the live events for.
+LIVE_EVENTS_TIMEOUT = 60
+LIVE_EVENTS_KEY = "live_events"
+
+# Seconds to cache each leaderboard for.
+LEADERBOARD_TIMEOUT = 30
+
+# Seconds an expired value is still given while one worker refreshes it.
+STALE_TIMEOUT = 30
+
+# Seconds a worker can hold the lock for refreshing a value.
+LOCK_TIMEOUT = 10
+
+# Seconds to wait between checks for a value another worker is computing.
+WAIT_INTERVAL = 0.05
+
+# How early values are refreshed, larger is earlier.
+EARLY_EXPIRY_BETA = 1.0
+
+
+def refresh(key, compute, timeout):
+    """Compute a value and cache it.
+
+    The value is kept for STALE_TIMEOUT seconds after it expires, with the
+    time it expires and the time it took to compute.
+
+    Arguments:
+    key (str) - cache key.
+    compute (function) - function with no arguments giving the value.
+    timeout (int) - seconds until the value expires.
+
+    Returns:
+    value - the computed value.
+    """
+    start = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - start
+
+    cache.set(key, (value, time.time() + timeout, delta),
+            timeout + STALE_TIMEOUT)
+    return value
+
+
+def is_fresh(entry):
+    """Return whether a cached value can be given without refreshing it.
+
+    Values are refreshed early at random, more often the closer they are to
+    expiring and the longer they take to compute, so one request usually
+    refreshes a value before it expires for everyone.
+
+    Arguments:
+    entry (tuple) - value, time it expires and time it took to compute.
+
+    Returns:
+    fresh (bool) - True if the value does not need refreshing.
+    """
+    _, expires, delta = entry
+    early = -delta * EARLY_EXPIRY_BETA * math.log(1 - random.random())
+    return time.time() + early < expires
+
+
+def get_or_compute(key, compute, timeout):
+    """Return a value from the cache, computing it if needed.
+
+    Only the worker holding a lock in the cache computes the value. Others
+    are given the expired value meanwhile, or wait for the new one if there
+    is none. The lock holds a token unique to the worker, so a worker which
+    took longer than LOCK_TIMEOUT does not release a lock another worker
+    has taken since.
+
+    Arguments:
+    key (str) - cache key.
+    compute (function) - function with no arguments giving the value.
+    timeout (int) - seconds to cache the value for.
+
+    Returns:
+    value - the cached or computed value.
+    """
+    entry = cache.get(key)
+    if entry is not None and is_fresh(entry):
+        return entry[0]
+
+    lock_key = key + ":lock"
+    token = secrets.token_hex(8)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        # Another worker is computing the value. Give the expired value, or
+        # wait for the new one.
+        if entry is None:
+            # Compute it anyway if the other worker seems to have died.
+            if time.monotonic() > deadline:
+                return refresh(key, compute, timeout)
+
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+
+        if entry is not None:
+            return entry[0]
+
+    expires = time.monotonic() + LOCK_TIMEOUT
+    try:
+        # Another worker may have refreshed it just before the lock was
+        # taken.
+        latest = cache.get(key)
+        if latest is not None and (entry is None or latest[1] != entry[1]):
+            return latest[0]
+
+        return refresh(key, compute, timeout)
+    finally:
+        # Only release the lock if it is still ours.
+        if time.monotonic() < expires and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def query_live_events():
+    """Return the events which are live or go live before the cache expires.
+
+    Returns:
+    events (list) - Events, ending soonest first.
+    """
+    now = timezone.now()
+    soon = now + datetime.timedelta(
+            seconds=LIVE_EVENTS_TIMEOUT + STALE_TIMEOUT)
+    return list(Event.objects.filter(start__lte=soon, end__gte=now)
+            .order_by("end"))
+
+
+def fill_live_events():
+    """Cache the events which are live or go live before the cache expires.
+
+    Returns:
+    events (list) - the cached Events.
+    """
+    return refresh(LIVE_EVENTS_KEY, query_live_events, LIVE_EVENTS_TIMEOUT)
+
+
+def get_live_events():
+    """Return the events which are live now.
+
+    Returns:
+    events (list) - live Events, ending soonest first.
+    """
+    events = get_or_compute(LIVE_EVENTS_KEY, query_live_events,
+            LIVE_EVENTS_TIMEOUT)
+
+    now = timezone.now()
+    return [event for event in events if event.start <= now <= event.end]
+
+
+def clear_live_events():
+    """Remove the live events from the cache.
+
+    Returns:
+    None.
+    """
+    cache.delete(LIVE_EVENTS_KEY)
+
+
+def leaderboard_key(window):
+    """Return the cache key of a leaderboard.
+
+    Keys include the start of the window, so a new day or week does not
+    show the last one.
+
+    Arguments:
+    window (str) - "day", "week" or "all".
+
+    Returns:
+    key (str) - cache key.
+    """
+    if window in leaderboards.WINDOWS:
+        return "leaderboard:{}:{}".format(window,
+                leaderboards.window_start(window).isoformat())
+    return "leaderboard:all"
+
+
+def fill_leaderboard(window):
+    """Cache the top players of a window.
+
+    Arguments:
+    window (str) - "day", "week" or "all".
+
+    Returns:
+    top (list) - (player, points) of each player, highest points first.
+    """
+    return refresh(leaderboard_key(window),
+            functools.partial(leaderboards.top_players, window),
+            LEADERBOARD_TIMEOUT)
+
+
+def get_leaderboard(window):
+    """Return the top players of a window from the cache.
+
+    Arguments:
+    window (str) - "day", "week" or "all".
+
+    Returns:
+    top (list) - (player, points) of each player, highest points first.
+    """
+    return get_or_compute(leaderboard_key(window),
+            functools.partial(leaderboards.top_players, window),
+            LEADERBOARD_TIMEOUT)
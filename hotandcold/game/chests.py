@@ -0,0 +1,315 @@
+"""Treasure chest helpers used in game app.
+
+Used for finding treasure chests near a location, keeping track of which
+treasure chests are in play for each event and recording which treasure
+chests each player has claimed.
+"""
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Subquery
+
+from .geo import bounding_box, calc_distance
+from .models import ChestClaim, Event, EventChest, Player, TreasureChest
+
+
+def within_radius(queryset, latitude, longitude, radius):
+    """Find rows of a queryset within a radius of a location.
+
+    The queryset is pre-filtered to a bounding box, which can use the
+    latitude/longitude index, before exact distances are worked out.
+
+    Arguments:
+    queryset - values_list queryset starting with latitude and longitude.
+    latitude (float) - latitude of the location.
+    longitude (float) - longitude of the location.
+    radius (int) - maximum distance from the location in metres.
+
+    Returns:
+    rows (list) - each row within the radius with its distance appended.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude,
+            radius)
+    candidates = queryset.filter(latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng))
+
+    rows = []
+    for row in candidates:
+        distance = calc_distance(latitude, longitude, row[0], row[1])
+        if distance <= radius:
+            rows.append(row + (distance,))
+
+    return rows
+
+
+def unclaimed_chests_near(player, latitude, longitude, radius):
+    """Find treasure chests near a location a player has not claimed.
+
+    Claimed treasure chests are left out in the same query using the claim
+    uniqueness index.
+
+    Arguments:
+    player (Player) - Player looking for treasure chests.
+    latitude (float) - latitude of the location.
+    longitude (float) - longitude of the location.
+    radius (int) - maximum distance from the location in metres.
+
+    Returns:
+    chests (list) - (id, latitude, longitude, points, distance) of each
+    treasure chest within the radius, closest first.
+    """
+    claimed = ChestClaim.objects.filter(player=player,
+            treasure_chest=OuterRef("pk"))
+    candidates = (TreasureChest.objects.filter(~Exists(claimed))
+            .values_list("latitude", "longitude", "id", "points"))
+
+    chests = [(chest_id, float(lat), float(lng), points, distance)
+            for lat, lng, chest_id, points, distance
+            in within_radius(candidates, latitude, longitude, radius)]
+
+    return sorted(chests, key=lambda chest: chest[4])
+
+
+def unclaimed_event_chests(player, event):
+    """Find treasure chests in play for an event a player has not claimed.
+
+    Uses the precomputed EventChest rows, so only treasure chests within the
+    playing area are read.
+
+    Arguments:
+    player (Player) - Player playing the event.
+    event (Event) - Event being played.
+
+    Returns:
+    chests (list) - (id, latitude, longitude, points, distance) of each
+    treasure chest, closest first.
+    """
+    claimed = ChestClaim.objects.filter(player=player,
+            treasure_chest=OuterRef("treasure_chest"))
+    rows = (EventChest.objects.filter(event=event).filter(~Exists(claimed))
+            .order_by("distance")
+            .values_list("treasure_chest_id", "treasure_chest__latitude",
+                "treasure_chest__longitude", "treasure_chest__points",
+                "distance"))
+
+    return [(chest_id, float(lat), float(lng), points, distance)
+            for chest_id, lat, lng, points, distance in rows]
+
+
+def update_event_chests(event):
+    """Work out which treasure chests are in play for an event.
+
+    Called whenever an Event is saved.
+
+    Arguments:
+    event (Event) - Event to update.
+
+    Returns:
+    None.
+    """
+    chests = TreasureChest.objects.values_list("latitude", "longitude", "id")
+    distances = {row[2]: row[3] for row in within_radius(chests,
+        event.latitude, event.longitude, event.game_bound)}
+
+    with transaction.atomic():
+        changed = save_memberships(EventChest.objects.filter(event=event),
+                "treasure_chest_id", distances,
+                lambda chest_id, distance: EventChest(event=event,
+                    treasure_chest_id=chest_id, distance=distance))
+
+        # Give the changed rows a new version.
+        if changed:
+            bump_chest_versions([event.id], EventChest.objects.filter(
+                event=event, treasure_chest_id__in=changed))
+
+
+def update_chest_events(treasure_chest):
+    """Work out which events a treasure chest is in play for.
+
+    Called whenever a TreasureChest is saved. Events are pre-filtered with
+    the largest playing area of any Event, then checked against their own.
+
+    Arguments:
+    treasure_chest (TreasureChest) - TreasureChest to update.
+
+    Returns:
+    None.
+    """
+    largest_bound = Event.objects.aggregate(Max("game_bound"))
+    largest_bound = largest_bound["game_bound__max"] or 0
+
+    events = Event.objects.values_list("latitude", "longitude", "id",
+            "game_bound")
+    distances = {row[2]: row[4] for row in within_radius(events,
+        treasure_chest.latitude, treasure_chest.longitude, largest_bound)
+        if row[4] <= row[3]}
+
+    with transaction.atomic():
+        changed = save_memberships(
+                EventChest.objects.filter(treasure_chest=treasure_chest),
+                "event_id", distances,
+                lambda event_id, distance: EventChest(event_id=event_id,
+                    treasure_chest=treasure_chest, distance=distance))
+
+        # The name or points may have changed too, so every Event the
+        # TreasureChest was or is in gets a new version.
+        bump_chest_versions(changed | set(distances),
+                EventChest.objects.filter(treasure_chest=treasure_chest))
+
+
+def bump_chest_versions(event_ids, rows):
+    """Increase the chest version of events and mark rows as changed in it.
+
+    Arguments:
+    event_ids (iterable) - IDs of Events whose treasure chests changed.
+    rows - queryset of EventChest rows which changed.
+
+    Returns:
+    None.
+    """
+    Event.objects.filter(pk__in=event_ids).update(
+            chest_version=F("chest_version") + 1)
+    rows.update(version=Subquery(Event.objects.filter(pk=OuterRef("event_id"))
+        .values("chest_version")[:1]))
+
+
+def chest_payload(event, since=None):
+    """Build the compact treasure chest payload for an event.
+
+    With no version, every treasure chest in play is included. Given the
+    version a client already has, only treasure chests changed since then
+    are included, along with the IDs of every treasure chest in play so the
+    client can drop removed ones.
+
+    Arguments:
+    event (Event) - Event to get treasure chests for.
+    since (int) - chest version the client already has.
+
+    Returns:
+    payload (dict) - version and [id, latitude, longitude, points] of each
+    treasure chest.
+    """
+    rows = EventChest.objects.filter(event=event)
+    payload = {"version": event.chest_version}
+
+    if since is not None:
+        payload["since"] = since
+        payload["ids"] = list(rows.order_by("treasure_chest_id")
+                .values_list("treasure_chest_id", flat=True))
+        rows = rows.filter(version__gt=since)
+
+    # Seven decimal places is around a centimetre.
+    payload["chests"] = [[chest_id, round(float(lat), 7), round(float(lng), 7),
+        points] for chest_id, lat, lng, points in rows
+        .order_by("treasure_chest_id")
+        .values_list("treasure_chest_id", "treasure_chest__latitude",
+            "treasure_chest__longitude", "treasure_chest__points")]
+
+    return payload
+
+
+def save_memberships(queryset, key, distances, create):
+    """Bring a set of EventChest rows in line with newly worked out ones.
+
+    Only the differences are written: rows which are no longer needed are
+    deleted, new ones are bulk created and changed distances bulk updated.
+
+    Arguments:
+    queryset - EventChest rows for one Event or TreasureChest.
+    key (str) - field identifying the other side of each row.
+    distances (dict) - distance for every ID of the other side in play.
+    create (function) - function creating a new EventChest from an ID and
+    distance.
+
+    Returns:
+    changed (set) - IDs of the other side whose rows were written.
+    """
+    with transaction.atomic():
+        existing = {row[key]: row for row in queryset.values("id", key,
+            "distance")}
+
+        # Remove rows no longer in play.
+        removed = {other_id for other_id in existing
+                if other_id not in distances}
+        if removed:
+            EventChest.objects.filter(pk__in=[existing[other_id]["id"]
+                for other_id in removed]).delete()
+
+        # Add new rows and update distances which changed.
+        added = [create(other_id, distance)
+                for other_id, distance in distances.items()
+                if other_id not in existing]
+        updated = [EventChest(id=existing[other_id]["id"], distance=distance)
+                for other_id, distance in distances.items()
+                if other_id in existing
+                and existing[other_id]["distance"] != distance]
+        EventChest.objects.bulk_create(added)
+        EventChest.objects.bulk_update(updated, ["distance"])
+
+    return (removed | {getattr(row, key) for row in added}
+            | {other_id for other_id in distances if other_id in existing
+                and existing[other_id]["distance"] != distances[other_id]})
+
+
+def claimed_event_chest_ids(player, event):
+    """Return the IDs of treasure chests in an event a player has claimed.
+
+    Arguments:
+    player (Player) - Player to get claims for.
+    event (Event) - Event to get treasure chests for.
+
+    Returns:
+    claimed (list) - IDs of claimed treasure chests.
+    """
+    return list(EventChest.objects
+            .filter(event=event, treasure_chest__claims__player=player)
+            .values_list("treasure_chest_id", flat=True))
+
+
+def claimed_chest_ids(player):
+    """Return the IDs of every treasure chest a player has claimed.
+
+    Arguments:
+    player (Player) - Player to get claims for.
+
+    Returns:
+    claimed (set) - IDs of claimed treasure chests.
+    """
+    return set(ChestClaim.objects.filter(player=player)
+            .values_list("treasure_chest_id", flat=True))
+
+
+def claim_chests(player, chest_ids, participation=None):
+    """Claim treasure chests for a player.
+
+    The Player row is locked while the claims are made so that concurrent
+    claims by the same Player are applied one after another. Treasure
+    chests which have already been claimed are skipped.
+
+    Arguments:
+    player (Player) - Player claiming the treasure chests.
+    chest_ids (iterable) - IDs of treasure chests to claim.
+    participation (Participation) - Participation the claims were made in.
+
+    Returns:
+    claimed (list) - IDs of the treasure chests which were newly claimed.
+    """
+    chest_ids = list(dict.fromkeys(chest_ids))
+    if not chest_ids:
+        return []
+
+    with transaction.atomic():
+        # Lock the player so claims are serialised per player.
+        Player.objects.select_for_update().only("id").get(pk=player.pk)
+
+        # Skip treasure chests which have already been claimed.
+        existing = set(ChestClaim.objects
+                .filter(player=player, treasure_chest_id__in=chest_ids)
+                .values_list("treasure_chest_id", flat=True))
+        claimed = [chest_id for chest_id in chest_ids
+                if chest_id not in existing]
+
+        ChestClaim.objects.bulk_create([ChestClaim(player=player,
+            treasure_chest_id=chest_id, participation=participation)
+            for chest_id in claimed])
+
+    return claimed
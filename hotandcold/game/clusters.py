@@ -0,0 +1,213 @@
+"""Treasure chest clusters used in game app.
+
+Used for showing thousands of treasure chests on a map without sending
+every one to the browser. Treasure chests are counted in geohash cells (see
+geo.geohash) at every cell size in PRECISIONS, with their total points and
+location. A map tile is given the cells of the size which fits around
+TILE_CELLS of them across it, each drawn as one cluster at the average
+location of its treasure chests, so a tile never has more than
+MAX_CLUSTERS clusters however many treasure chests it covers.
+
+Cells are updated as treasure chests are saved and deleted (see signals.py
+and batch.py), by adding the change to the totals of the few cells the
+chest was in and is now in. The rebuild_chest_clusters command recounts
+them from scratch, for backfilling.
+"""
+
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .geo import geohash, geohash_centre
+from .models import ChestCluster, TreasureChest
+
+
+# Geohash lengths counted, from around 5000 km down to 40 m cells.
+PRECISIONS = (1, 2, 3, 4, 5, 6, 7, 8)
+
+# Number of cells across a tile, as a power of two.
+TILE_CELL_BITS = 5
+
+# Largest number of clusters given for a tile.
+MAX_CLUSTERS = 2048
+
+# Largest zoom level of a tile.
+MAX_ZOOM = 22
+
+# Fields added up in each cell.
+TOTAL_FIELDS = ["count", "points", "latitude_total", "longitude_total"]
+
+
+def get_deltas(removed=(), added=()):
+    """Work out the change in the totals of each cell.
+
+    Arguments:
+    removed (iterable) - (latitude, longitude, points) of each treasure chest
+    taken away.
+    added (iterable) - (latitude, longitude, points) of each treasure chest
+    put in.
+
+    Returns:
+    deltas (dict) - geohash to the change of each of TOTAL_FIELDS, leaving
+    out cells which do not change.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for chests, sign in ((removed, -1), (added, 1)):
+        for latitude, longitude, points in chests:
+            latitude = float(latitude)
+            longitude = float(longitude)
+
+            # Larger cells are prefixes of the smallest one.
+            cell = geohash(latitude, longitude, max(PRECISIONS))
+            for precision in PRECISIONS:
+                delta = deltas[cell[:precision]]
+                delta[0] += sign
+                delta[1] += sign * points
+                delta[2] += sign * latitude
+                delta[3] += sign * longitude
+
+    return {cell: delta for cell, delta in deltas.items() if any(delta)}
+
+
+def new_cluster(cell, totals=(0, 0, 0.0, 0.0)):
+    """Create an unsaved ChestCluster.
+
+    Arguments:
+    cell (str) - geohash of the cell.
+    totals (tuple) - values of TOTAL_FIELDS.
+
+    Returns:
+    cluster (ChestCluster) - the unsaved ChestCluster.
+    """
+    latitude, longitude = geohash_centre(cell)
+    return ChestCluster(geohash=cell, precision=len(cell), latitude=latitude,
+            longitude=longitude, **dict(zip(TOTAL_FIELDS, totals)))
+
+
+def update_clusters(removed=(), added=()):
+    """Move treasure chests in and out of the cells they are in.
+
+    Uses four queries whatever the number of cells: missing cells are
+    inserted, their IDs are read, every total is changed in a single
+    UPDATE, and cells left empty are deleted. The changes are done by the
+    database, so concurrent updates do not lose them.
+
+    Arguments:
+    removed (iterable) - (latitude, longitude, points) of each treasure chest
+    taken away, as it was.
+    added (iterable) - (latitude, longitude, points) of each treasure chest
+    put in.
+
+    Returns:
+    None.
+    """
+    deltas = get_deltas(removed, added)
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        ChestCluster.objects.bulk_create([new_cluster(cell)
+            for cell in deltas], ignore_conflicts=True)
+
+        clusters = list(ChestCluster.objects.filter(
+            geohash__in=list(deltas)).only("id", "geohash"))
+        for cluster in clusters:
+            for field, delta in zip(TOTAL_FIELDS, deltas[cluster.geohash]):
+                setattr(cluster, field, F(field) + delta)
+        ChestCluster.objects.bulk_update(clusters, TOTAL_FIELDS)
+
+        ChestCluster.objects.filter(geohash__in=list(deltas),
+                count__lte=0).delete()
+
+
+def get_precision(zoom):
+    """Return the cell size to cluster a map tile with.
+
+    Arguments:
+    zoom (int) - zoom level of the tile.
+
+    Returns:
+    precision (int) - largest geohash length with at most 2 **
+    TILE_CELL_BITS cells across a tile.
+    """
+    # Geohashes have ceil(5 * precision / 2) bits of longitude.
+    return max([precision for precision in PRECISIONS
+        if math.ceil(5 * precision / 2) <= zoom + TILE_CELL_BITS]
+        or [min(PRECISIONS)])
+
+
+def tile_bounds(zoom, x, y):
+    """Return the area covered by a web map tile.
+
+    Arguments:
+    zoom (int) - zoom level of the tile.
+    x (int) - column of the tile, from the west.
+    y (int) - row of the tile, from the north.
+
+    Returns:
+    bounds (tuple) - (minimum latitude, minimum longitude, maximum latitude,
+    maximum longitude) of the tile.
+
+    Raises:
+    ValueError - if the tile does not exist.
+    """
+    tiles = 2 ** zoom
+    if not (0 <= zoom <= MAX_ZOOM and 0 <= x < tiles and 0 <= y < tiles):
+        raise ValueError("Tile does not exist.")
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi
+            * (1 - 2 * row / tiles))))
+
+    return (latitude(y + 1), x / tiles * 360 - 180, latitude(y),
+            (x + 1) / tiles * 360 - 180)
+
+
+def get_tile(zoom, x, y):
+    """Return the treasure chest clusters of a map tile.
+
+    Arguments:
+    zoom (int) - zoom level of the tile.
+    x (int) - column of the tile, from the west.
+    y (int) - row of the tile, from the north.
+
+    Returns:
+    clusters (list) - [latitude, longitude, count, points] of each cluster,
+    at the average location of its treasure chests, biggest first.
+
+    Raises:
+    ValueError - if the tile does not exist.
+    """
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(zoom, x, y)
+
+    # Cells belong to the tile their centre is in.
+    rows = (ChestCluster.objects.filter(precision=get_precision(zoom),
+                latitude__gte=min_lat, latitude__lt=max_lat,
+                longitude__gte=min_lng, longitude__lt=max_lng)
+            .order_by("-count")
+            .values_list(*TOTAL_FIELDS)[:MAX_CLUSTERS])
+
+    return [[round(lat_total / count, 6), round(lng_total / count, 6), count,
+        points] for count, points, lat_total, lng_total in rows]
+
+
+def rebuild_clusters(chunk_size=1000):
+    """Recount every cell from the treasure chests.
+
+    Arguments:
+    chunk_size (int) - number of rows to read and write at a time.
+
+    Returns:
+    count (int) - number of cells created.
+    """
+    with transaction.atomic():
+        deltas = get_deltas(added=TreasureChest.objects.values_list(
+            "latitude", "longitude", "points").iterator(chunk_size=chunk_size))
+
+        ChestCluster.objects.all().delete()
+        ChestCluster.objects.bulk_create([new_cluster(cell, totals)
+            for cell, totals in deltas.items()], batch_size=chunk_size)
+
+    return len(deltas)
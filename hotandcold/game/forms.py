@@ -6,6 +6,8 @@ Used for entering, validating and cleaning user input with HTML forms.
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 
+from .scoring import GAME_BOUND
+
 
 class UserRegistrationForm(UserCreationForm):
     """User registration form.
@@ -47,6 +49,10 @@ class EventCreationForm(forms.Form):
     latitude = forms.DecimalField(label="Latitude", max_digits=22, decimal_places=16)
     longitude = forms.DecimalField(label="Longitude", max_digits=22, decimal_places=16)
 
+    # Playing area radius field.
+    game_bound = forms.IntegerField(label="Play area radius (metres)",
+            min_value=1, initial=GAME_BOUND)
+
 
 class TreasureChestCreationForm(forms.Form):
     """TreasureChest creation form.
@@ -0,0 +1,181 @@
+"""Geographic helpers used in game app.
+
+Used for calculating distances between GPS coordinates. The calculations
+match the ones done in the browser by game.html so that the server and the
+client always agree. Also used for binning coordinates into geohash cells.
+"""
+
+import math
+
+
+# Mean radius of the Earth in kilometres.
+EARTH_RADIUS = 6371
+
+# Characters used by geohashes, each standing for 5 bits.
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def js_round(number):
+    """Round a number the same way as JavaScript's Math.round.
+
+    Python's round uses banker's rounding, JavaScript always rounds halves
+    up, so this is needed to get identical results on both sides.
+
+    Arguments:
+    number (float) - number to round.
+
+    Returns:
+    rounded (int) - number rounded to the nearest integer, halves up.
+    """
+    return math.floor(number + 0.5)
+
+
+def calc_distance(lat1, lng1, lat2, lng2):
+    """Calculate the distance between 2 GPS coordinates.
+
+    Uses the haversine formula, the same as calcDistance in game.html.
+
+    Arguments:
+    lat1 (float) - latitude of first coordinate.
+    lng1 (float) - longitude of first coordinate.
+    lat2 (float) - latitude of second coordinate.
+    lng2 (float) - longitude of second coordinate.
+
+    Returns:
+    distance (int) - distance between the coordinates in whole metres.
+    """
+    # Convert coordinates to radians.
+    lat1 = math.radians(float(lat1))
+    lng1 = math.radians(float(lng1))
+    lat2 = math.radians(float(lat2))
+    lng2 = math.radians(float(lng2))
+
+    return haversine(lat1, lng1, math.cos(lat1), lat2, lng2, math.cos(lat2))
+
+
+def haversine(lat1, lng1, cos_lat1, lat2, lng2, cos_lat2):
+    """Calculate the distance between 2 coordinates already in radians.
+
+    Taking the cosines of the latitudes as arguments lets callers comparing
+    one coordinate against many others work them out only once.
+
+    Arguments:
+    lat1 (float) - latitude of first coordinate in radians.
+    lng1 (float) - longitude of first coordinate in radians.
+    cos_lat1 (float) - cosine of lat1.
+    lat2 (float) - latitude of second coordinate in radians.
+    lng2 (float) - longitude of second coordinate in radians.
+    cos_lat2 (float) - cosine of lat2.
+
+    Returns:
+    distance (int) - distance between the coordinates in whole metres.
+    """
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+            + cos_lat1 * cos_lat2 * math.sin((lng2 - lng1) / 2) ** 2)
+    c = 2 * math.asin(min(1.0, math.sqrt(a)))
+
+    return js_round(c * EARTH_RADIUS * 1000)
+
+
+def bounding_box(lat, lng, radius):
+    """Calculate a box containing every point within a radius of a point.
+
+    Used for pre-filtering coordinates with an indexed range query before
+    working out exact distances.
+
+    Arguments:
+    lat (float) - latitude of the centre.
+    lng (float) - longitude of the centre.
+    radius (int) - radius in metres.
+
+    Returns:
+    box (tuple) - (minimum latitude, maximum latitude, minimum longitude,
+    maximum longitude) in degrees.
+    """
+    lat = float(lat)
+    lng = float(lng)
+
+    # Angular distance covered by the radius.
+    angle = radius / (EARTH_RADIUS * 1000)
+    delta = math.degrees(angle)
+
+    # Lines of longitude converge towards the poles, so the box is wider.
+    cos_lat = math.cos(math.radians(lat))
+    if abs(lat) + delta >= 90 or math.sin(angle) >= cos_lat:
+        delta_lng = 180
+    else:
+        delta_lng = math.degrees(math.asin(math.sin(angle) / cos_lat))
+
+    return (max(-90, lat - delta), min(90, lat + delta),
+            max(-180, lng - delta_lng), min(180, lng + delta_lng))
+
+
+def geohash(lat, lng, precision):
+    """Calculate the geohash of the cell containing a point.
+
+    Geohashes split the world into a grid, alternately halving the
+    longitude and latitude ranges. Each character picks one of 32 cells
+    within the last, so cells with the same prefix are inside each other.
+
+    Arguments:
+    lat (float) - latitude of the point.
+    lng (float) - longitude of the point.
+    precision (int) - number of characters, 7 is around 150 metres.
+
+    Returns:
+    geohash (str) - geohash of the cell.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+
+    characters = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(characters) < precision:
+        # Halve the longitude on even bits and the latitude on odd bits.
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            characters.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(characters)
+
+
+def geohash_centre(cell):
+    """Calculate the centre of a geohash cell.
+
+    Arguments:
+    cell (str) - geohash of the cell.
+
+    Returns:
+    centre (tuple) - (latitude, longitude) of the centre.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+
+    even = True
+    for character in cell:
+        bits = GEOHASH_ALPHABET.index(character)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+
+    return ((lat_range[0] + lat_range[1]) / 2,
+            (lng_range[0] + lng_range[1]) / 2)
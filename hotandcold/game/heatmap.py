@@ -0,0 +1,178 @@
+"""Play activity heatmap used in game app.
+
+Used for showing game masters where players go, so treasure chests can be
+placed better. Button presses and treasure chest claims are counted in
+geohash cells (see geo.geohash) at a few cell sizes, so a map can show
+large areas with big cells and zoom in to small ones.
+
+Counts are added after every game by a background task, a whole game at a
+time with a fixed number of queries however many cells it covers. Reading
+the heatmap only reads the cells in view from the index, it never has to go
+through the games again. The rebuild_heatmap command recounts everything
+from scratch, for backfilling.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .geo import geohash, geohash_centre
+from .models import ArchivedParticipation, ChestClaim, HeatmapCell, \
+    Participation
+from .scoring import parse_pings
+from .tasks import task
+
+
+# Geohash lengths counted, around 5 km, 1.2 km and 150 m cells.
+PRECISIONS = (5, 6, 7)
+
+# Largest number of cells given for a map view.
+MAX_CELLS = 5000
+
+
+def bin_points(points):
+    """Count points in the geohash cells of every precision.
+
+    Arguments:
+    points (iterable) - (latitude, longitude) of each point.
+
+    Returns:
+    counts (Counter) - geohash to number of points in the cell.
+    """
+    counts = Counter()
+    for latitude, longitude in points:
+        # Larger cells are prefixes of the smallest one.
+        cell = geohash(float(latitude), float(longitude), max(PRECISIONS))
+        for precision in PRECISIONS:
+            counts[cell[:precision]] += 1
+
+    return counts
+
+
+def new_cell(kind, cell, count=0):
+    """Create an unsaved HeatmapCell.
+
+    Arguments:
+    kind (str) - HeatmapCell.PING or HeatmapCell.CLAIM.
+    cell (str) - geohash of the cell.
+    count (int) - number of points in the cell.
+
+    Returns:
+    cell (HeatmapCell) - the unsaved HeatmapCell.
+    """
+    latitude, longitude = geohash_centre(cell)
+    return HeatmapCell(kind=kind, geohash=cell, precision=len(cell),
+            latitude=latitude, longitude=longitude, count=count)
+
+
+def add_counts(kind, counts):
+    """Add counts to the heatmap.
+
+    Uses three queries whatever the number of cells: missing cells are
+    inserted (ignoring ones which already exist), their IDs are read, and
+    every count is increased in a single UPDATE. The increases are done by
+    the database, so concurrent tasks do not lose counts.
+
+    Arguments:
+    kind (str) - HeatmapCell.PING or HeatmapCell.CLAIM.
+    counts (Counter) - geohash to number of points to add.
+
+    Returns:
+    None.
+    """
+    if not counts:
+        return
+
+    with transaction.atomic():
+        HeatmapCell.objects.bulk_create([new_cell(kind, cell)
+            for cell in counts], ignore_conflicts=True)
+
+        cells = list(HeatmapCell.objects.filter(kind=kind,
+            geohash__in=list(counts)).only("id", "geohash"))
+        for cell in cells:
+            cell.count = F("count") + counts[cell.geohash]
+        HeatmapCell.objects.bulk_update(cells, ["count"])
+
+
+@task
+def update_heatmap(participation_id):
+    """Add the presses and claims of a game to the heatmap.
+
+    Queued by submissions.submit_game.
+
+    Arguments:
+    participation_id (int) - ID of the Participation.
+
+    Returns:
+    None.
+    """
+    participation = (Participation.objects.filter(pk=participation_id)
+            .only("pings").first())
+    if participation is None:
+        return
+
+    claims = ChestClaim.objects.filter(participation_id=participation_id) \
+            .values_list("treasure_chest__latitude",
+                "treasure_chest__longitude")
+
+    with transaction.atomic():
+        add_counts(HeatmapCell.PING,
+                bin_points(parse_pings(participation.pings)))
+        add_counts(HeatmapCell.CLAIM, bin_points(claims))
+
+
+def get_cells(kind, precision, bounds):
+    """Return the cells of a map view.
+
+    Arguments:
+    kind (str) - HeatmapCell.PING or HeatmapCell.CLAIM.
+    precision (int) - geohash length of the cells.
+    bounds (tuple) - (minimum latitude, minimum longitude, maximum latitude,
+    maximum longitude) of the view.
+
+    Returns:
+    cells (list) - [latitude, longitude, count] of each cell with activity,
+    busiest first, at most MAX_CELLS.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounds
+    rows = (HeatmapCell.objects.filter(kind=kind, precision=precision,
+                latitude__range=(min_lat, max_lat),
+                longitude__range=(min_lng, max_lng))
+            .order_by("-count")
+            .values_list("latitude", "longitude", "count")[:MAX_CELLS])
+
+    # Six decimal places is well within the smallest cell.
+    return [[round(lat, 6), round(lng, 6), count] for lat, lng, count in rows]
+
+
+def rebuild_heatmap(chunk_size=1000):
+    """Recount the whole heatmap from every game, including archived ones.
+
+    Arguments:
+    chunk_size (int) - number of rows to read and write at a time.
+
+    Returns:
+    count (int) - number of cells created.
+    """
+    pings = Counter()
+    for model in (Participation, ArchivedParticipation):
+        for data in (model.objects.exclude(pings="")
+                .values_list("pings", flat=True)
+                .iterator(chunk_size=chunk_size)):
+            pings.update(bin_points(parse_pings(data)))
+
+    claims = bin_points(ChestClaim.objects.values_list(
+        "treasure_chest__latitude", "treasure_chest__longitude")
+        .iterator(chunk_size=chunk_size))
+
+    cells = [new_cell(HeatmapCell.PING, cell, count)
+            for cell, count in pings.items()]
+    cells += [new_cell(HeatmapCell.CLAIM, cell, count)
+            for cell, count in claims.items()]
+
+    with transaction.atomic():
+        HeatmapCell.objects.all().delete()
+        HeatmapCell.objects.bulk_create(cells, batch_size=chunk_size)
+
+    return len(cells)
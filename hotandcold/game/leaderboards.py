@@ -0,0 +1,165 @@
+"""Leaderboards used in game app.
+
+Used for ranking players over a window of time. The points of each player
+are rolled up per day (DailyScore) and per week (WeeklyScore) as games are
+submitted, so a leaderboard is a single indexed query on a rollup table. The
+rollups can be rebuilt from the Participations with the
+rebuild_leaderboards command, leaving out games from before their time was
+recorded, which only count towards the all time leaderboard.
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from .models import ArchivedParticipation, DailyScore, Participation, \
+    Player, WeeklyScore
+
+
+# Rollup model and truncation function of each window.
+WINDOWS = {
+    "day": (DailyScore, TruncDate),
+    "week": (WeeklyScore, TruncWeek),
+}
+
+
+def window_start(window, when=None):
+    """Return the date a window containing a datetime starts on.
+
+    Arguments:
+    window (str) - "day" or "week".
+    when (datetime) - datetime in the window, defaults to now.
+
+    Returns:
+    start (date) - first day of the window.
+    """
+    day = timezone.localdate(when)
+    if window == "week":
+        day -= datetime.timedelta(days=day.weekday())
+
+    return day
+
+
+def record_participation(participation):
+    """Add a new game to the rollups.
+
+    Arguments:
+    participation (Participation) - the new Participation.
+
+    Returns:
+    None.
+    """
+    for window, (model, _) in WINDOWS.items():
+        start = window_start(window, participation.created)
+        rows = model.objects.filter(player_id=participation.player_id,
+                start=start)
+
+        # Add to the row of the window, creating it if this is the first
+        # game in the window.
+        updated = rows.update(points=F("points") + participation.score,
+                games=F("games") + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    model.objects.create(player_id=participation.player_id,
+                            start=start, points=participation.score, games=1)
+            except IntegrityError:
+                # Another game created the row first.
+                rows.update(points=F("points") + participation.score,
+                        games=F("games") + 1)
+
+
+def adjust_rollups(changes):
+    """Apply changes to games already counted to the rollups.
+
+    Games from before their time was recorded are not in the rollups, so
+    they are skipped.
+
+    Arguments:
+    changes (list) - GameChange of each game (see adjustments.py).
+
+    Returns:
+    None.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for change in changes:
+        if change.created is None:
+            continue
+        for window in WINDOWS:
+            start = window_start(window, change.created)
+            totals[window, change.player_id, start][0] += change.score
+            totals[window, change.player_id, start][1] += change.games
+
+    for (window, player_id, start), (points, games) in totals.items():
+        WINDOWS[window][0].objects.filter(player_id=player_id,
+                start=start).update(points=F("points") + points,
+                        games=F("games") + games)
+
+
+def top_players(window="all", limit=10):
+    """Return the top players of a window.
+
+    Arguments:
+    window (str) - "day", "week" or "all" for all time.
+    limit (int) - number of players to return.
+
+    Returns:
+    top (list) - (player, points) of each player, highest points first.
+    """
+    if window not in WINDOWS:
+        players = Player.objects.select_related("user").order_by("-points")
+        return [(player, player.points) for player in players[:limit]]
+
+    model = WINDOWS[window][0]
+    rows = (model.objects.filter(start=window_start(window))
+            .select_related("player__user").order_by("-points")[:limit])
+    return [(row.player, row.points) for row in rows]
+
+
+def rebuild_rollups(chunk_size=1000):
+    """Rebuild every rollup from the Participations.
+
+    Each rollup is worked out with one grouped query on the current and one
+    on the archived Participations, and bulk created in chunks.
+
+    Arguments:
+    chunk_size (int) - number of rows to create at a time.
+
+    Returns:
+    counts (dict) - number of rows created for each window.
+    """
+    counts = {}
+    for window, (model, trunc) in WINDOWS.items():
+        rollups = {}
+        for participation_model in (Participation, ArchivedParticipation):
+            rows = (participation_model.objects
+                    .filter(created__isnull=False)
+                    .annotate(period=trunc("created"))
+                    .values("player_id", "period")
+                    .annotate(points=Sum("score"), games=Count("id"))
+                    .order_by())
+
+            # Add up the rows of the same player and period.
+            for row in rows.iterator(chunk_size=chunk_size):
+                period = row["period"]
+                if isinstance(period, datetime.datetime):
+                    period = timezone.localtime(period).date()
+                rollup = rollups.get((row["player_id"], period))
+                if rollup is None:
+                    rollups[row["player_id"], period] = model(
+                            player_id=row["player_id"], start=period,
+                            points=row["points"], games=row["games"])
+                else:
+                    rollup.points += row["points"]
+                    rollup.games += row["games"]
+
+        with transaction.atomic():
+            model.objects.all().delete()
+            model.objects.bulk_create(rollups.values(), batch_size=chunk_size)
+            counts[window] = len(rollups)
+
+    return counts
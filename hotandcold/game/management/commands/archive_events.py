@@ -0,0 +1,39 @@
+"""Management command to archive past events.
+
+Moves events which finished more than a number of days ago, with their
+participations, into the archive tables. Meant to be run regularly, such as
+from a nightly cron job.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.archive import DEFAULT_RETENTION_DAYS, archive_events
+
+
+class Command(BaseCommand):
+    """Archive events command."""
+
+    help = "Move events which finished long ago into the archive tables."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--days", type=int,
+                default=DEFAULT_RETENTION_DAYS,
+                help="Number of days after an event ends to archive it.")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                help="Number of events to archive at a time.")
+
+    def handle(self, *args, **options):
+        """Archive the events.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        events, participations = archive_events(options["days"],
+                options["chunk_size"])
+        self.stdout.write("Archived {} events and {} participations.".format(
+            events, participations))
@@ -0,0 +1,33 @@
+"""Management command to rebuild the treasure chest clusters.
+
+Recounts the treasure chests in every cluster cell from scratch, used for
+backfilling the clusters.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.clusters import rebuild_clusters
+
+
+class Command(BaseCommand):
+    """Rebuild chest clusters command."""
+
+    help = "Recount the treasure chest clusters of every zoom level."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of rows to read and write at a time.")
+
+    def handle(self, *args, **options):
+        """Rebuild the clusters.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        count = rebuild_clusters(options["chunk_size"])
+        self.stdout.write("Rebuilt {} cluster cells.".format(count))
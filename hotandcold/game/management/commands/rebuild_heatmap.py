@@ -0,0 +1,33 @@
+"""Management command to rebuild the play activity heatmap.
+
+Recounts the button presses and treasure chest claims in every heatmap
+cell from every game, used for backfilling the heatmap.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.heatmap import rebuild_heatmap
+
+
+class Command(BaseCommand):
+    """Rebuild heatmap command."""
+
+    help = "Recount the play activity heatmap from every game."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of rows to read and write at a time.")
+
+    def handle(self, *args, **options):
+        """Rebuild the heatmap.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        count = rebuild_heatmap(options["chunk_size"])
+        self.stdout.write("Rebuilt {} heatmap cells.".format(count))
@@ -0,0 +1,34 @@
+"""Management command to rebuild the leaderboard rollups.
+
+Recomputes the daily and weekly points of every player from the
+Participations in bulk, used for backfilling the rollup tables.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.leaderboards import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """Rebuild leaderboard rollups command."""
+
+    help = "Rebuild the daily and weekly leaderboard rollups from every game."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of rows to write at a time.")
+
+    def handle(self, *args, **options):
+        """Rebuild the rollups.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        counts = rebuild_rollups(options["chunk_size"])
+        for window, count in counts.items():
+            self.stdout.write("Rebuilt {} {} rows.".format(count, window))
@@ -0,0 +1,33 @@
+"""Management command to rebuild player statistics.
+
+Recomputes every PlayerStats from the Participations in bulk, for when the
+incrementally maintained statistics need fixing or the rules change.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    """Rebuild player statistics command."""
+
+    help = "Rebuild the statistics of every player from their games."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of rows to write at a time.")
+
+    def handle(self, *args, **options):
+        """Rebuild the statistics.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        count = rebuild_stats(options["chunk_size"])
+        self.stdout.write("Rebuilt statistics of {} players.".format(count))
@@ -0,0 +1,33 @@
+"""Management command to rebuild team scores.
+
+Recomputes the points of every Team from the Participations in bulk, for
+when the incrementally maintained totals need fixing.
+"""
+
+from django.core.management.base import BaseCommand
+
+from game.teams import rebuild_team_scores
+
+
+class Command(BaseCommand):
+    """Rebuild team scores command."""
+
+    help = "Recompute the points of every team from the games played."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of rows to update at a time.")
+
+    def handle(self, *args, **options):
+        """Rebuild the team scores.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        count = rebuild_team_scores(options["chunk_size"])
+        self.stdout.write("Rebuilt the scores of {} teams.".format(count))
@@ -0,0 +1,45 @@
+"""Management command to reconcile player points.
+
+Checks the points total of every player against the scores of their games
+and reports how far they have drifted, correcting them with --apply. Meant
+to be run nightly, such as from a cron job.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.reconcile import reconcile_points
+
+
+class Command(BaseCommand):
+    """Reconcile points command."""
+
+    help = "Check player points against their games and report drift."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                help="Number of players to check and fix at a time.")
+        parser.add_argument("--apply", action="store_true",
+                help="Save the corrected points.")
+
+    def handle(self, *args, **options):
+        """Reconcile the points.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        start = time.perf_counter()
+        drift = reconcile_points(options["apply"], options["chunk_size"])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write("Checked {} players in {:.2f}s, {} wrong, {} fixed."
+                .format(drift.players, elapsed, drift.mismatched,
+                    drift.fixed))
+        self.stdout.write("Drift: {} in total, {} in size, {} at most."
+                .format(drift.total, drift.absolute, drift.largest))
@@ -0,0 +1,144 @@
+"""Management command to re-score stored game sessions.
+
+Replays the positions stored with each Participation through the scoring
+rules in scoring.py. Used for auditing submitted scores and for applying
+rule changes to games which have already been played.
+
+Each game is scored the way submissions.save_game scored it: against the
+treasure chests in play for its event, within the playing area of the
+event, leaving out treasure chests the player had already claimed before
+it. Chests claimed in later games of the player are not left out.
+
+With --apply, every total the games were counted in is adjusted by the
+difference (see adjustments.py) and the winners of the events are found
+again.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game import stats
+from game.adjustments import GameChange, adjust_games
+from game.models import ChestClaim, Event, EventChest, Participation
+from game.scoring import EventScorer, parse_pings
+
+
+class Command(BaseCommand):
+    """Re-score stored game sessions command."""
+
+    help = "Re-score stored game sessions and report (or fix) differences."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--event", type=int,
+                help="Only re-score sessions of the event with this ID.")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                help="Number of sessions to score at a time.")
+        parser.add_argument("--apply", action="store_true",
+                help="Save the new scores and adjust points, statistics, "
+                "leaderboards, team scores and winners.")
+
+    def handle(self, *args, **options):
+        """Re-score sessions event by event.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        events = Event.objects.all()
+        if options["event"] is not None:
+            events = events.filter(pk=options["event"])
+
+        start = time.perf_counter()
+        total = changed = 0
+        for event in events.only("id", "latitude", "longitude",
+                "game_bound").iterator():
+            # Only the treasure chests in play for the event can be claimed.
+            chests = list(EventChest.objects.filter(event=event)
+                    .values_list("treasure_chest_id",
+                        "treasure_chest__latitude",
+                        "treasure_chest__longitude",
+                        "treasure_chest__points"))
+            scorer = EventScorer((event.latitude, event.longitude), chests,
+                    event.game_bound)
+
+            # Stream stored sessions in batches.
+            sessions = (Participation.objects.filter(event=event)
+                    .exclude(pings="")
+                    .values_list("id", "player_id", "score", "pings",
+                        "team_id", "created"))
+            batch = []
+            event_changed = 0
+            for row in sessions.iterator(chunk_size=options["batch_size"]):
+                batch.append(row)
+                if len(batch) >= options["batch_size"]:
+                    event_changed += self.rescore_batch(scorer, batch,
+                            options["apply"])
+                    total += len(batch)
+                    batch = []
+            if batch:
+                event_changed += self.rescore_batch(scorer, batch,
+                        options["apply"])
+                total += len(batch)
+            changed += event_changed
+
+            # The new scores may have changed who won the event.
+            if options["apply"] and event_changed:
+                stats.update_winners([event.id])
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write("Re-scored {} sessions in {:.2f}s ({:.0f}/s), "
+                "{} differ.".format(total, elapsed, rate, changed))
+
+    def rescore_batch(self, scorer, batch, apply):
+        """Re-score a batch of sessions from one event.
+
+        Arguments:
+        scorer (EventScorer) - scorer for the event.
+        batch (list) - (id, player_id, score, pings, team_id, created) for
+        each session.
+        apply (bool) - save the new scores if True.
+
+        Returns:
+        changed (int) - number of sessions with a different score.
+        """
+        # Find the treasure chests each player claimed, and in which game.
+        claims = {}
+        for player_id, chest_id, participation_id in (ChestClaim.objects
+                .filter(player_id__in={row[1] for row in batch})
+                .values_list("player_id", "treasure_chest_id",
+                    "participation_id")):
+            claims.setdefault(player_id, []).append((chest_id,
+                participation_id))
+
+        # Leave out the treasure chests claimed before each game, which are
+        # those claimed in earlier games or outside of a game.
+        results = [scorer.score(parse_pings(row[3]), [chest_id
+            for chest_id, participation_id in claims.get(row[1], [])
+            if participation_id is None or participation_id < row[0]])
+            for row in batch]
+
+        # Find the sessions which score differently.
+        changed = [(row, result.score) for row, result in zip(batch, results)
+                if row[2] != result.score]
+        if not apply or not changed:
+            return len(changed)
+
+        with transaction.atomic():
+            # Save the new scores.
+            Participation.objects.bulk_update(
+                    [Participation(id=row[0], score=score)
+                        for row, score in changed], ["score"])
+
+            # Adjust every total the games were counted in by the
+            # difference.
+            adjust_games([GameChange(row[1], row[4], row[5], score - row[2],
+                0) for row, score in changed])
+
+        return len(changed)
@@ -0,0 +1,85 @@
+"""Management command to run a background task worker.
+
+Claims queued tasks (see tasks.py) and runs them on a thread pool until
+stopped.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from game.tasks import claim_tasks, purge_finished_tasks, \
+    requeue_stale_tasks, run_task
+
+
+class Command(BaseCommand):
+    """Run background task worker command."""
+
+    help = "Run queued background tasks on a thread pool."
+
+    def add_arguments(self, parser):
+        """Add command line arguments.
+
+        Arguments:
+        parser - argparse parser for the command.
+        """
+        parser.add_argument("--threads", type=int, default=4,
+                help="Number of tasks to run at the same time.")
+        parser.add_argument("--sleep", type=float, default=1.0,
+                help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                help="Stop once the queue is empty.")
+
+    def handle(self, *args, **options):
+        """Claim and run tasks until stopped.
+
+        Arguments:
+        options - parsed command line arguments.
+        """
+        threads = options["threads"]
+        self.stdout.write("Worker started with {} threads.".format(threads))
+
+        last_requeue = 0
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            try:
+                while True:
+                    # Put back tasks left behind by dead workers, and purge
+                    # old failed tasks, now and then.
+                    if time.monotonic() - last_requeue > 60:
+                        requeue_stale_tasks()
+                        purge_finished_tasks()
+                        last_requeue = time.monotonic()
+
+                    # Claim enough tasks to keep every thread busy.
+                    claimed = claim_tasks(threads)
+                    if not claimed:
+                        if options["once"]:
+                            break
+                        time.sleep(options["sleep"])
+                        continue
+
+                    # Wait for the batch so no more is claimed than can run.
+                    list(pool.map(self.run_in_thread, claimed))
+            except KeyboardInterrupt:
+                self.stdout.write("Worker stopping.")
+
+    @staticmethod
+    def run_in_thread(claimed_task):
+        """Run a task in a pool thread.
+
+        Each thread has its own database connection, which is closed if it
+        has gone bad or reached its maximum age.
+
+        Arguments:
+        claimed_task (Task) - Task claimed by this worker.
+
+        Returns:
+        success (bool) - True if the task ran without an error.
+        """
+        close_old_connections()
+        try:
+            return run_task(claimed_task)
+        finally:
+            close_old_connections()
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_treasurechest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participation',
+            name='pings',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_participation_pings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChestClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('claimed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='treasurechest',
+            index=models.Index(fields=['latitude', 'longitude'], name='game_treasu_latitud_633d70_idx'),
+        ),
+        migrations.AddField(
+            model_name='chestclaim',
+            name='participation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='game.participation'),
+        ),
+        migrations.AddField(
+            model_name='chestclaim',
+            name='player',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chest_claims', to='game.player'),
+        ),
+        migrations.AddField(
+            model_name='chestclaim',
+            name='treasure_chest',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claims', to='game.treasurechest'),
+        ),
+        migrations.AddConstraint(
+            model_name='chestclaim',
+            constraint=models.UniqueConstraint(fields=('player', 'treasure_chest'), name='unique_chest_claim'),
+        ),
+    ]
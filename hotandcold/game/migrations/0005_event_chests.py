@@ -0,0 +1,63 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from game.geo import calc_distance
+
+
+def populate_event_chests(apps, schema_editor):
+    """Work out the treasure chests within the playing area of each event."""
+    Event = apps.get_model("game", "Event")
+    EventChest = apps.get_model("game", "EventChest")
+    TreasureChest = apps.get_model("game", "TreasureChest")
+
+    chests = list(TreasureChest.objects.values_list("id", "latitude",
+        "longitude"))
+    for event in Event.objects.all():
+        event_chests = []
+        for chest_id, latitude, longitude in chests:
+            distance = calc_distance(event.latitude, event.longitude,
+                    latitude, longitude)
+            if distance <= event.game_bound:
+                event_chests.append(EventChest(event_id=event.id,
+                    treasure_chest_id=chest_id, distance=distance))
+        EventChest.objects.bulk_create(event_chests)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_chestclaim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='game_bound',
+            field=models.PositiveIntegerField(default=1000),
+        ),
+        migrations.CreateModel(
+            name='EventChest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.IntegerField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.event')),
+                ('treasure_chest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.treasurechest')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='treasure_chests',
+            field=models.ManyToManyField(related_name='events', through='game.EventChest', to='game.TreasureChest'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventchest',
+            constraint=models.UniqueConstraint(fields=('event', 'treasure_chest'), name='unique_event_chest'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['latitude', 'longitude'], name='game_event_latitud_d22570_idx'),
+        ),
+        migrations.RunPython(populate_event_chests, migrations.RunPython.noop),
+    ]
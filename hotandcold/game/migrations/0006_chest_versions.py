@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_event_chests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='chest_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eventchest',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
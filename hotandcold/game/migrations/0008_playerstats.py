@@ -0,0 +1,29 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='game.player')),
+                ('games_played', models.PositiveIntegerField(default=0)),
+                ('total_score', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(blank=True, null=True)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+                ('events_won', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['event', '-score'], name='game_partic_event_i_043ac6_idx'),
+        ),
+    ]
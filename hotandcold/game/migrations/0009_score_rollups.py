@@ -0,0 +1,63 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_playerstats'),
+    ]
+
+    operations = [
+        # Games already played were not timed, so they are left without a
+        # time instead of all being given the time of the migration.
+        migrations.AddField(
+            model_name='participation',
+            name='created',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='participation',
+            name='created',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.CreateModel(
+            name='WeeklyScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('points', models.BigIntegerField(default=0)),
+                ('games', models.PositiveIntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.player')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('points', models.BigIntegerField(default=0)),
+                ('games', models.PositiveIntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.player')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='weeklyscore',
+            index=models.Index(fields=['start', '-points'], name='game_weekly_start_bf2810_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyscore',
+            constraint=models.UniqueConstraint(fields=('player', 'start'), name='unique_weekly_score'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyscore',
+            index=models.Index(fields=['start', '-points'], name='game_dailys_start_3ec271_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyscore',
+            constraint=models.UniqueConstraint(fields=('player', 'start'), name='unique_daily_score'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_score_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['end', 'id'], name='game_event_end_c70eed_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.12 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_event_end_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatmapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ping', 'Button press'), ('claim', 'Treasure chest claim')], max_length=5)),
+                ('geohash', models.CharField(max_length=12)),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='heatmapcell',
+            index=models.Index(fields=['kind', 'precision', 'latitude', 'longitude'], name='game_heatma_kind_282f1f_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='heatmapcell',
+            constraint=models.UniqueConstraint(fields=('kind', 'geohash'), name='unique_heatmap_cell'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.12 on 2026-10-19 09:10
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Add a FULLTEXT index on event titles and descriptions on MySQL."""
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("CREATE FULLTEXT INDEX game_event_search "
+                "ON game_event (title, description)")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    """Remove the FULLTEXT index on MySQL."""
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP INDEX game_event_search ON game_event")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_heatmapcell'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
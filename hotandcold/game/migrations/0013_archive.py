@@ -0,0 +1,44 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_event_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=80)),
+                ('description', models.CharField(max_length=200)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('latitude', models.DecimalField(decimal_places=16, max_digits=22)),
+                ('longitude', models.DecimalField(decimal_places=16, max_digits=22)),
+                ('game_bound', models.PositiveIntegerField(default=1000)),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedParticipation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('score', models.IntegerField(default=0)),
+                ('pings', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.archivedevent')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.player')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedparticipation',
+            index=models.Index(fields=['event', '-score'], name='game_archiv_event_i_b481fa_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventTeam',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Team',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=80, unique=True)),
+                ('points', models.BigIntegerField(default=0)),
+                ('games', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['-points', 'id'], name='game_team_points_623dcf_idx'),
+        ),
+        migrations.AddField(
+            model_name='eventteam',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.event'),
+        ),
+        migrations.AddField(
+            model_name='eventteam',
+            name='player',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.player'),
+        ),
+        migrations.AddField(
+            model_name='eventteam',
+            name='team',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.team'),
+        ),
+        migrations.AddField(
+            model_name='archivedparticipation',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='game.team'),
+        ),
+        migrations.AddField(
+            model_name='participation',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='game.team'),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='members', to='game.team'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventteam',
+            constraint=models.UniqueConstraint(fields=('event', 'player'), name='unique_event_team'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_teams'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participation',
+            name='submission_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='participation',
+            constraint=models.UniqueConstraint(fields=('player', 'submission_key'), name='unique_submission_key'),
+        ),
+    ]
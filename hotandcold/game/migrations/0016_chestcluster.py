@@ -0,0 +1,31 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0015_submission_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChestCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geohash', models.CharField(max_length=12, unique=True)),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('count', models.IntegerField(default=0)),
+                ('points', models.BigIntegerField(default=0)),
+                ('latitude_total', models.FloatField(default=0)),
+                ('longitude_total', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chestcluster',
+            index=models.Index(fields=['precision', 'latitude', 'longitude'], name='game_chestc_precisi_ae433c_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0016_chestcluster'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedparticipation',
+            index=models.Index(fields=['player', 'score'], name='game_archiv_player__c2820b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['player', 'score'], name='game_partic_player__7a45d0_idx'),
+        ),
+    ]
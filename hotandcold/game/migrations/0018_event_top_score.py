@@ -0,0 +1,37 @@
+# Generated by Django 3.2.12 on 2026-10-19 01:26
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def populate_top_scores(apps, schema_editor):
+    """Find the top score and winner of every event."""
+    Event = apps.get_model("game", "Event")
+    Participation = apps.get_model("game", "Participation")
+
+    top = Participation.objects.filter(event=OuterRef("pk")) \
+            .order_by("-score", "id")
+    Event.objects.update(top_score=Subquery(top.values("score")[:1]),
+            winner=Subquery(top.values("player_id")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0017_player_score_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='top_score',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_events', to='game.player'),
+        ),
+        migrations.RunPython(populate_top_scores, migrations.RunPython.noop),
+    ]
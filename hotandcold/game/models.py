@@ -7,6 +7,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .scoring import GAME_BOUND
+
 
 class Player(models.Model):
     """Player model.
@@ -17,10 +19,36 @@ class Player(models.Model):
     user - Actual user that is related to this Player.
     points - Total number of points score.
     is_game_master - Flag to check if this Player is a game master.
+    team - Team the Player plays for, unless an EventTeam says otherwise.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     points = models.IntegerField(default=0)
     is_game_master = models.BooleanField(default=False)
+    team = models.ForeignKey("Team", on_delete=models.SET_NULL, null=True,
+            blank=True, related_name="members")
+
+
+class Team(models.Model):
+    """Team model.
+
+    Used for grouping Players who compete together, such as a campus
+    society. The score of every game played for the Team is added to it when
+    the game is submitted (see teams.py).
+
+    Model attributes:
+    name - Name of Team.
+    points - Total score of the games played for the Team.
+    games - Number of games played for the Team.
+    """
+    name = models.CharField(max_length=80, unique=True)
+    points = models.BigIntegerField(default=0)
+    games = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Index used for ranking Teams.
+        indexes = [models.Index(fields=["-points", "id"])]
 
 
 class Event(models.Model):
@@ -37,6 +65,13 @@ class Event(models.Model):
     end - Datetime of end of Event.
     latitude - Latitude of Event location.
     longitude - Longitude of Event location.
+    game_bound - Radius of the playing area around the location in metres.
+    treasure_chests - TreasureChests within the playing area, kept up to date
+    by chests.update_event_chests and chests.update_chest_events.
+    chest_version - Version of treasure_chests, increased on every change.
+    top_score - Top score of the Event, None if it has not been played.
+    winner - Player who got the top score first, kept with top_score by
+    stats.record_participation.
     """
     title = models.CharField(max_length=80)
     description = models.CharField(max_length=200)
@@ -44,6 +79,20 @@ class Event(models.Model):
     end = models.DateTimeField()
     latitude = models.DecimalField(max_digits=22, decimal_places=16)
     longitude = models.DecimalField(max_digits=22, decimal_places=16)
+    game_bound = models.PositiveIntegerField(default=GAME_BOUND)
+    treasure_chests = models.ManyToManyField("TreasureChest",
+            through="EventChest", related_name="events")
+    chest_version = models.PositiveIntegerField(default=0)
+    top_score = models.IntegerField(null=True, blank=True)
+    winner = models.ForeignKey("Player", on_delete=models.SET_NULL, null=True,
+            blank=True, related_name="won_events")
+
+    class Meta:
+        """Metadata for model."""
+
+        # Index used for finding Events within an area.
+        indexes = [models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["end", "id"])]
 
     def get_status(self):
         """Return a string status of the event.
@@ -80,10 +129,212 @@ class Participation(models.Model):
     Model attributes:
     player - Player related to this Participation.
     event - Event
+    score - Final score of the game.
+    pings - JSON list of positions the button was pressed at, used for
+    scoring the game on the server (see scoring.py).
+    created - Datetime the game was submitted, None for games submitted
+    before it was recorded.
+    team - Team the game was played for, if any.
+    submission_key - Idempotency key the game was submitted with, so a
+    repeated submission gives this game instead of saving another.
     """
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
+    pings = models.TextField(blank=True, default="")
+    created = models.DateTimeField(default=timezone.now, null=True,
+            blank=True, db_index=True)
+    team = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True,
+            blank=True)
+    submission_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Indexes used for finding the top scores of an Event and adding up
+        # the scores of each Player. Each key can only save one game for a
+        # Player.
+        indexes = [models.Index(fields=["event", "-score"]),
+            models.Index(fields=["player", "score"])]
+        constraints = [models.UniqueConstraint(
+            fields=["player", "submission_key"],
+            name="unique_submission_key")]
+
+
+class ArchivedEvent(models.Model):
+    """ArchivedEvent model.
+
+    Used for keeping Events which finished long ago out of the Event table,
+    moved here by the archive_events command (see archive.py). Keeps the ID
+    the Event had.
+
+    Model attributes:
+    title - Name of Event.
+    description - Description of Event.
+    start - Datetime of start of Event.
+    end - Datetime of end of Event.
+    latitude - Latitude of Event location.
+    longitude - Longitude of Event location.
+    game_bound - Radius of the playing area around the location in metres.
+    archived - Datetime the Event was archived.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=80)
+    description = models.CharField(max_length=200)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    latitude = models.DecimalField(max_digits=22, decimal_places=16)
+    longitude = models.DecimalField(max_digits=22, decimal_places=16)
+    game_bound = models.PositiveIntegerField(default=GAME_BOUND)
+    archived = models.DateTimeField(default=timezone.now)
+
+
+class ArchivedParticipation(models.Model):
+    """ArchivedParticipation model.
+
+    Used for keeping the Participations of ArchivedEvents, moved here with
+    their Event. Keeps the ID the Participation had.
+
+    Model attributes:
+    player - Player related to this Participation.
+    event - ArchivedEvent the game was played in.
+    score - Final score of the game.
+    pings - JSON list of positions the button was pressed at.
+    created - Datetime the game was submitted, if it was recorded.
+    team - Team the game was played for, if any.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    event = models.ForeignKey(ArchivedEvent, on_delete=models.CASCADE)
+    score = models.IntegerField(default=0)
+    pings = models.TextField(blank=True, default="")
+    created = models.DateTimeField(null=True, blank=True)
+    team = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True,
+            blank=True)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Indexes used for finding the winner of an ArchivedEvent and adding
+        # up the scores of each Player.
+        indexes = [models.Index(fields=["event", "-score"]),
+            models.Index(fields=["player", "score"])]
+
+
+class EventTeam(models.Model):
+    """EventTeam model.
+
+    Used for a Player playing an Event for a different Team than their own,
+    or for a Team when they have none.
+
+    Model attributes:
+    event - Event the Team is played for in.
+    player - Player in the Team.
+    team - Team the Player plays the Event for.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Each Player plays an Event for one Team.
+        constraints = [models.UniqueConstraint(fields=["event", "player"],
+            name="unique_event_team")]
+
+
+class PlayerStats(models.Model):
+    """PlayerStats model.
+
+    Used for keeping statistics of each Player, updated with every game
+    (see stats.py) so they never have to be worked out on a profile view.
+
+    Model attributes:
+    player - Player the statistics are for.
+    games_played - Number of games played.
+    total_score - Total of the scores of every game.
+    best_score - Highest score of any game.
+    last_played - Datetime of the last game.
+    events_won - Number of Events where the Player has the top score.
+    """
+    player = models.OneToOneField(Player, on_delete=models.CASCADE,
+            primary_key=True, related_name="stats")
+    games_played = models.PositiveIntegerField(default=0)
+    total_score = models.BigIntegerField(default=0)
+    best_score = models.IntegerField(null=True, blank=True)
+    last_played = models.DateTimeField(null=True, blank=True)
+    events_won = models.PositiveIntegerField(default=0)
+
+    def get_average_score(self):
+        """Return the average score of the games played.
+
+        Arguments:
+        self - PlayerStats object.
+
+        Returns:
+        average (int) - average score rounded to a whole number, None if no
+        games have been played.
+        """
+        if not self.games_played:
+            return None
+
+        return round(self.total_score / self.games_played)
+
+
+class ScoreRollup(models.Model):
+    """ScoreRollup abstract model.
+
+    Used for the points each Player scored in a period of time, so that
+    leaderboards for a period never have to add up Participations (see
+    leaderboards.py).
+
+    Model attributes:
+    player - Player who scored the points.
+    start - Date the period starts on.
+    points - Total score of games in the period.
+    games - Number of games in the period.
+    """
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    start = models.DateField()
+    points = models.BigIntegerField(default=0)
+    games = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Metadata for model."""
+
+        abstract = True
+
+
+class DailyScore(ScoreRollup):
+    """DailyScore model.
+
+    Points each Player scored on a day, see ScoreRollup.
+    """
+
+    class Meta:
+        """Metadata for model."""
+
+        # One row per Player per day, and an index for ranking a day.
+        constraints = [models.UniqueConstraint(fields=["player", "start"],
+            name="unique_daily_score")]
+        indexes = [models.Index(fields=["start", "-points"])]
+
+
+class WeeklyScore(ScoreRollup):
+    """WeeklyScore model.
+
+    Points each Player scored in a week starting on a Monday, see
+    ScoreRollup.
+    """
+
+    class Meta:
+        """Metadata for model."""
+
+        # One row per Player per week, and an index for ranking a week.
+        constraints = [models.UniqueConstraint(fields=["player", "start"],
+            name="unique_weekly_score")]
+        indexes = [models.Index(fields=["start", "-points"])]
 
 
 class TreasureChest(models.Model):
@@ -103,3 +354,185 @@ class TreasureChest(models.Model):
     points = models.IntegerField(default=100)
     latitude = models.DecimalField(max_digits=22, decimal_places=16)
     longitude = models.DecimalField(max_digits=22, decimal_places=16)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Index used for finding treasure chests within an area.
+        indexes = [models.Index(fields=["latitude", "longitude"])]
+
+
+class EventChest(models.Model):
+    """EventChest model.
+
+    Used for matching Events to the TreasureChests within their playing
+    area. Worked out when an Event or TreasureChest is saved so that games
+    do not have to search every TreasureChest.
+
+    Model attributes:
+    event - Event the TreasureChest is in play for.
+    treasure_chest - TreasureChest within the playing area.
+    distance - Distance from the Event location in metres.
+    version - Event chest_version this row last changed in.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    treasure_chest = models.ForeignKey(TreasureChest,
+            on_delete=models.CASCADE)
+    distance = models.IntegerField()
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Each TreasureChest is only in an Event once.
+        constraints = [models.UniqueConstraint(
+            fields=["event", "treasure_chest"], name="unique_event_chest")]
+
+
+class ChestClaim(models.Model):
+    """ChestClaim model.
+
+    Used for recording which TreasureChests each Player has claimed. A
+    TreasureChest can only be claimed once by each Player.
+
+    Model attributes:
+    player - Player who claimed the TreasureChest.
+    treasure_chest - TreasureChest that was claimed.
+    participation - Participation the TreasureChest was claimed in.
+    claimed - Datetime the TreasureChest was claimed.
+    """
+    player = models.ForeignKey(Player, on_delete=models.CASCADE,
+            related_name="chest_claims")
+    treasure_chest = models.ForeignKey(TreasureChest,
+            on_delete=models.CASCADE, related_name="claims")
+    participation = models.ForeignKey(Participation,
+            on_delete=models.SET_NULL, null=True, blank=True)
+    claimed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Each Player can only claim a TreasureChest once. The index behind
+        # the constraint also answers "has this Player claimed this chest".
+        constraints = [models.UniqueConstraint(
+            fields=["player", "treasure_chest"], name="unique_chest_claim")]
+
+
+class Task(models.Model):
+    """Task model.
+
+    Used for queueing functions to be run in the background by the
+    run_worker command (see tasks.py).
+
+    Model attributes:
+    name - Import path of the function to run.
+    arguments - JSON of the positional and keyword arguments.
+    status - Pending, running or failed (Tasks which ran are deleted).
+    attempts - Number of times the Task has been started.
+    max_attempts - Number of attempts before the Task is failed.
+    run_at - Datetime the Task can be run from.
+    locked_at - Datetime a worker started running the Task.
+    last_error - Traceback of the last failed attempt.
+    created - Datetime the Task was queued.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=200)
+    arguments = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+            default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Index used by workers for finding Tasks ready to run.
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+
+class HeatmapCell(models.Model):
+    """HeatmapCell model.
+
+    Used for counting the play activity in each geohash cell of the
+    heatmap, at several cell sizes (see heatmap.py).
+
+    Model attributes:
+    kind - What was counted, button presses or treasure chest claims.
+    geohash - Geohash of the cell, its length is the precision.
+    precision - Number of geohash characters, larger is smaller cells.
+    latitude - Latitude of the centre of the cell.
+    longitude - Longitude of the centre of the cell.
+    count - Number of presses or claims in the cell.
+    """
+    PING = "ping"
+    CLAIM = "claim"
+    KIND_CHOICES = [
+        (PING, "Button press"),
+        (CLAIM, "Treasure chest claim"),
+    ]
+
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    geohash = models.CharField(max_length=12)
+    precision = models.PositiveSmallIntegerField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Each cell is counted once for each kind. The index is used for
+        # getting the cells of a map view.
+        constraints = [models.UniqueConstraint(fields=["kind", "geohash"],
+            name="unique_heatmap_cell")]
+        indexes = [models.Index(fields=["kind", "precision", "latitude",
+            "longitude"])]
+
+
+class ChestCluster(models.Model):
+    """ChestCluster model.
+
+    Used for drawing TreasureChests on a map at any zoom level. Counts the
+    TreasureChests in each geohash cell at several cell sizes, kept up to
+    date as TreasureChests are saved and deleted (see clusters.py).
+
+    Model attributes:
+    geohash - Geohash of the cell, its length is the precision.
+    precision - Number of geohash characters, larger is smaller cells.
+    latitude - Latitude of the centre of the cell.
+    longitude - Longitude of the centre of the cell.
+    count - Number of TreasureChests in the cell.
+    points - Total points of the TreasureChests in the cell.
+    latitude_total - Total latitude of the TreasureChests, for their
+    average location.
+    longitude_total - Total longitude of the TreasureChests.
+    """
+    geohash = models.CharField(max_length=12, unique=True)
+    precision = models.PositiveSmallIntegerField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    count = models.IntegerField(default=0)
+    points = models.BigIntegerField(default=0)
+    latitude_total = models.FloatField(default=0)
+    longitude_total = models.FloatField(default=0)
+
+    class Meta:
+        """Metadata for model."""
+
+        # Index used for getting the cells of a map tile.
+        indexes = [models.Index(fields=["precision", "latitude",
+            "longitude"])]
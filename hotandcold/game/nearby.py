@@ -0,0 +1,82 @@
+"""Nearby events used in game app.
+
+Used for finding the live events closest to a player. Live events are
+pre-filtered to a bounding box around the player, which can use the
+latitude/longitude index, and only those are ranked by exact distance.
+"""
+
+import heapq
+import math
+
+from django.utils import timezone
+
+from .chests import within_radius
+from .models import Event
+
+
+# Distance in metres to look for events within when none is given.
+DEFAULT_RADIUS = 50000
+
+# Largest distance in metres allowed to look for events within.
+MAX_RADIUS = 500000
+
+# Number of events to give when no limit is given.
+DEFAULT_LIMIT = 10
+
+
+def live_events_near(latitude, longitude, radius=DEFAULT_RADIUS,
+        limit=DEFAULT_LIMIT):
+    """Find the live events closest to a location.
+
+    Arguments:
+    latitude (float) - latitude of the location.
+    longitude (float) - longitude of the location.
+    radius (int) - maximum distance from the location in metres.
+    limit (int) - maximum number of events to give.
+
+    Returns:
+    events (list) - (event, distance in metres) of each event, closest
+    first.
+    """
+    now = timezone.now()
+    candidates = (Event.objects.filter(start__lte=now, end__gte=now)
+            .values_list("latitude", "longitude", "id"))
+
+    # Keep the closest, leaving the rest unsorted.
+    closest = heapq.nsmallest(limit, within_radius(candidates, latitude,
+        longitude, radius), key=lambda row: (row[3], row[2]))
+
+    # Read the whole rows of only the events being given.
+    events = Event.objects.in_bulk([row[2] for row in closest])
+    return [(events[row[2]], row[3]) for row in closest if row[2] in events]
+
+
+def parse_location(params):
+    """Parse a location from request parameters.
+
+    Arguments:
+    params (QueryDict) - parameters with "latitude" and "longitude", and
+    optionally "radius" in metres.
+
+    Returns:
+    latitude (float) - latitude of the location.
+    longitude (float) - longitude of the location.
+    radius (int) - distance to look within, at most MAX_RADIUS.
+
+    Raises:
+    ValueError - if the location is missing or not a real coordinate.
+    """
+    try:
+        latitude = float(params["latitude"])
+        longitude = float(params["longitude"])
+        radius = int(params.get("radius", DEFAULT_RADIUS))
+    except (KeyError, ValueError):
+        raise ValueError("Latitude and longitude are needed.")
+
+    if not (math.isfinite(latitude) and -90 <= latitude <= 90
+            and math.isfinite(longitude) and -180 <= longitude <= 180):
+        raise ValueError("Latitude and longitude are out of range.")
+    if radius < 1:
+        raise ValueError("Radius must be positive.")
+
+    return latitude, longitude, min(radius, MAX_RADIUS)
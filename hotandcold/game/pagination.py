@@ -0,0 +1,192 @@
+"""Keyset pagination used in game app.
+
+Used for paging through long lists without OFFSET, which makes the database
+read and throw away every row before the page. Instead, the ordering values
+of the last row on a page are encoded into an opaque cursor, and the next
+page is the rows ordered after it. With an index on the ordering, every page
+takes the same time however far into the list it is.
+
+The ordering must end with a unique field (such as "id") so that cursors
+are stable when other values are equal.
+"""
+
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# Number of rows on a page when no limit is given.
+DEFAULT_LIMIT = 20
+
+# Largest number of rows allowed on a page.
+MAX_LIMIT = 100
+
+
+def encode_value(value):
+    """Encode a value JSON cannot hold as a string.
+
+    Datetimes keep their microseconds, so no rows are skipped between pages.
+
+    Arguments:
+    value - datetime, date or Decimal.
+
+    Returns:
+    string (str) - the value as a string.
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError("Cannot encode {!r} in a cursor.".format(value))
+
+
+def encode_cursor(values):
+    """Encode the ordering values of a row into a cursor.
+
+    Arguments:
+    values (list) - values of the ordering fields.
+
+    Returns:
+    cursor (str) - URL safe cursor.
+    """
+    data = json.dumps(values, default=encode_value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, length):
+    """Decode a cursor into the ordering values of a row.
+
+    Arguments:
+    cursor (str) - cursor given by encode_cursor.
+    length (int) - number of ordering fields.
+
+    Returns:
+    values (list) - values of the ordering fields.
+
+    Raises:
+    ValueError - if the cursor is not valid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data.decode())
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor.")
+
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor.")
+
+    # Cursors only ever hold numbers, strings and nulls.
+    if not all(value is None or isinstance(value, (int, float, str))
+            for value in values):
+        raise ValueError("Invalid cursor.")
+
+    return values
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    """Parse the number of rows wanted on a page.
+
+    Arguments:
+    value (str) - limit given by the client, or None.
+    default (int) - limit used when none is given.
+
+    Returns:
+    limit (int) - number of rows, at most MAX_LIMIT.
+
+    Raises:
+    ValueError - if the limit is not a positive whole number.
+    """
+    if value is None:
+        return default
+
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("Limit must be a whole number.")
+    if limit < 1:
+        raise ValueError("Limit must be positive.")
+
+    return min(limit, MAX_LIMIT)
+
+
+def after(ordering, values):
+    """Return a filter for the rows ordered after a row.
+
+    For an ordering of (a, b, id), rows after (x, y, z) are those with
+    a > x, or a = x and b > y, or a = x and b = y and id > z, with the
+    comparisons reversed for descending fields.
+
+    Arguments:
+    ordering (list) - field names, starting with "-" for descending.
+    values (list) - values of the ordering fields of the row.
+
+    Returns:
+    filter (Q) - filter for the rows after it.
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "__lt" if field.startswith("-") else "__gt"
+        condition |= Q(**equal, **{name + lookup: value})
+        equal[name] = value
+
+    return condition
+
+
+def get_value(row, name):
+    """Return the value of a field of a row.
+
+    Arguments:
+    row - model instance or dictionary from .values().
+    name (str) - name of the field.
+
+    Returns:
+    value - value of the field.
+    """
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+def paginate(queryset, ordering, cursor=None, limit=DEFAULT_LIMIT):
+    """Return a page of a queryset.
+
+    Arguments:
+    queryset (QuerySet) - rows to page through, which may use .values() as
+    long as the ordering fields are included.
+    ordering (list) - field names, starting with "-" for descending, ending
+    with a unique field.
+    cursor (str) - cursor of the page, None for the first page.
+    limit (int) - number of rows on the page.
+
+    Returns:
+    rows (list) - rows on the page.
+    next_cursor (str) - cursor of the next page, None if this is the last.
+
+    Raises:
+    ValueError - if the cursor is not valid.
+    """
+    queryset = queryset.order_by(*ordering)
+
+    # Fetch one more row than needed to find out if there is a next page.
+    # Values in a tampered cursor may not fit the fields, which is found
+    # when filtering or running the query.
+    try:
+        if cursor:
+            queryset = queryset.filter(after(ordering,
+                decode_cursor(cursor, len(ordering))))
+        rows = list(queryset[:limit + 1])
+    except (TypeError, ValidationError):
+        raise ValueError("Invalid cursor.")
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor([get_value(rows[-1], field.lstrip("-"))
+        for field in ordering])
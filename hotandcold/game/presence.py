@@ -0,0 +1,107 @@
+"""Live presence used in game app.
+
+Used for counting the players active in each live event right now. The game
+page sends a heartbeat every HEARTBEAT_SECONDS while it is open, and a
+player is active in an event if they sent one in the last WINDOW_BUCKETS
+buckets of BUCKET_SECONDS.
+
+Counts are kept in the cache, with a counter for each event and time bucket.
+Each active player is counted in the bucket of their latest heartbeat only,
+moving to the new bucket on their first heartbeat in it, so the number of
+active players is the sum of the counters in the window. Every key expires
+on its own once it is out of the window, so nothing has to sweep them, and
+the counts of many events are read with one get_many.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+# Seconds in each time bucket.
+BUCKET_SECONDS = 15
+
+# Number of buckets a player stays active for after a heartbeat.
+WINDOW_BUCKETS = 4
+
+# Seconds between heartbeats sent by the game page.
+HEARTBEAT_SECONDS = BUCKET_SECONDS
+
+# Seconds to keep keys for, the window and the bucket being written.
+KEY_TIMEOUT = (WINDOW_BUCKETS + 1) * BUCKET_SECONDS
+
+
+def current_bucket():
+    """Return the number of the current time bucket.
+
+    Returns:
+    bucket (int) - number of buckets since the epoch.
+    """
+    return int(time.time() // BUCKET_SECONDS)
+
+
+def count_key(event_id, bucket):
+    """Return the cache key of the counter of an event in a bucket.
+
+    Arguments:
+    event_id (int) - ID of the Event.
+    bucket (int) - number of the bucket.
+
+    Returns:
+    key (str) - cache key.
+    """
+    return "presence:{}:{}".format(event_id, bucket)
+
+
+def heartbeat(event_id, player_id):
+    """Record that a player is active in an event.
+
+    Only the first heartbeat of a player in each bucket changes anything,
+    so heartbeats sent more often than once a bucket are cheap.
+
+    Arguments:
+    event_id (int) - ID of the Event being played.
+    player_id (int) - ID of the Player playing it.
+
+    Returns:
+    None.
+    """
+    bucket = current_bucket()
+    if not cache.add("presence:{}:{}:{}".format(event_id, bucket, player_id),
+            True, BUCKET_SECONDS):
+        return
+
+    # Count the player in this bucket.
+    key = count_key(event_id, bucket)
+    cache.add(key, 0, KEY_TIMEOUT)
+    cache.incr(key)
+
+    # Stop counting them in the bucket of their last heartbeat, unless it
+    # has already left the window.
+    player_key = "presence:{}:player:{}".format(event_id, player_id)
+    previous = cache.get(player_key)
+    cache.set(player_key, bucket, KEY_TIMEOUT)
+    if previous is not None and previous != bucket:
+        try:
+            cache.decr(count_key(event_id, previous))
+        except ValueError:
+            pass
+
+
+def get_counts(event_ids):
+    """Return the number of players active in events.
+
+    Arguments:
+    event_ids (list) - IDs of the Events.
+
+    Returns:
+    counts (dict) - event ID to number of active players.
+    """
+    bucket = current_bucket()
+    buckets = range(bucket - WINDOW_BUCKETS + 1, bucket + 1)
+    values = cache.get_many([count_key(event_id, window_bucket)
+        for event_id in event_ids for window_bucket in buckets])
+
+    return {event_id: max(0, sum(values.get(count_key(event_id,
+        window_bucket), 0) for window_bucket in buckets))
+        for event_id in event_ids}
@@ -0,0 +1,132 @@
+"""Cached profiles used in game app.
+
+Used for the user profile pages, which are linked from the leaderboards and
+read far more often than they change. The rendered details of each user are
+cached under a version number, which is increased whenever they change: when
+the user plays a game (see submissions.submit_game), loses an event win to
+another player (see stats.record_participation) or changes their email. A
+changed profile is then simply read from a new key, and old versions expire.
+
+Changes made in the admin dashboard show after PROFILE_TIMEOUT at most.
+"""
+
+import functools
+import hashlib
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.template.loader import render_to_string
+
+
+# Seconds to cache each rendered profile for.
+PROFILE_TIMEOUT = 10 * 60
+
+
+def user_key(username):
+    """Return a cache safe form of a username.
+
+    Usernames can have characters which memcached keys cannot.
+
+    Arguments:
+    username (str) - username of the user.
+
+    Returns:
+    key (str) - hex digest of the username.
+    """
+    return hashlib.md5(username.encode()).hexdigest()
+
+
+def version_key(username):
+    """Return the cache key of the profile version of a user.
+
+    Arguments:
+    username (str) - username of the user.
+
+    Returns:
+    key (str) - cache key.
+    """
+    return "profile_version:{}".format(user_key(username))
+
+
+def get_version(username):
+    """Return the profile version of a user.
+
+    A version which is not in the cache starts from the current time, so it
+    never matches a profile cached under an earlier version.
+
+    Arguments:
+    username (str) - username of the user.
+
+    Returns:
+    version (int) - profile version.
+    """
+    key = version_key(username)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+
+    return version
+
+
+def bump_version(username):
+    """Increase the profile version of a user after their profile changes.
+
+    Arguments:
+    username (str) - username of the user.
+
+    Returns:
+    None.
+    """
+    try:
+        cache.incr(version_key(username))
+    except ValueError:
+        # There is no version yet, so no profile is cached under it.
+        pass
+
+
+def bump_players(player_ids):
+    """Increase the profile versions of players once the change commits.
+
+    Arguments:
+    player_ids (iterable) - IDs of the Players whose profiles changed.
+
+    Returns:
+    None.
+    """
+    for username in User.objects.filter(player__in=list(player_ids)) \
+            .values_list("username", flat=True):
+        transaction.on_commit(functools.partial(bump_version, username))
+
+
+def get_profile_html(username):
+    """Return the rendered profile details of a user.
+
+    The user, player and statistics are read in one query from the primary
+    database on a cache miss, so a lagging replica cannot cache an old
+    profile under a new version.
+
+    Arguments:
+    username (str) - username of the user.
+
+    Returns:
+    html (str) - rendered details, None if there is no such user.
+    """
+    # Read the version before the profile, so the cached profile is never
+    # older than its version.
+    key = "profile:{}:{}".format(user_key(username), get_version(username))
+    html = cache.get(key)
+    if html is None:
+        user = (User.objects.using(DEFAULT_DB_ALIAS)
+                .select_related("player__stats")
+                .filter(username=username).first())
+        if user is None:
+            return None
+
+        html = render_to_string("game/profile_details.html",
+                {"show_user": user})
+        cache.set(key, html, PROFILE_TIMEOUT)
+
+    return html
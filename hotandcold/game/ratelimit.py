@@ -0,0 +1,170 @@
+"""Rate limiting used in game app.
+
+Used for stopping a single client from flooding expensive views (score
+submissions, logging in and registering) with token buckets kept in the
+configured cache.
+
+Each bucket holds up to `capacity` tokens and refills at `capacity / period`
+tokens a second. Every request takes a token and is rejected with a HTTP 429
+response when none are left. Buckets are kept per user and per IP address.
+Many players can share one IP address (behind a campus NAT, for example), so
+IP buckets have their own, larger capacity.
+
+Policies are configured with the RATELIMIT_POLICIES setting, a dictionary of
+policy name to (capacity per user, period in seconds, capacity per IP
+address), which must have every policy used.
+"""
+
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+def get_policy(name):
+    """Return the capacity and period of a policy.
+
+    Arguments:
+    name (str) - name of the policy.
+
+    Returns:
+    policy (tuple) - (capacity per user, period in seconds, capacity per IP
+    address).
+    """
+    return settings.RATELIMIT_POLICIES[name]
+
+
+def return_token(key):
+    """Give back a token taken from a bucket.
+
+    Arguments:
+    key (str) - cache key of the bucket.
+
+    Returns:
+    None.
+    """
+    try:
+        cache.decr(key + ":taken")
+    except ValueError:
+        pass
+
+
+def take_token(key, capacity, period):
+    """Take a token from a bucket.
+
+    The cache only offers atomic add and increment, so rather than storing
+    the number of tokens left, a bucket stores when it started and how many
+    tokens have been taken since. The tokens left are the capacity plus the
+    tokens refilled since the start, minus the tokens taken. Incrementing
+    the count is atomic, so concurrent requests can never take the same
+    token.
+
+    Arguments:
+    key (str) - cache key of the bucket.
+    capacity (int) - maximum number of tokens in the bucket.
+    period (int) - seconds taken to refill an empty bucket.
+
+    Returns:
+    wait (float) - 0 if a token was taken, otherwise the number of seconds
+    until one will be available.
+    """
+    now = time.time()
+    rate = capacity / period
+
+    # Buckets which have been full for a whole period are forgotten.
+    cache.add(key + ":start", now, period * 2)
+    cache.add(key + ":taken", 0, period * 2)
+    try:
+        taken = cache.incr(key + ":taken")
+    except ValueError:
+        # The bucket expired between adding and incrementing it.
+        cache.add(key + ":taken", 1, period * 2)
+        taken = 1
+    start = cache.get(key + ":start", now)
+
+    # Work out the tokens left after this request.
+    left = capacity + (now - start) * rate - taken
+    if left < 0:
+        # Give the token back, rejected requests do not use one up.
+        return_token(key)
+        return (-left) / rate
+
+    # Tokens past the capacity are lost, so move the start forward to keep
+    # a full bucket from growing. Another request could do the same at the
+    # same time, which only makes the bucket slightly stricter.
+    if left > capacity - 1:
+        cache.set(key + ":start", now - (taken - 1) / rate, period * 2)
+    else:
+        cache.touch(key + ":start", period * 2)
+    cache.touch(key + ":taken", period * 2)
+
+    return 0
+
+
+def get_client_ip(request):
+    """Return the IP address of the client making a request.
+
+    App Engine gives the client address in X-Appengine-User-IP, which
+    clients cannot set themselves. Otherwise the address the request came
+    from is used.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    ip (str) - IP address of the client.
+    """
+    return request.META.get("HTTP_X_APPENGINE_USER_IP",
+            request.META.get("REMOTE_ADDR", ""))
+
+
+def ratelimit(policy, methods=("POST",)):
+    """Decorator for rate limiting a view.
+
+    Requests are checked against a bucket for the user, if they are logged
+    in, then a bucket for the IP address. A request rejected by either gets
+    a HTTP 429 response before the view runs, and uses up no token from
+    either bucket.
+
+    Arguments:
+    policy (str) - name of the policy to use.
+    methods (tuple) - HTTP methods which are rate limited.
+
+    Returns:
+    decorator - function wrapping the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if request.method in methods:
+                capacity, period, ip_capacity = get_policy(policy)
+
+                # Take a token for the user first, so a user who is limited
+                # does not use up the tokens of their IP address.
+                user_key = None
+                wait = 0
+                if request.user.is_authenticated:
+                    user_key = "ratelimit:{}:user:{}".format(policy,
+                            request.user.pk)
+                    wait = take_token(user_key, capacity, period)
+
+                if not wait:
+                    wait = take_token("ratelimit:{}:ip:{}".format(policy,
+                        get_client_ip(request)), ip_capacity, period)
+                    if wait and user_key is not None:
+                        return_token(user_key)
+
+                if wait:
+                    response = HttpResponse("Too many requests, please try "
+                            "again later.", status=429)
+                    response["Retry-After"] = str(math.ceil(wait))
+                    return response
+
+            return view(request, *args, **kwargs)
+
+        return wrapped_view
+
+    return decorator
@@ -0,0 +1,152 @@
+"""Points reconciliation used in game app.
+
+Used for finding and fixing players whose points total has drifted from the
+scores of their games, such as after a crash part way through saving a game
+or a change made by hand (see the reconcile_points command).
+
+The totals of every player are worked out with one grouped query on each of
+the current and archived games, which only read the (player, score) index,
+and streamed in player order alongside the players. No rows are locked
+while scanning, so it can read from a replica, and games saved meanwhile
+can make players look wrong when they are not. Players which look wrong are
+therefore checked again on the primary, a chunk at a time, with their rows
+locked only for as long as it takes to check and fix that chunk.
+"""
+
+import heapq
+import itertools
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Sum
+
+from .models import ArchivedParticipation, Participation, Player
+from .profiles import bump_version
+from .routers import get_replica
+
+
+# How far the points of the players were from their games: the number of
+# players checked, wrong and corrected, the total of the differences (points
+# minus scores), the total of their sizes and the largest size.
+Drift = namedtuple("Drift", ["players", "mismatched", "fixed", "total",
+    "absolute", "largest"])
+
+
+def stream_totals(using, chunk_size, player_ids=None):
+    """Stream the total score of every player with games, in player order.
+
+    Arguments:
+    using (str) - alias of the database to read.
+    chunk_size (int) - number of rows to fetch at a time.
+    player_ids (list) - only total these players, None for every player.
+
+    Returns:
+    totals (generator) - (player ID, total score) of each player.
+    """
+    streams = []
+    for model in (Participation, ArchivedParticipation):
+        games = model.objects.using(using)
+        if player_ids is not None:
+            games = games.filter(player_id__in=player_ids)
+        streams.append(games.values_list("player_id").annotate(Sum("score"))
+                .order_by("player_id").iterator(chunk_size=chunk_size))
+
+    # Add up the totals of the same player in both tables.
+    for player_id, rows in itertools.groupby(heapq.merge(*streams),
+            key=lambda row: row[0]):
+        yield player_id, sum(total for _, total in rows)
+
+
+def find_mismatches(using, chunk_size):
+    """Find the players whose points look different to their total score.
+
+    Arguments:
+    using (str) - alias of the database to read.
+    chunk_size (int) - number of rows to fetch at a time.
+
+    Returns:
+    player_ids (list) - IDs of the players which look wrong.
+    players (int) - number of players checked.
+    """
+    totals = stream_totals(using, chunk_size)
+    player_id, total = next(totals, (None, 0))
+
+    # Both streams are in player order, so walk through them together.
+    mismatches = []
+    players = 0
+    for pk, points in (Player.objects.using(using).order_by("id")
+            .values_list("id", "points").iterator(chunk_size=chunk_size)):
+        players += 1
+        while player_id is not None and player_id < pk:
+            player_id, total = next(totals, (None, 0))
+
+        expected = total if player_id == pk else 0
+        if points != expected:
+            mismatches.append(pk)
+
+    return mismatches, players
+
+
+def fix_chunk(player_ids, apply, chunk_size):
+    """Check players again on the primary and fix their points.
+
+    Arguments:
+    player_ids (list) - IDs of the players which look wrong.
+    apply (bool) - True to save the corrected points.
+    chunk_size (int) - number of rows to fetch at a time.
+
+    Returns:
+    differences (dict) - player ID to points minus total score of each
+    player which is wrong.
+    """
+    with transaction.atomic():
+        # Lock the players, so no game can change them until the end of the
+        # chunk.
+        players = list(Player.objects.select_for_update()
+                .filter(pk__in=player_ids).only("id", "points"))
+        totals = dict(stream_totals(DEFAULT_DB_ALIAS, chunk_size,
+            player_ids))
+
+        differences = {}
+        wrong = []
+        for player in players:
+            expected = totals.get(player.id, 0)
+            if player.points != expected:
+                differences[player.id] = player.points - expected
+                player.points = expected
+                wrong.append(player)
+
+        if apply:
+            Player.objects.bulk_update(wrong, ["points"])
+
+    return differences
+
+
+def reconcile_points(apply=False, chunk_size=1000):
+    """Check the points of every player against the scores of their games.
+
+    Arguments:
+    apply (bool) - True to correct the points which are wrong.
+    chunk_size (int) - number of players to check and fix at a time.
+
+    Returns:
+    drift (Drift) - how far the points were from the games.
+    """
+    mismatches, players = find_mismatches(get_replica(), chunk_size)
+
+    differences = []
+    for start in range(0, len(mismatches), chunk_size):
+        chunk = fix_chunk(mismatches[start:start + chunk_size], apply,
+                chunk_size)
+        differences += chunk.values()
+
+        # Stop showing the old points on the profiles of the players fixed.
+        if apply:
+            for username in User.objects.filter(player__in=list(chunk)) \
+                    .values_list("username", flat=True):
+                bump_version(username)
+
+    sizes = [abs(difference) for difference in differences]
+    return Drift(players, len(differences), len(differences) if apply else 0,
+            sum(differences), sum(sizes), max(sizes, default=0))
@@ -0,0 +1,190 @@
+"""Database routing used in game app.
+
+Used for sending the queries of read-only views to read replicas of the
+database. Views decorated with @use_replica read from a replica picked at
+random by weight, everything else uses the primary ("default") database.
+
+Replicas lag behind the primary, so a client which has just written is
+pinned to the primary. Once a request writes, the rest of it reads from the
+primary, and the PrimaryPinMiddleware sets a short lived cookie sending the
+next requests of the client to the primary too.
+
+Replicas are configured with the DATABASE_REPLICAS setting, a dictionary of
+database alias to weight. With no replicas every query uses the primary.
+
+Real replicas are copies kept up to date by the database server, marked
+as mirrors of the primary with {"TEST": {"MIRROR": "default"}} in their
+DATABASES entry, and are never migrated. Replicas which are separate
+databases, such as SQLite files for trying replicas locally, are migrated
+with "migrate --database <alias>", and their data has to be copied from
+the primary (for example with dumpdata and loaddata --database <alias>).
+"""
+
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Name of the cookie pinning a client to the primary.
+PIN_COOKIE = "pin_primary"
+
+# Seconds to pin a client to the primary for after it writes, used when
+# it is not in the REPLICA_PIN_SECONDS setting.
+PIN_SECONDS = 5
+
+# Whether the current request may read from a replica.
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+
+# Whether the current request has written to the primary.
+_written = contextvars.ContextVar("written", default=False)
+
+
+def get_replica():
+    """Pick a replica at random by weight.
+
+    Returns:
+    alias (str) - alias of the replica, or the primary if there are none.
+    """
+    replicas = getattr(settings, "DATABASE_REPLICAS", {})
+    if not replicas:
+        return DEFAULT_DB_ALIAS
+
+    aliases = list(replicas)
+    return random.choices(aliases, weights=[replicas[alias]
+        for alias in aliases])[0]
+
+
+def use_replica(view):
+    """Decorator for sending the reads of a read-only view to a replica.
+
+    Requests from pinned clients and requests which are not GET or HEAD
+    still use the primary.
+
+    Arguments:
+    view - view function to decorate.
+
+    Returns:
+    wrapped_view - the decorated view.
+    """
+    @functools.wraps(view)
+    def wrapped_view(request, *args, **kwargs):
+        if (request.method not in ("GET", "HEAD")
+                or request.COOKIES.get(PIN_COOKIE)):
+            return view(request, *args, **kwargs)
+
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+
+    return wrapped_view
+
+
+class ReplicaRouter:
+    """Router sending reads to replicas when the view allows it."""
+
+    def db_for_read(self, model, **hints):
+        """Return the database to read a model from.
+
+        Arguments:
+        model - model class being read.
+        hints - extra information about the query.
+
+        Returns:
+        alias (str) - database alias to use.
+        """
+        # Keep to the primary after writing or inside a transaction, where
+        # a replica would not see the changes.
+        if (not _use_replica.get() or _written.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        """Return the database to write a model to.
+
+        Arguments:
+        model - model class being written.
+        hints - extra information about the query.
+
+        Returns:
+        alias (str) - the primary database alias.
+        """
+        _written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations between objects on the primary and replicas.
+
+        Arguments:
+        obj1 - first model instance.
+        obj2 - second model instance.
+        hints - extra information about the relation.
+
+        Returns:
+        allow (bool) - True, as every database holds the same data.
+        """
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate the primary and replicas which are separate databases.
+
+        Mirrors of the primary copy its schema from it.
+
+        Arguments:
+        db (str) - database alias being migrated.
+        app_label (str) - app label of the model.
+        model_name (str) - name of the model.
+        hints - extra information about the migration.
+
+        Returns:
+        allow (bool) - True for the primary database and replicas which
+        are not mirrors of it.
+        """
+        if db == DEFAULT_DB_ALIAS:
+            return True
+
+        mirror = settings.DATABASES.get(db, {}).get("TEST", {}).get("MIRROR")
+        return (db in getattr(settings, "DATABASE_REPLICAS", {})
+                and mirror != DEFAULT_DB_ALIAS)
+
+
+class PrimaryPinMiddleware:
+    """Middleware pinning clients which write to the primary database."""
+
+    def __init__(self, get_response):
+        """Create the middleware.
+
+        Arguments:
+        get_response - next middleware or view.
+        """
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Handle a request, pinning the client if it wrote.
+
+        Arguments:
+        request - Django object containing request information.
+
+        Returns:
+        response - Django HTTP response.
+        """
+        token = _written.set(False)
+        try:
+            response = self.get_response(request)
+            written = _written.get()
+        finally:
+            _written.reset(token)
+
+        # Give the replicas time to catch up before reading from them.
+        if written or request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(PIN_COOKIE, "1",
+                    max_age=getattr(settings, "REPLICA_PIN_SECONDS",
+                        PIN_SECONDS), httponly=True, samesite="Lax")
+
+        return response
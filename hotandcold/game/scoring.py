@@ -0,0 +1,189 @@
+"""Scoring rules used in game app.
+
+Reproduces the rules of the game in game.html from the sequence of positions
+a player pressed the button at, so that scores can be worked out (and
+re-worked out) on the server.
+
+The rules are:
+- The score starts at START_SCORE.
+- Every press of the button loses CLICK_PENALTY of the current score.
+- Being within the collection range of an unclaimed treasure chest adds its
+  points to the score.
+- The game finishes when the player is within FINISH_DEGREES of the event.
+"""
+
+import json
+import math
+from collections import namedtuple
+
+from .geo import haversine, js_round
+
+
+# Score a player starts a game with.
+START_SCORE = 1000
+
+# Fraction of the score lost on every press of the button.
+CLICK_PENALTY = 0.1
+
+# Default size of the playing area in metres.
+GAME_BOUND = 1000
+
+# Degrees needed to finish the game and to collect a treasure chest.
+FINISH_DEGREES = 96
+CHEST_DEGREES = 96
+
+# Result of scoring a single game session.
+SessionResult = namedtuple("SessionResult",
+        ["score", "clicks", "finished", "claimed"])
+
+
+def calc_degrees(distance, game_bound=GAME_BOUND):
+    """Return the "degrees" for a distance from a point.
+
+    Arguments:
+    distance (int) - distance from the point in metres.
+    game_bound (int) - size of the playing area in metres.
+
+    Returns:
+    degrees (float) - temperature between 0 (cold) and 100 (hot).
+    """
+    if distance > game_bound:
+        return 0
+    else:
+        return 100 - ((distance / game_bound) * 100)
+
+
+def parse_pings(data):
+    """Parse the JSON list of positions submitted with a game.
+
+    Arguments:
+    data (str) - JSON list of [latitude, longitude] pairs.
+
+    Returns:
+    pings (list) - list of (latitude, longitude) tuples, empty if the data
+    is missing or malformed.
+    """
+    try:
+        pings = [(float(lat), float(lng)) for lat, lng in json.loads(data)]
+    except (TypeError, ValueError):
+        return []
+
+    # Ignore anything that is not a real coordinate.
+    if not all(math.isfinite(lat) and math.isfinite(lng)
+            for lat, lng in pings):
+        return []
+
+    return pings
+
+
+class EventScorer:
+    """Scorer for games played in a single event.
+
+    The destination and treasure chests are converted to radians once when
+    the scorer is created, so scoring many sessions of the same event (see
+    score_sessions) only has to do the trigonometry for the pings.
+    """
+
+    def __init__(self, destination, chests, game_bound=GAME_BOUND):
+        """Create the scorer.
+
+        Arguments:
+        destination (tuple) - (latitude, longitude) of the event.
+        chests (iterable) - (id, latitude, longitude, points) of each
+        treasure chest in play.
+        game_bound (int) - size of the playing area in metres.
+        """
+        self.game_bound = game_bound
+        self.destination = self._to_radians(*destination)
+        self.chests = [(chest_id,) + self._to_radians(lat, lng) + (points,)
+                for chest_id, lat, lng, points in chests]
+
+    @staticmethod
+    def _to_radians(lat, lng):
+        """Return (latitude, longitude, cos(latitude)) in radians."""
+        lat = math.radians(float(lat))
+        return (lat, math.radians(float(lng)), math.cos(lat))
+
+    def score(self, pings, seen=()):
+        """Score a single game session.
+
+        Arguments:
+        pings (iterable) - (latitude, longitude) of each button press.
+        seen (iterable) - IDs of treasure chests which cannot be claimed.
+
+        Returns:
+        result (SessionResult) - final score, number of presses, whether the
+        destination was reached and the IDs of claimed treasure chests.
+        """
+        score = START_SCORE
+        clicks = 0
+        finished = False
+        seen = set(seen)
+        claimed = []
+
+        for ping in pings:
+            clicks += 1
+            position = self._to_radians(*ping)
+
+            # Degrees from the destination.
+            degrees = calc_degrees(haversine(*position, *self.destination),
+                    self.game_bound)
+
+            # Lose a fraction of the score on every press.
+            score -= js_round(score * CLICK_PENALTY)
+
+            # Find the closest treasure chest which has not been claimed.
+            closest_distance = math.inf
+            closest_chest = None
+            for chest in self.chests:
+                if chest[0] in seen:
+                    continue
+                distance = haversine(*position, *chest[1:4])
+                if distance < closest_distance:
+                    closest_distance = distance
+                    closest_chest = chest
+
+            # Claim it if it is close enough.
+            if (closest_chest is not None and calc_degrees(closest_distance,
+                    self.game_bound) > CHEST_DEGREES):
+                score += closest_chest[4]
+                seen.add(closest_chest[0])
+                claimed.append(closest_chest[0])
+
+            # Reaching the destination ends the game.
+            if degrees > FINISH_DEGREES:
+                finished = True
+                break
+
+        return SessionResult(score, clicks, finished, claimed)
+
+    def score_sessions(self, sessions):
+        """Score a batch of game sessions.
+
+        Arguments:
+        sessions (iterable) - list of pings for each session.
+
+        Returns:
+        results (list) - SessionResult for each session, in order.
+        """
+        return [self.score(pings) for pings in sessions]
+
+
+def score_session(pings, destination, chests, game_bound=GAME_BOUND,
+        seen=()):
+    """Score a single game session.
+
+    Shortcut for creating an EventScorer and scoring one session with it.
+
+    Arguments:
+    pings (iterable) - (latitude, longitude) of each button press.
+    destination (tuple) - (latitude, longitude) of the event.
+    chests (iterable) - (id, latitude, longitude, points) of each treasure
+    chest in play.
+    game_bound (int) - size of the playing area in metres.
+    seen (iterable) - IDs of treasure chests which cannot be claimed.
+
+    Returns:
+    result (SessionResult) - see EventScorer.score.
+    """
+    return EventScorer(destination, chests, game_bound).score(pings, seen)
@@ -0,0 +1,269 @@
+"""Event search used in game app.
+
+Used for finding events by the words in their title and description,
+ranked by relevance and paged with cursors (see pagination.py).
+
+On MySQL, searches use the FULLTEXT index on the title and description
+(see migration 0012), which the database keeps up to date itself. Other
+databases, such as SQLite in development, use an inverted index kept in
+memory by each process instead. It is built from the database on the first
+search, and updated when an Event is saved or deleted (see signals.py). A
+counter in the cache tells other processes to rebuild theirs.
+
+The in-memory index ranks events with BM25, counting words in the title
+twice.
+"""
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Event
+from .pagination import decode_cursor, encode_cursor, paginate
+
+
+# Cache key of the counter increased whenever an Event changes.
+GENERATION_KEY = "search:generation"
+
+# Columns read for each event in the results.
+RESULT_COLUMNS = ["id", "title", "description", "start", "end"]
+
+# BM25 term frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Times a word in the title counts for.
+TITLE_WEIGHT = 2
+
+# Relevance of MySQL's FULLTEXT index for a search.
+MYSQL_RANK = ("MATCH (title, description) AGAINST (%s IN NATURAL LANGUAGE "
+        "MODE)")
+
+
+def tokenize(text):
+    """Split text into lower case words.
+
+    Arguments:
+    text (str) - text to split.
+
+    Returns:
+    words (list) - words of two or more letters or digits.
+    """
+    return [word for word in re.findall(r"\w+", text.lower())
+            if len(word) > 1]
+
+
+class InvertedIndex:
+    """In-memory inverted index of event titles and descriptions."""
+
+    def __init__(self, generation=0):
+        """Create an empty index.
+
+        Arguments:
+        generation (int) - value of the generation counter it was built at.
+        """
+        self.generation = generation
+        self.postings = defaultdict(dict)
+        self.words = {}
+        self.lengths = {}
+        self.total_length = 0
+
+    def add(self, event_id, title, description):
+        """Add an event, replacing it if it is already in the index.
+
+        Arguments:
+        event_id (int) - ID of the Event.
+        title (str) - title of the Event.
+        description (str) - description of the Event.
+
+        Returns:
+        None.
+        """
+        self.remove(event_id)
+
+        counts = Counter(tokenize(description))
+        for word in tokenize(title):
+            counts[word] += TITLE_WEIGHT
+
+        for word, count in counts.items():
+            self.postings[word][event_id] = count
+        self.words[event_id] = list(counts)
+        self.lengths[event_id] = sum(counts.values())
+        self.total_length += self.lengths[event_id]
+
+    def remove(self, event_id):
+        """Remove an event from the index.
+
+        Arguments:
+        event_id (int) - ID of the Event.
+
+        Returns:
+        None.
+        """
+        if event_id not in self.lengths:
+            return
+
+        self.total_length -= self.lengths.pop(event_id)
+        for word in self.words.pop(event_id):
+            postings = self.postings[word]
+            del postings[event_id]
+            if not postings:
+                del self.postings[word]
+
+    def search(self, query):
+        """Rank the events matching any word of a query.
+
+        Arguments:
+        query (str) - words to search for.
+
+        Returns:
+        results (list) - (score, event ID) of each match, best first.
+        """
+        if not self.lengths:
+            return []
+
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1
+
+        scores = defaultdict(float)
+        for word in set(tokenize(query)):
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+
+            # Rarer words are worth more.
+            idf = math.log(1 + (count - len(postings) + 0.5)
+                    / (len(postings) + 0.5))
+            for event_id, frequency in postings.items():
+                length = self.lengths[event_id] / average_length
+                scores[event_id] += idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length))
+
+        return sorted(((score, event_id) for event_id, score
+            in scores.items()), key=lambda result: (-result[0], result[1]))
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def uses_fulltext():
+    """Return whether the database has a FULLTEXT index to search.
+
+    Returns:
+    fulltext (bool) - True on MySQL.
+    """
+    return connection.vendor == "mysql"
+
+
+def get_generation():
+    """Return the generation counter, shared by every process.
+
+    Returns:
+    generation (int) - number of changes to Events.
+    """
+    return cache.get_or_set(GENERATION_KEY, 0, None)
+
+
+def get_index():
+    """Return the in-memory index, building it if it is out of date.
+
+    Returns:
+    index (InvertedIndex) - the up to date index.
+    """
+    global _index
+
+    generation = get_generation()
+    with _lock:
+        if _index is None or _index.generation != generation:
+            index = InvertedIndex(generation)
+            for row in (Event.objects.values_list("id", "title",
+                    "description").iterator(chunk_size=2000)):
+                index.add(*row)
+            _index = index
+
+        return _index
+
+
+def event_changed(event_id, title=None, description=None):
+    """Update the in-memory index after an Event is saved or deleted.
+
+    Other processes see the generation counter change and rebuild theirs.
+
+    Arguments:
+    event_id (int) - ID of the Event.
+    title (str) - new title, None if the Event was deleted.
+    description (str) - new description.
+
+    Returns:
+    None.
+    """
+    if uses_fulltext():
+        return
+
+    previous = get_generation()
+    try:
+        generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        generation = None
+
+    with _lock:
+        if _index is None:
+            return
+
+        if title is None:
+            _index.remove(event_id)
+        else:
+            _index.add(event_id, title, description)
+
+        # Keep using the index if no other change was missed.
+        if _index.generation == previous and generation == previous + 1:
+            _index.generation = generation
+
+
+def search_events(query, cursor=None, limit=20):
+    """Search events by title and description.
+
+    Arguments:
+    query (str) - words to search for.
+    cursor (str) - cursor of the page, None for the first page.
+    limit (int) - number of events on the page.
+
+    Returns:
+    events (list) - Events on the page, most relevant first.
+    next_cursor (str) - cursor of the next page, None if this is the last.
+
+    Raises:
+    ValueError - if the cursor is not valid.
+    """
+    events = Event.objects.only(*RESULT_COLUMNS)
+
+    if uses_fulltext():
+        events = events.annotate(rank=RawSQL(MYSQL_RANK, (query,))) \
+                .filter(rank__gt=0)
+        return paginate(events, ["-rank", "id"], cursor, limit)
+
+    # Skip the results up to the cursor.
+    results = get_index().search(query)
+    if cursor:
+        rank, event_id = decode_cursor(cursor, 2)
+        try:
+            results = [result for result in results
+                    if (-result[0], result[1]) > (-rank, event_id)]
+        except TypeError:
+            raise ValueError("Invalid cursor.")
+
+    page = results[:limit]
+    found = events.in_bulk([event_id for _, event_id in page])
+    events = [found[event_id] for _, event_id in page if event_id in found]
+
+    next_cursor = None
+    if len(results) > limit:
+        next_cursor = encode_cursor(list(page[-1]))
+
+    return events, next_cursor
@@ -0,0 +1,117 @@
+"""Signal receivers used in game app.
+
+Used for keeping precomputed data up to date when models are saved, no
+matter whether that happens in a view or the admin dashboard.
+"""
+
+import functools
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, \
+    pre_save
+from django.dispatch import receiver
+
+from . import search
+from .caches import clear_live_events
+from .chests import bump_chest_versions, update_chest_events, \
+    update_event_chests
+from .clusters import update_clusters
+from .models import Event, EventChest, TreasureChest
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, raw=False, **kwargs):
+    """Update the chests in play, live events and search for a saved Event.
+
+    Arguments:
+    sender - Event model class.
+    instance (Event) - Event which was saved.
+    raw (bool) - True if the Event is being loaded from a fixture.
+
+    Returns:
+    None.
+    """
+    if not raw:
+        update_event_chests(instance)
+    clear_live_events()
+
+    # Searches in other processes must not see the change before it is
+    # committed.
+    transaction.on_commit(functools.partial(search.event_changed,
+        instance.id, instance.title, instance.description))
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    """Remove a deleted Event from the cached live events and search.
+
+    Arguments:
+    sender - Event model class.
+    instance (Event) - Event which was deleted.
+
+    Returns:
+    None.
+    """
+    clear_live_events()
+    transaction.on_commit(functools.partial(search.event_changed,
+        instance.id))
+
+
+@receiver(pre_save, sender=TreasureChest)
+def treasure_chest_saving(sender, instance, raw=False, **kwargs):
+    """Remember where a TreasureChest was before it is saved.
+
+    Arguments:
+    sender - TreasureChest model class.
+    instance (TreasureChest) - TreasureChest being saved.
+    raw (bool) - True if the TreasureChest is being loaded from a fixture.
+
+    Returns:
+    None.
+    """
+    instance.previous_cluster_row = None
+    if not raw and instance.pk is not None:
+        instance.previous_cluster_row = (TreasureChest.objects
+                .filter(pk=instance.pk)
+                .values_list("latitude", "longitude", "points").first())
+
+
+@receiver(post_save, sender=TreasureChest)
+def treasure_chest_saved(sender, instance, raw=False, **kwargs):
+    """Update the events a TreasureChest is in play for and its clusters.
+
+    Arguments:
+    sender - TreasureChest model class.
+    instance (TreasureChest) - TreasureChest which was saved.
+    raw (bool) - True if the TreasureChest is being loaded from a fixture.
+
+    Returns:
+    None.
+    """
+    if not raw:
+        update_chest_events(instance)
+
+        previous = getattr(instance, "previous_cluster_row", None)
+        update_clusters(removed=[previous] if previous else [],
+                added=[(instance.latitude, instance.longitude,
+                    instance.points)])
+
+
+@receiver(pre_delete, sender=TreasureChest)
+def treasure_chest_deleted(sender, instance, **kwargs):
+    """Update the events and clusters a TreasureChest is removed from.
+
+    Arguments:
+    sender - TreasureChest model class.
+    instance (TreasureChest) - TreasureChest being deleted.
+
+    Returns:
+    None.
+    """
+    event_ids = list(EventChest.objects.filter(treasure_chest=instance)
+            .values_list("event_id", flat=True))
+    if event_ids:
+        bump_chest_versions(event_ids, EventChest.objects.none())
+
+    update_clusters(removed=[(instance.latitude, instance.longitude,
+        instance.points)])
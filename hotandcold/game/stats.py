@@ -0,0 +1,222 @@
+"""Player statistics used in game app.
+
+Used for keeping the PlayerStats of each player up to date. Statistics are
+updated with every game in the same transaction as the Participation, and
+can be rebuilt from scratch with the rebuild_player_stats command.
+
+The top score of an Event wins it, with ties going to whoever got there
+first. The top score and winner are kept on the Event, and only a game
+which beats the top score changes them, with a conditional UPDATE, so games
+which do not (nearly all of them) read the Event without locking it.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, \
+    Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import profiles
+from .models import ArchivedEvent, ArchivedParticipation, Event, \
+    Participation, PlayerStats
+
+
+def record_participation(participation):
+    """Update statistics with a new game.
+
+    Must be called in the transaction which saved the Participation.
+
+    Arguments:
+    participation (Participation) - the new Participation.
+
+    Returns:
+    None.
+    """
+    score = participation.score
+
+    with transaction.atomic():
+        # Update the statistics of the player.
+        PlayerStats.objects.get_or_create(player_id=participation.player_id)
+        PlayerStats.objects.filter(pk=participation.player_id).update(
+                games_played=F("games_played") + 1,
+                total_score=F("total_score") + score,
+                best_score=Greatest(Coalesce("best_score", Value(score)),
+                    Value(score)),
+                last_played=participation.created)
+
+        # Move the win to this player if they beat the top score.
+        previous_player = take_win(participation)
+        if previous_player is None or \
+                previous_player == participation.player_id:
+            return
+
+        PlayerStats.objects.filter(pk=participation.player_id).update(
+                events_won=F("events_won") + 1)
+        if previous_player:
+            PlayerStats.objects.filter(pk=previous_player).update(
+                    events_won=F("events_won") - 1)
+
+            # Stop showing the cached profile of the previous winner.
+            profiles.bump_players([previous_player])
+
+
+def take_win(participation):
+    """Make a game the winner of its Event if it beats the top score.
+
+    The top score is read without a lock, and only replaced if it has not
+    changed since, so that nothing waits on the Event row unless it is
+    winning it. Read committed isolation (the Django default on MySQL)
+    gives each read the latest top score.
+
+    Arguments:
+    participation (Participation) - the new Participation.
+
+    Returns:
+    previous_player - ID of the Player who was winning, 0 if nobody had
+    played the Event, or None if the game did not win it.
+    """
+    events = Event.objects.filter(pk=participation.event_id)
+    while True:
+        top_score, winner = events.values_list("top_score", "winner").get()
+        if top_score is not None and participation.score <= top_score:
+            return None
+
+        # Replace the top score, unless another game has just replaced it.
+        won = events.filter(Q(top_score=top_score) if top_score is not None
+                else Q(top_score__isnull=True)).update(
+                        top_score=participation.score,
+                        winner=participation.player_id)
+        if won:
+            return winner or 0
+
+
+def adjust_stats(changes):
+    """Apply changes to games already counted to the statistics.
+
+    The best score and last game cannot be worked back from a change, so
+    they are found again from the games of the players changed.
+
+    Arguments:
+    changes (list) - GameChange of each game (see adjustments.py).
+
+    Returns:
+    None.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for change in changes:
+        totals[change.player_id][0] += change.score
+        totals[change.player_id][1] += change.games
+
+    # Best score and last game of each player, from both tables.
+    latest = {player_id: [None, None] for player_id in totals}
+    for participation_model in (Participation, ArchivedParticipation):
+        for row in (participation_model.objects
+                .filter(player_id__in=list(totals)).values("player_id")
+                .annotate(best=Max("score"), last=Max("created"))
+                .order_by()):
+            for index, value in enumerate((row["best"], row["last"])):
+                values = [value, latest[row["player_id"]][index]]
+                latest[row["player_id"]][index] = max([value
+                    for value in values if value is not None], default=None)
+
+    for player_id, (score, games) in totals.items():
+        PlayerStats.objects.filter(pk=player_id).update(
+                total_score=F("total_score") + score,
+                games_played=F("games_played") + games,
+                best_score=latest[player_id][0],
+                last_played=latest[player_id][1])
+
+
+def update_winners(event_ids):
+    """Find the winners of Events again after their scores have changed.
+
+    The Events are locked, so no new game can take a win meanwhile.
+
+    Arguments:
+    event_ids (list) - IDs of the Events.
+
+    Returns:
+    None.
+    """
+    with transaction.atomic():
+        events = Event.objects.select_for_update().filter(pk__in=event_ids)
+        before = dict(events.values_list("id", "winner"))
+
+        top = Participation.objects.filter(event=OuterRef("pk")) \
+                .order_by("-score", "id")
+        events.update(top_score=Subquery(top.values("score")[:1]),
+                winner=Subquery(top.values("player_id")[:1]))
+
+        # Move the wins which changed hands.
+        won = Counter()
+        for event_id, winner in events.values_list("id", "winner"):
+            if winner != before[event_id]:
+                won[winner] += 1
+                won[before[event_id]] -= 1
+        won.pop(None, None)
+
+        for player_id, count in won.items():
+            if count:
+                PlayerStats.objects.filter(pk=player_id).update(
+                        events_won=F("events_won") + count)
+        profiles.bump_players(won)
+
+
+def rebuild_stats(chunk_size=1000):
+    """Rebuild every PlayerStats from the Participations.
+
+    Uses one grouped query for the game statistics and one for the winners
+    of every Event, for both the current and the archived games.
+
+    Arguments:
+    chunk_size (int) - number of rows to create at a time.
+
+    Returns:
+    count (int) - number of PlayerStats rebuilt.
+    """
+    stats = {}
+    for event_model, participation_model in ((Event, Participation),
+            (ArchivedEvent, ArchivedParticipation)):
+        # Game statistics of every player, added to the other table's.
+        games = (participation_model.objects.values("player_id")
+                .annotate(games=Count("id"), total=Sum("score"),
+                    best=Max("score"), last=Max("created"))
+                .order_by())
+        for row in games.iterator():
+            player_stats = stats.get(row["player_id"])
+            if player_stats is None:
+                stats[row["player_id"]] = PlayerStats(
+                        player_id=row["player_id"], games_played=row["games"],
+                        total_score=row["total"], best_score=row["best"],
+                        last_played=row["last"])
+                continue
+
+            player_stats.games_played += row["games"]
+            player_stats.total_score += row["total"]
+            player_stats.best_score = max(player_stats.best_score,
+                    row["best"])
+            player_stats.last_played = max([last for last in (
+                player_stats.last_played, row["last"]) if last is not None],
+                default=None)
+
+        # Winner of every event, the first of the top scores.
+        winners = participation_model.objects.filter(event=OuterRef("pk")) \
+                .order_by("-score", "id").values("player_id")[:1]
+        for row in (event_model.objects
+                .annotate(top_player=Subquery(winners))
+                .filter(top_player__isnull=False).values("top_player")
+                .annotate(won=Count("id")).order_by()):
+            stats[row["top_player"]].events_won += row["won"]
+
+    with transaction.atomic():
+        PlayerStats.objects.all().delete()
+        PlayerStats.objects.bulk_create(stats.values(), batch_size=chunk_size)
+
+        # Keep the top score and winner of every Event the same.
+        top = Participation.objects.filter(event=OuterRef("pk")) \
+                .order_by("-score", "id")
+        Event.objects.update(top_score=Subquery(top.values("score")[:1]),
+                winner=Subquery(top.values("player_id")[:1]))
+
+    return len(stats)
@@ -0,0 +1,219 @@
+"""Game submissions used in game app.
+
+Used for saving a finished game, shared by the game view and the JSON API.
+Games from clients are always scored on the server from the positions the
+button was pressed at, so they must include them, and new ones are only
+saved while their event is live.
+Everything a game changes (points, treasure chests, statistics, team scores
+and leaderboards) is saved in one transaction, which also queues adding it to
+the heatmap.
+
+Games can be submitted with an idempotency key, issued with the game page
+(see new_submission_key), so a submission repeated by a retry, a double tap
+or a reload gives back the first game instead of saving it again. Keys are
+looked up in the cache first, and the unique constraint on the Participation
+catches anything the cache has forgotten.
+"""
+
+import json
+import secrets
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from . import leaderboards, profiles, stats, teams
+from .chests import claim_chests, unclaimed_event_chests
+from .heatmap import update_heatmap
+from .models import ChestClaim, Participation, Player
+from .scoring import score_session
+
+
+# Longest idempotency key accepted.
+MAX_KEY_LENGTH = 64
+
+# Seconds to remember the game saved with each key in the cache.
+SUBMISSION_KEY_TIMEOUT = 24 * 60 * 60
+
+
+def new_submission_key():
+    """Return a new idempotency key for a game.
+
+    Returns:
+    key (str) - random key.
+    """
+    return secrets.token_urlsafe(16)
+
+
+def submission_cache_key(player_id, key):
+    """Return the cache key of the game saved with an idempotency key.
+
+    Arguments:
+    player_id (int) - ID of the Player.
+    key (str) - idempotency key.
+
+    Returns:
+    cache_key (str) - cache key.
+    """
+    return "submission:{}:{}".format(player_id, key)
+
+
+def find_submission(player_id, key, participation_id=None):
+    """Return the game already saved with an idempotency key.
+
+    Arguments:
+    player_id (int) - ID of the Player.
+    key (str) - idempotency key.
+    participation_id (int) - ID of the Participation if it is known.
+
+    Returns:
+    participation (Participation) - the saved Participation, None if there
+    is none.
+    claimed (list) - IDs of the treasure chests claimed in it.
+    """
+    games = Participation.objects.filter(player_id=player_id,
+            submission_key=key)
+    if participation_id is not None:
+        games = games.filter(pk=participation_id)
+
+    participation = games.first()
+    if participation is None:
+        return None, []
+
+    claimed = list(ChestClaim.objects.filter(participation=participation)
+            .order_by("id").values_list("treasure_chest_id", flat=True))
+    return participation, claimed
+
+
+def submit_game(user, event, score, pings=None, key=None):
+    """Save a finished game for a user.
+
+    When the positions the button was pressed at are given, the score is
+    worked out on the server from them instead of trusting the submitted
+    one, and the treasure chests found are claimed for the player. Only
+    games made up by the server itself (such as imports) are saved without
+    them, with the score as it is.
+
+    When a game has already been saved with the same key, nothing is
+    written and that game is given back.
+
+    Arguments:
+    user (User) - user who played the game.
+    event (Event) - event the game was played in.
+    score (int) - score submitted by the client.
+    pings (list) - (latitude, longitude) of each button press, None if the
+    game did not come from a client.
+    key (str) - idempotency key of the game, None if it has none.
+
+    Returns:
+    participation (Participation) - the saved Participation.
+    claimed (list) - IDs of the treasure chests found.
+
+    Raises:
+    ValueError - if the key is too long, a client game has no button
+    presses or a new client game is for an event which is not live.
+    """
+    if key is not None and len(key) > MAX_KEY_LENGTH:
+        raise ValueError("Submission keys can be at most {} characters."
+                .format(MAX_KEY_LENGTH))
+    if pings is not None and not pings:
+        raise ValueError("Games must include the positions the button was "
+                "pressed at.")
+
+    # Give back the game saved with the key without locking anything.
+    if key is not None:
+        participation_id = cache.get(submission_cache_key(user.player.id,
+            key))
+        if participation_id is not None:
+            participation, claimed = find_submission(user.player.id, key,
+                    participation_id)
+            if participation is not None:
+                return participation, claimed
+
+    try:
+        return save_game(user, event, score, pings, key)
+    except IntegrityError:
+        if key is None:
+            raise
+
+        # Another submission with the key was saved first.
+        participation, claimed = find_submission(user.player.id, key)
+        if participation is None:
+            raise
+        return participation, claimed
+
+
+def save_game(user, event, score, pings, key):
+    """Save a finished game for a user, unless its key has been saved.
+
+    Arguments:
+    user (User) - user who played the game.
+    event (Event) - event the game was played in.
+    score (int) - score submitted by the client.
+    pings (list) - (latitude, longitude) of each button press.
+    key (str) - idempotency key of the game, None if it has none.
+
+    Returns:
+    participation (Participation) - the saved Participation.
+    claimed (list) - IDs of the treasure chests found.
+
+    Raises:
+    ValueError - if a new client game is for an event which is not live.
+    """
+    with transaction.atomic():
+        # Get the player, locked so that concurrent submissions are applied
+        # one after another.
+        player = Player.objects.select_for_update().get(user=user)
+
+        # A submission with the same key may have been saved while waiting
+        # for the lock.
+        if key is not None:
+            participation, claimed = find_submission(player.id, key)
+            if participation is not None:
+                return participation, claimed
+
+        # Games can only be played while their event is live.
+        if pings is not None and event.get_status() != "Live":
+            raise ValueError("Event is not live.")
+
+        # Score the game on the server if it came from a client, only
+        # counting treasure chests the player has not claimed.
+        claimed = []
+        if pings is not None:
+            chests = unclaimed_event_chests(player, event)
+            result = score_session(pings, (event.latitude, event.longitude),
+                    [chest[:4] for chest in chests], event.game_bound)
+            score = result.score
+            claimed = result.claimed
+
+        # Increase the player score.
+        player.points += score
+        player.save()
+
+        # Create participation, for the team the player plays the event
+        # for.
+        participation = Participation(event=event, player=player,
+                score=score, pings=json.dumps(pings) if pings else "",
+                team_id=teams.get_team_id(player, event),
+                submission_key=key)
+        participation.save()
+
+        # Record the treasure chests found and update statistics, team
+        # scores and leaderboards.
+        claim_chests(player, claimed, participation)
+        stats.record_participation(participation)
+        teams.record_participation(participation)
+        leaderboards.record_participation(participation)
+
+        # Add where the player went to the heatmap in the background.
+        if pings:
+            update_heatmap.delay(participation.id)
+
+        # Remember the game of the key once it is committed.
+        if key is not None:
+            transaction.on_commit(lambda: cache.set(submission_cache_key(
+                player.id, key), participation.id, SUBMISSION_KEY_TIMEOUT))
+
+        # Stop showing the cached profile once the game is committed.
+        transaction.on_commit(lambda: profiles.bump_version(user.username))
+
+    return participation, claimed
@@ -0,0 +1,205 @@
+"""Background tasks used in game app.
+
+Used for moving slow work out of the request. Functions decorated with
+@task can be queued with .delay(), which saves a Task row in the database.
+The run_worker command picks queued tasks up and runs them on a thread pool.
+On App Engine, which cannot keep a worker running, a cron job runs them
+every minute instead (see cron.yaml and views.run_tasks).
+
+Workers claim tasks with SELECT ... FOR UPDATE SKIP LOCKED, so several
+workers can share the queue without running a task twice. Failed tasks are
+retried with exponential backoff until they run out of attempts.
+
+Tasks which ran are deleted, so the queue only keeps growing while tasks
+are waiting. Tasks which failed are kept for FAILED_RETENTION, so their
+errors can be looked at, then purged.
+
+Arguments are stored as JSON, so they should be simple values such as IDs
+rather than model instances.
+"""
+
+import datetime
+import functools
+import importlib
+import json
+import logging
+import traceback
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before the first retry, doubled on every attempt.
+RETRY_DELAY = 10
+
+# Longest wait between retries in seconds.
+MAX_RETRY_DELAY = 60 * 60
+
+# Seconds before a running task is assumed to belong to a dead worker.
+STALE_TIMEOUT = 15 * 60
+
+# Seconds failed tasks are kept before they are purged.
+FAILED_RETENTION = 7 * 24 * 60 * 60
+
+
+def task(function=None, max_attempts=5):
+    """Decorator for making a function into a task.
+
+    Can be used as @task or @task(max_attempts=...). The function can still
+    be called normally, and gains a delay method for queueing it.
+
+    Arguments:
+    function - function to decorate.
+    max_attempts (int) - number of attempts before the task is failed.
+
+    Returns:
+    function - the decorated function.
+    """
+    if function is None:
+        return functools.partial(task, max_attempts=max_attempts)
+
+    name = function.__module__ + "." + function.__qualname__
+
+    def delay(*args, run_at=None, **kwargs):
+        """Queue the function to be run by a worker.
+
+        Arguments:
+        args - positional arguments for the function.
+        run_at (datetime) - datetime to run the function from.
+        kwargs - keyword arguments for the function.
+
+        Returns:
+        task (Task) - the queued Task.
+        """
+        return Task.objects.create(name=name,
+                arguments=json.dumps({"args": args, "kwargs": kwargs}),
+                max_attempts=max_attempts, run_at=run_at or timezone.now())
+
+    function.delay = delay
+    function.is_task = True
+    return function
+
+
+def get_task_function(name):
+    """Import the function of a task from its import path.
+
+    Arguments:
+    name (str) - import path of the function.
+
+    Returns:
+    function - the task function.
+    """
+    module_name, function_name = name.rsplit(".", 1)
+    function = getattr(importlib.import_module(module_name), function_name)
+
+    # Only decorated functions can be run.
+    if not getattr(function, "is_task", False):
+        raise ValueError(name + " is not a task.")
+
+    return function
+
+
+def claim_tasks(limit):
+    """Claim tasks which are ready to run.
+
+    Rows locked by other workers are skipped rather than waited for.
+
+    Arguments:
+    limit (int) - maximum number of tasks to claim.
+
+    Returns:
+    tasks (list) - the claimed Tasks.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        task_ids = list(Task.objects.select_for_update(skip_locked=True)
+                .filter(status=Task.PENDING, run_at__lte=now)
+                .order_by("run_at").values_list("id", flat=True)[:limit])
+        Task.objects.filter(pk__in=task_ids).update(status=Task.RUNNING,
+                locked_at=now, attempts=F("attempts") + 1)
+
+    return list(Task.objects.filter(pk__in=task_ids).order_by("run_at"))
+
+
+def run_task(claimed_task):
+    """Run a claimed task and record the outcome.
+
+    Arguments:
+    claimed_task (Task) - Task claimed by this worker.
+
+    Returns:
+    success (bool) - True if the task ran without an error.
+    """
+    try:
+        function = get_task_function(claimed_task.name)
+        arguments = json.loads(claimed_task.arguments)
+        function(*arguments.get("args", ()), **arguments.get("kwargs", {}))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s (%s) failed:\n%s", claimed_task.pk,
+                claimed_task.name, error)
+
+        if claimed_task.attempts >= claimed_task.max_attempts:
+            # Out of attempts.
+            Task.objects.filter(pk=claimed_task.pk).update(
+                    status=Task.FAILED, last_error=error)
+        else:
+            # Retry later, waiting longer after every attempt.
+            delay = min(MAX_RETRY_DELAY,
+                    RETRY_DELAY * 2 ** (claimed_task.attempts - 1))
+            Task.objects.filter(pk=claimed_task.pk).update(
+                    status=Task.PENDING, last_error=error,
+                    run_at=timezone.now() + datetime.timedelta(seconds=delay))
+
+        return False
+
+    # Nothing is kept of tasks which ran.
+    Task.objects.filter(pk=claimed_task.pk).delete()
+    return True
+
+
+def requeue_stale_tasks():
+    """Put tasks left running by dead workers back in the queue.
+
+    Returns:
+    count (int) - number of tasks put back.
+    """
+    stale = timezone.now() - datetime.timedelta(seconds=STALE_TIMEOUT)
+    return Task.objects.filter(status=Task.RUNNING,
+            locked_at__lt=stale).update(status=Task.PENDING)
+
+
+def purge_finished_tasks():
+    """Delete tasks which failed more than FAILED_RETENTION ago.
+
+    Tasks left done by older workers are deleted as well. Uses the index on
+    status and run_at, the time of the last attempt.
+
+    Returns:
+    count (int) - number of tasks deleted.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=FAILED_RETENTION)
+    count, _ = Task.objects.filter(status__in=[Task.DONE, Task.FAILED],
+            run_at__lt=cutoff).delete()
+    return count
+
+
+def run_pending_tasks(limit=100):
+    """Claim and run tasks one after another in this thread.
+
+    Arguments:
+    limit (int) - maximum number of tasks to run.
+
+    Returns:
+    count (int) - number of tasks run.
+    """
+    claimed = claim_tasks(limit)
+    for claimed_task in claimed:
+        run_task(claimed_task)
+
+    return len(claimed)
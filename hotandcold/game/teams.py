@@ -0,0 +1,117 @@
+"""Teams used in game app.
+
+Used for players competing together. A player plays for their own team, or
+for the team of an EventTeam in that event. The team of each game is saved
+with its Participation, and the score is added to the Team in the same
+transaction (see submissions.submit_game), so the team leaderboard is a
+single indexed query. The totals can be rebuilt from the Participations
+with the rebuild_team_scores command.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import ArchivedParticipation, EventTeam, Participation, Team
+
+
+def get_team_id(player, event):
+    """Return the Team a player plays an event for.
+
+    Arguments:
+    player (Player) - Player playing the game.
+    event (Event) - Event the game is played in.
+
+    Returns:
+    team_id (int) - ID of the Team, None if the player is not in one.
+    """
+    team_id = (EventTeam.objects.filter(player=player, event=event)
+            .values_list("team_id", flat=True).first())
+    if team_id is None:
+        team_id = player.team_id
+
+    return team_id
+
+
+def record_participation(participation):
+    """Add a new game to the score of its Team.
+
+    Arguments:
+    participation (Participation) - the new Participation.
+
+    Returns:
+    None.
+    """
+    if participation.team_id is None:
+        return
+
+    Team.objects.filter(pk=participation.team_id).update(
+            points=F("points") + participation.score, games=F("games") + 1)
+
+
+def adjust_team_scores(changes):
+    """Apply changes to games already counted to the scores of their Teams.
+
+    Arguments:
+    changes (list) - GameChange of each game (see adjustments.py).
+
+    Returns:
+    None.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for change in changes:
+        if change.team_id is not None:
+            totals[change.team_id][0] += change.score
+            totals[change.team_id][1] += change.games
+
+    for team_id, (points, games) in totals.items():
+        Team.objects.filter(pk=team_id).update(points=F("points") + points,
+                games=F("games") + games)
+
+
+def top_teams(limit=10):
+    """Return the teams with the most points.
+
+    Arguments:
+    limit (int) - number of teams to return.
+
+    Returns:
+    top (list) - Teams, highest points first.
+    """
+    return list(Team.objects.order_by("-points", "id")[:limit])
+
+
+def rebuild_team_scores(chunk_size=1000):
+    """Rebuild the points of every Team from the Participations.
+
+    The Teams are locked first, so games submitted during the rebuild are
+    either counted by it or added after it.
+
+    Arguments:
+    chunk_size (int) - number of rows to update at a time.
+
+    Returns:
+    count (int) - number of Teams rebuilt.
+    """
+    with transaction.atomic():
+        teams = list(Team.objects.select_for_update().only("id"))
+
+        # Add up the current and archived games of every team.
+        points = Counter()
+        games = Counter()
+        for model in (Participation, ArchivedParticipation):
+            for row in (model.objects.filter(team__isnull=False)
+                    .values("team_id")
+                    .annotate(points=Sum("score"), games=Count("id"))
+                    .order_by()):
+                points[row["team_id"]] += row["points"]
+                games[row["team_id"]] += row["games"]
+
+        for team in teams:
+            team.points = points[team.id]
+            team.games = games[team.id]
+        Team.objects.bulk_update(teams, ["points", "games"],
+                batch_size=chunk_size)
+
+    return len(teams)
@@ -0,0 +1,213 @@
+/* Service worker for dExtination.
+
+Keeps the game working outdoors on poor mobile connections:
+- static files are precached and served from the cache,
+- pages and treasure chest payloads are fetched from the network when
+  possible and from the cache otherwise, except game pages, which hold a
+  submission key and CSRF token only meant to be used once,
+- cached pages are forgotten when a player logs in or out, so the next
+  player on the device does not see them,
+- scores submitted while offline are queued and sent when the connection
+  returns, and kept until the server has saved or refused them for good. */
+
+const VERSION = "{{ version|escapejs }}";
+const STATIC_CACHE = "static-" + VERSION;
+const STATIC_URL = "{{ static_url|escapejs }}";
+const PAGE_CACHE = "pages";
+const STATIC_FILES = [
+{% for url in static_files %}  "{{ url|escapejs }}",
+{% endfor %}];
+
+const QUEUE_DB = "score-queue";
+const QUEUE_STORE = "scores";
+const QUEUE_TAG = "score-queue";
+
+const GAME_PAGE = /^\/game\/\d+\/$/;
+const LOGIN_PAGES = ["/login/", "/logout/"];
+
+//responses which mean a queued score is done with, saved or refused for good
+const FINAL_STATUSES = [400, 404, 409];
+
+
+/* INSTALLING */
+
+self.addEventListener("install", event => {
+  //precache the static files before taking over
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then(cache => cache.addAll(STATIC_FILES))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", event => {
+  //remove static files cached by older versions
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys
+        .filter(key => key.startsWith("static-") && key !== STATIC_CACHE)
+        .map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+      .then(replayScores)
+  );
+});
+
+
+/* FETCHING */
+
+self.addEventListener("fetch", event => {
+  let request = event.request;
+  let url = new URL(request.url);
+
+  //pages cached for one player must not be shown to the next
+  if (LOGIN_PAGES.includes(url.pathname)) {
+    event.waitUntil(caches.delete(PAGE_CACHE));
+  }
+
+  //score submissions are queued if they cannot be sent
+  if (request.method === "POST" && GAME_PAGE.test(url.pathname)) {
+    event.respondWith(submitScore(request));
+    return;
+  }
+
+  if (request.method !== "GET") {
+    return;
+  }
+
+  if (url.origin !== self.location.origin || url.pathname.startsWith(STATIC_URL)) {
+    //static files and fonts hardly ever change
+    event.respondWith(cacheFirst(request));
+  } else {
+    //pages and treasure chests should be as fresh as possible
+    event.respondWith(networkFirst(request));
+  }
+});
+
+function cacheFirst(request) {
+  return caches.match(request).then(cached => cached || fetch(request).then(response => {
+    if (response.ok || response.type === "opaque") {
+      let copy = response.clone();
+      caches.open(STATIC_CACHE).then(cache => cache.put(request, copy));
+    }
+    return response;
+  }));
+}
+
+function networkFirst(request) {
+  return fetch(request).then(response => {
+    if (isCacheable(request, response)) {
+      let copy = response.clone();
+      caches.open(PAGE_CACHE).then(cache => cache.put(request, copy));
+    }
+    return response;
+  }).catch(() => caches.match(request).then(cached => cached || offlineResponse()));
+}
+
+function isCacheable(request, response) {
+  //game pages, and anything the server says not to store, are never reused
+  let cacheControl = response.headers.get("Cache-Control") || "";
+  return response.ok && !GAME_PAGE.test(new URL(request.url).pathname)
+    && !cacheControl.includes("no-store");
+}
+
+function offlineResponse() {
+  return new Response("<p>You are offline. Please try again when you have a connection.</p>",
+    {status: 503, headers: {"Content-Type": "text/html"}});
+}
+
+
+/* OFFLINE SCORE QUEUE */
+
+function submitScore(request) {
+  //keep a copy of the body in case the request fails
+  let copy = request.clone();
+  return fetch(request).catch(() => copy.text().then(body => queueScore(copy.url, body))
+    .then(() => new Response("<p>You are offline. Your score has been saved and will be sent when you are back online.</p>",
+      {status: 202, headers: {"Content-Type": "text/html"}})));
+}
+
+function openQueue() {
+  return new Promise((resolve, reject) => {
+    let open = indexedDB.open(QUEUE_DB, 1);
+    open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, {autoIncrement: true});
+    open.onsuccess = () => resolve(open.result);
+    open.onerror = () => reject(open.error);
+  });
+}
+
+function queueScore(url, body) {
+  return openQueue().then(db => new Promise((resolve, reject) => {
+    let transaction = db.transaction(QUEUE_STORE, "readwrite");
+    transaction.objectStore(QUEUE_STORE).add({url: url, body: body});
+    transaction.oncomplete = resolve;
+    transaction.onerror = () => reject(transaction.error);
+  })).then(() => {
+    //ask the browser to tell us when the connection returns
+    if (self.registration.sync) {
+      return self.registration.sync.register(QUEUE_TAG).catch(() => null);
+    }
+  });
+}
+
+function withToken(body, csrfToken) {
+  //a score queued before the player logged in again has an old CSRF token
+  if (!csrfToken) {
+    return body;
+  }
+  let params = new URLSearchParams(body);
+  params.set("csrfmiddlewaretoken", csrfToken);
+  return params.toString();
+}
+
+function isDone(response) {
+  //a game which needs the player to log in first is sent a redirect there
+  if (response.redirected && LOGIN_PAGES.includes(new URL(response.url).pathname)) {
+    return false;
+  }
+  return response.ok || FINAL_STATUSES.includes(response.status);
+}
+
+function replayScores(csrfToken) {
+  return openQueue().then(db => new Promise((resolve, reject) => {
+    let entries = [];
+    let transaction = db.transaction(QUEUE_STORE, "readonly");
+    transaction.objectStore(QUEUE_STORE).openCursor().onsuccess = event => {
+      let cursor = event.target.result;
+      if (cursor) {
+        entries.push({key: cursor.key, value: cursor.value});
+        cursor.continue();
+      }
+    };
+    transaction.oncomplete = () => resolve([db, entries]);
+    transaction.onerror = () => reject(transaction.error);
+  })).then(([db, entries]) => entries.reduce((previous, entry) => previous
+    .then(() => fetch(entry.value.url, {
+      method: "POST",
+      body: withToken(entry.value.body, csrfToken),
+      credentials: "same-origin",
+      headers: {"Content-Type": "application/x-www-form-urlencoded"},
+    }))
+    .then(response => {
+      //other scores are kept: server errors and rate limiting are tried
+      //again later, 401 and 403 once the player has logged in again
+      if (isDone(response)) {
+        db.transaction(QUEUE_STORE, "readwrite").objectStore(QUEUE_STORE).delete(entry.key);
+      } else if (response.status === 429 && self.registration.sync) {
+        return self.registration.sync.register(QUEUE_TAG).catch(() => null);
+      }
+    }), Promise.resolve()));
+}
+
+self.addEventListener("sync", event => {
+  if (event.tag === QUEUE_TAG) {
+    event.waitUntil(replayScores());
+  }
+});
+
+self.addEventListener("message", event => {
+  //pages tell us when they come back online, for browsers without sync,
+  //and when a logged in player opens them, with their current CSRF token
+  if (event.data && event.data.type === "online") {
+    event.waitUntil(replayScores(event.data.csrfToken));
+  }
+});
@@ -1,11 +1,55 @@
 """Tests for game app."""
 
+import contextlib
 import datetime
+import importlib
+import io
+import json
+import sys
+import threading
+import time
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, \
+    TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-from .models import Player, Event, Participation, TreasureChest
+from hotandcold import startup
+
+from . import archive, caches, clusters, geo, leaderboards, presence, \
+    pagination, profiles, ratelimit, reconcile, routers, scoring, search, \
+    tasks
+from .chests import claim_chests, unclaimed_chests_near
+from .models import Player, Event, Participation, TreasureChest, \
+    ChestClaim, EventChest, PlayerStats, DailyScore, WeeklyScore, \
+    HeatmapCell, Task, ArchivedEvent, ArchivedParticipation, Team, EventTeam, \
+    ChestCluster
+from .submissions import submit_game
+
+
+@tasks.task(max_attempts=2)
+def add_points(username, points):
+    """Task used for testing the task queue."""
+    Player.objects.filter(user__username=username).update(
+            points=points)
+
+
+# Positions of a game which reaches the event straight away.
+PINGS = json.dumps([[50.73722, -3.53238]])
+
+
+def scored(score):
+    """Make every game submitted from a client score a given score."""
+    return mock.patch("game.submissions.score_session",
+            return_value=scoring.SessionResult(score, 1, True, []))
 
 
 class TestHTTPResponsesAndRedirectsNotLoggedIn(TestCase):
@@ -303,3 +347,1580 @@ class TestHTTPResponsesAndRedirectsLoggedInGameMaster(TestCase):
         # Treasure chest deletion view.
         response = self.client.get("/treasure_chests/1/delete/", follow=True)
         self.assertEquals(response.status_code, 200)
+
+
+class TestScoring(TestCase):
+    """Class for testing the server side scoring rules."""
+
+    def setUp(self):
+        """Setup destination and treasure chests."""
+        # Destination, a chest 1m away from it and a chest far away.
+        self.destination = (50.7372200, -3.5323800)
+        self.chests = [(1, 50.7372290, -3.5323800, 100),
+                (2, 51.0, -3.0, 500)]
+
+    def test_finish_on_first_click(self):
+        """Test reaching the destination straight away."""
+        result = scoring.score_session([self.destination], self.destination,
+                [])
+        self.assertEquals(result, (900, 1, True, []))
+
+    def test_penalty_per_click(self):
+        """Test score decreases on every click until the destination."""
+        far = (50.7500000, -3.5323800)
+        result = scoring.score_session([far, far, self.destination],
+                self.destination, [])
+        self.assertEquals(result.score, 729)
+        self.assertTrue(result.finished)
+
+    def test_chest_claimed_once(self):
+        """Test a nearby chest is claimed and cannot be claimed again."""
+        result = scoring.score_session([self.destination], self.destination,
+                self.chests)
+        self.assertEquals(result.score, 1000)
+        self.assertEquals(result.claimed, [1])
+
+        result = scoring.score_session([self.destination], self.destination,
+                self.chests, seen=[1])
+        self.assertEquals(result.score, 900)
+
+    def test_batch_matches_single(self):
+        """Test batch scoring gives the same results as single sessions."""
+        sessions = [[(50.74, -3.53), self.destination],
+                [self.destination], [(50.8, -3.5)]]
+        scorer = scoring.EventScorer(self.destination, self.chests)
+        self.assertEquals(scorer.score_sessions(sessions),
+                [scoring.score_session(pings, self.destination, self.chests)
+                    for pings in sessions])
+
+    def test_game_view_scores_pings(self):
+        """Test the game view uses the server side score."""
+        user = User.objects.create_user(username="testuser", password="P@s5w0rd")
+        Player.objects.create(user=user)
+        self.client.login(username="testuser", password="P@s5w0rd")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=self.destination[0], longitude=self.destination[1])
+
+        self.client.post("/game/{}/".format(event.id), {"score": 5000,
+            "pings": json.dumps([self.destination])})
+        self.assertEquals(Participation.objects.get().score, 900)
+        self.assertEquals(Player.objects.get().points, 900)
+
+
+class TestChestClaims(TestCase):
+    """Class for testing server side treasure chest claims."""
+
+    def setUp(self):
+        """Setup player, event and treasure chests."""
+        user = User.objects.create_user(username="testuser", password="P@s5w0rd")
+        self.player = Player.objects.create(user=user)
+        self.client.login(username="testuser", password="P@s5w0rd")
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.near = TreasureChest.objects.create(name="Near", points=100,
+                latitude=50.737229, longitude=-3.53238)
+        self.far = TreasureChest.objects.create(name="Far", points=100,
+                latitude=51.0, longitude=-3.0)
+
+    def test_unclaimed_chests_near(self):
+        """Test claimed and far away chests are left out."""
+        chests = unclaimed_chests_near(self.player, 50.73722, -3.53238, 1000)
+        self.assertEquals([chest[0] for chest in chests], [self.near.id])
+
+        self.assertEquals(claim_chests(self.player, [self.near.id]),
+                [self.near.id])
+        self.assertEquals(unclaimed_chests_near(self.player, 50.73722,
+            -3.53238, 1000), [])
+
+    def test_claim_twice(self):
+        """Test a chest can only be claimed once."""
+        claim_chests(self.player, [self.near.id, self.near.id])
+        self.assertEquals(claim_chests(self.player, [self.near.id]), [])
+        self.assertEquals(ChestClaim.objects.count(), 1)
+
+    def test_claim_once_across_games(self):
+        """Test chest points only count in the first game they are found."""
+        pings = json.dumps([[50.73722, -3.53238]])
+        for i in range(2):
+            self.client.post("/game/{}/".format(self.event.id),
+                    {"score": 1000, "pings": pings})
+
+        self.assertEquals(sorted(Participation.objects.values_list("score",
+            flat=True)), [900, 1000])
+        self.assertEquals(Player.objects.get().points, 1900)
+
+    def test_rescore_matches_games(self):
+        """Test re-scoring uses the chests and bound the games used."""
+        self.event.game_bound = 500
+        self.event.save()
+        pings = json.dumps([[50.737, -3.53238], [50.73722, -3.53238]])
+        for i in range(2):
+            self.client.post("/game/{}/".format(self.event.id),
+                    {"score": 1000, "pings": pings})
+        scores = list(Participation.objects.order_by("id")
+                .values_list("score", flat=True))
+
+        output = io.StringIO()
+        call_command("rescore_participations", "--apply", stdout=output)
+        self.assertIn("0 differ", output.getvalue())
+        self.assertEquals(list(Participation.objects.order_by("id")
+            .values_list("score", flat=True)), scores)
+        self.assertEquals(Player.objects.get().points, sum(scores))
+
+
+class TestEventChests(TestCase):
+    """Class for testing treasure chests in play for events."""
+
+    def setUp(self):
+        """Setup an event and treasure chests."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.near = TreasureChest.objects.create(name="Near", points=100,
+                latitude=50.7372290, longitude=-3.53238)
+        self.far = TreasureChest.objects.create(name="Far", points=100,
+                latitude=50.75, longitude=-3.53238)
+
+    def test_chest_saved(self):
+        """Test chests are added and removed when they move."""
+        self.assertEquals(list(self.event.treasure_chests.all()), [self.near])
+
+        self.far.latitude = 50.7373
+        self.far.save()
+        self.near.latitude = 50.76
+        self.near.save()
+        self.assertEquals(list(self.event.treasure_chests.all()), [self.far])
+
+    def test_event_saved(self):
+        """Test chests are added when the playing area grows."""
+        self.event.game_bound = 2000
+        self.event.save()
+        self.assertEquals(self.event.treasure_chests.count(), 2)
+        self.assertEquals(EventChest.objects.get(treasure_chest=self.far)
+                .distance, 1421)
+
+
+class TestEventChestPayload(TestCase):
+    """Class for testing the treasure chest payload of events."""
+
+    def setUp(self):
+        """Setup player, event and treasure chests."""
+        user = User.objects.create_user(username="testuser", password="P@s5w0rd")
+        Player.objects.create(user=user)
+        self.client.login(username="testuser", password="P@s5w0rd")
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.first = TreasureChest.objects.create(name="First", points=100,
+                latitude=50.7373, longitude=-3.53238)
+        self.second = TreasureChest.objects.create(name="Second", points=200,
+                latitude=50.7374, longitude=-3.53238)
+        self.url = "/game/{}/chests/".format(self.event.id)
+
+    def test_full_payload(self):
+        """Test every chest is sent without a version."""
+        response = self.client.get(self.url)
+        self.assertEquals(response.json(), {"version": 2, "chests": [
+            [self.first.id, 50.7373, -3.53238, 100],
+            [self.second.id, 50.7374, -3.53238, 200]]})
+
+    def test_etag(self):
+        """Test the payload is not sent again if it has not changed."""
+        response = self.client.get(self.url)
+        response = self.client.get(self.url,
+                HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEquals(response.status_code, 304)
+
+        # Once the event is over, players cannot tell if it has changed.
+        etag = response["ETag"]
+        Event.objects.filter(pk=self.event.id).update(end=timezone.now())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 403)
+
+    def test_delta(self):
+        """Test only changed chests are sent since a version."""
+        self.second.points = 300
+        self.second.save()
+        self.first.delete()
+
+        response = self.client.get(self.url + "?since=2")
+        self.assertEquals(response.json(), {"version": 4, "since": 2,
+            "ids": [self.second.id],
+            "chests": [[self.second.id, 50.7374, -3.53238, 300]]})
+
+
+class TestServiceWorker(TestCase):
+    """Class for testing the service worker."""
+
+    def test_service_worker(self):
+        """Test the service worker is served with the static files."""
+        response = self.client.get("/sw.js")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response["Content-Type"], "application/javascript")
+        self.assertContains(response, "/static/game/css/style.css")
+
+    def test_game_page_not_stored(self):
+        """Test game pages, which hold a one-off key, are never stored."""
+        user = User.objects.create_user(username="testuser",
+                password="P@s5w0rd")
+        Player.objects.create(user=user)
+        self.client.login(username="testuser", password="P@s5w0rd")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+
+        response = self.client.get("/game/{}/".format(event.id))
+        self.assertIn("no-store", response["Cache-Control"])
+
+
+@override_settings(RATELIMIT_POLICIES={"game": (2, 60, 3),
+    "login": (2, 60, 2), "register": (1, 60, 1)})
+class TestRateLimiting(TestCase):
+    """Class for testing rate limiting of expensive views."""
+
+    def setUp(self):
+        """Clear rate limits left by other tests."""
+        cache.clear()
+
+    def test_login_rate_limited(self):
+        """Test logging in is limited per IP address."""
+        data = {"username": "testuser", "password": "wrong"}
+        for i in range(2):
+            response = self.client.post("/login/", data)
+            self.assertEquals(response.status_code, 200)
+
+        response = self.client.post("/login/", data)
+        self.assertEquals(response.status_code, 429)
+        self.assertTrue(int(response["Retry-After"]) > 0)
+
+        # Other addresses and viewing the form are not limited.
+        response = self.client.post("/login/", data, REMOTE_ADDR="10.0.0.1")
+        self.assertEquals(response.status_code, 200)
+        response = self.client.get("/login/")
+        self.assertEquals(response.status_code, 200)
+
+    def test_shared_address(self):
+        """Test players behind one IP address have their own buckets."""
+        url = "/api/v1/events/1/games/"
+        for username in ("first", "second"):
+            user = User.objects.create_user(username=username,
+                    password="P@s5w0rd")
+            Player.objects.create(user=user)
+
+        # The first player is limited without using up the address.
+        self.client.login(username="first", password="P@s5w0rd")
+        statuses = [self.client.post(url).status_code for i in range(4)]
+        self.assertEquals(statuses[2:], [429, 429])
+
+        # The second player can use what is left of the address.
+        self.client.login(username="second", password="P@s5w0rd")
+        self.assertNotEqual(self.client.post(url).status_code, 429)
+        response = self.client.post(url)
+        self.assertEquals(response.status_code, 429)
+
+        # Their own bucket was given back the token the address refused.
+        cache.delete_many(["ratelimit:game:ip:127.0.0.1:start",
+            "ratelimit:game:ip:127.0.0.1:taken"])
+        self.assertNotEqual(self.client.post(url).status_code, 429)
+
+    def test_bucket_refills(self):
+        """Test tokens come back over time."""
+        with mock.patch("game.ratelimit.time.time", return_value=1000.0):
+            self.assertEquals(ratelimit.take_token("test", 2, 60), 0)
+            self.assertEquals(ratelimit.take_token("test", 2, 60), 0)
+            self.assertEquals(ratelimit.take_token("test", 2, 60), 30)
+        with mock.patch("game.ratelimit.time.time", return_value=1030.0):
+            self.assertEquals(ratelimit.take_token("test", 2, 60), 0)
+            self.assertTrue(ratelimit.take_token("test", 2, 60) > 0)
+
+
+class TestTaskQueue(TransactionTestCase):
+    """Class for testing the background task queue."""
+
+    def setUp(self):
+        """Setup a player."""
+        user = User.objects.create_user(username="testuser", password="P@s5w0rd")
+        Player.objects.create(user=user)
+
+    def test_run_task(self):
+        """Test queued tasks are run by a worker."""
+        add_points.delay("testuser", points=10)
+        self.assertEquals(Player.objects.get().points, 0)
+
+        call_command("run_worker", "--once", "--threads=1",
+                stdout=io.StringIO())
+        self.assertEquals(Player.objects.get().points, 10)
+        self.assertFalse(Task.objects.exists())
+
+    def test_cron(self):
+        """Test the App Engine cron job runs queued tasks."""
+        add_points.delay("testuser", points=10)
+        response = self.client.get("/tasks/run/")
+        self.assertEquals(response.status_code, 403)
+        self.assertEquals(Player.objects.get().points, 0)
+
+        response = self.client.get("/tasks/run/", HTTP_X_APPENGINE_CRON="true")
+        self.assertEquals(response.json(), {"tasks": 1})
+        self.assertEquals(Player.objects.get().points, 10)
+
+    def test_retry_with_backoff(self):
+        """Test failing tasks are retried later, then failed."""
+        add_points.delay("testuser")
+        self.assertEquals(tasks.run_pending_tasks(), 1)
+
+        # Waiting to be retried.
+        queued = Task.objects.get()
+        self.assertEquals(queued.status, Task.PENDING)
+        self.assertTrue(queued.run_at > timezone.now())
+        self.assertIn("TypeError", queued.last_error)
+        self.assertEquals(tasks.run_pending_tasks(), 0)
+
+        # Out of attempts.
+        Task.objects.update(run_at=timezone.now())
+        tasks.run_pending_tasks()
+        self.assertEquals(Task.objects.get().status, Task.FAILED)
+
+    def test_purge(self):
+        """Test failed tasks are kept for a while, then purged."""
+        old = timezone.now() - datetime.timedelta(
+                seconds=tasks.FAILED_RETENTION + 1)
+        Task.objects.bulk_create([Task(name="add_points", status=status,
+            run_at=run_at) for status, run_at in ((Task.FAILED, old),
+                (Task.DONE, old), (Task.FAILED, timezone.now()),
+                (Task.PENDING, old))])
+
+        self.assertEquals(tasks.purge_finished_tasks(), 2)
+        self.assertEquals(sorted(Task.objects.values_list("status",
+            flat=True)), [Task.FAILED, Task.PENDING])
+
+
+class TestPlayerStats(TestCase):
+    """Class for testing player statistics."""
+
+    def setUp(self):
+        """Setup players and an event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.users = [User.objects.create_user(username=username,
+            password="P@s5w0rd") for username in ("first", "second")]
+        for user in self.users:
+            Player.objects.create(user=user)
+
+    def play(self, user, score):
+        """Submit a game as a user."""
+        self.client.login(username=user.username, password="P@s5w0rd")
+        with scored(score):
+            self.client.post("/game/{}/".format(self.event.id),
+                    {"score": score, "pings": PINGS})
+
+    def test_stats_updated(self):
+        """Test statistics are updated with every game."""
+        self.play(self.users[0], 500)
+        self.play(self.users[0], 300)
+        self.play(self.users[1], 700)
+
+        first, second = (PlayerStats.objects.get(player__user=user)
+                for user in self.users)
+        self.assertEquals((first.games_played, first.total_score,
+            first.best_score, first.events_won), (2, 800, 500, 0))
+        self.assertEquals(first.get_average_score(), 400)
+        self.assertEquals(second.events_won, 1)
+        self.event.refresh_from_db()
+        self.assertEquals((self.event.top_score, self.event.winner),
+                (700, second.player))
+
+    def test_win_without_lock(self):
+        """Test games which do not win leave the event row alone."""
+        self.play(self.users[0], 500)
+        with CaptureQueriesContext(connection) as queries:
+            self.play(self.users[1], 500)
+        self.assertFalse([query for query in queries
+            if query["sql"].startswith("UPDATE \"game_event\"")])
+
+        self.play(self.users[1], 600)
+        first, second = (PlayerStats.objects.get(player__user=user)
+                for user in self.users)
+        self.assertEquals((first.events_won, second.events_won), (0, 1))
+
+    def test_rebuild(self):
+        """Test rebuilding gives the same statistics."""
+        self.play(self.users[0], 500)
+        self.play(self.users[1], 500)
+        self.play(self.users[1], 200)
+        expected = list(PlayerStats.objects.order_by("pk").values())
+
+        PlayerStats.objects.update(games_played=0, events_won=5)
+        call_command("rebuild_player_stats", stdout=io.StringIO())
+        self.assertEquals(list(PlayerStats.objects.order_by("pk").values()),
+                expected)
+
+    def test_rebuild_untimed(self):
+        """Test rebuilding with games from before their time was recorded."""
+        self.play(self.users[0], 500)
+        call_command("archive_events", days=-1, stdout=io.StringIO())
+        self.event.pk = None
+        self.event.save()
+        self.play(self.users[0], 300)
+        ArchivedParticipation.objects.update(created=None)
+
+        call_command("rebuild_player_stats", stdout=io.StringIO())
+        stats = PlayerStats.objects.get(player__user=self.users[0])
+        self.assertEquals((stats.games_played, stats.total_score), (2, 800))
+        self.assertEquals(stats.last_played,
+                Participation.objects.get().created)
+
+    def test_profile_one_query(self):
+        """Test the profile gets the user, player and statistics at once."""
+        self.play(self.users[0], 500)
+        with self.assertNumQueries(1):
+            User.objects.select_related("player__stats").get(
+                    username="first").player.stats.games_played
+        response = self.client.get("/users/first/")
+        self.assertContains(response, "Best score: 500")
+
+
+class TestLeaderboards(TestCase):
+    """Class for testing time windowed leaderboards."""
+
+    def setUp(self):
+        """Setup players and an event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.users = [User.objects.create_user(username=username,
+            password="P@s5w0rd") for username in ("first", "second")]
+        for user in self.users:
+            Player.objects.create(user=user)
+
+    def play(self, user, score):
+        """Submit a game as a user."""
+        self.client.login(username=user.username, password="P@s5w0rd")
+        with scored(score):
+            self.client.post("/game/{}/".format(self.event.id),
+                    {"score": score, "pings": PINGS})
+
+    def test_rollups_updated(self):
+        """Test the rollups are updated with every game."""
+        self.play(self.users[0], 500)
+        self.play(self.users[0], 300)
+        self.play(self.users[1], 700)
+
+        self.assertEquals([(player.user.username, points) for player, points
+            in leaderboards.top_players("day")], [("first", 800),
+                ("second", 700)])
+        weekly = WeeklyScore.objects.get(player__user=self.users[0])
+        self.assertEquals((weekly.points, weekly.games), (800, 2))
+
+    def test_old_games_left_out(self):
+        """Test games from last week are not on this week's leaderboard."""
+        self.play(self.users[0], 500)
+        self.play(self.users[1], 100)
+        WeeklyScore.objects.filter(player__user=self.users[0]).update(
+                start=leaderboards.window_start("week")
+                - datetime.timedelta(days=7))
+
+        response = self.client.get("/leaderboard/?window=week")
+        self.assertEquals(response.context["window"], "week")
+        self.assertEquals([player.user.username for player, points
+            in response.context["top_players_list"]], ["second"])
+
+    def test_rebuild(self):
+        """Test rebuilding gives the same rollups."""
+        self.play(self.users[0], 500)
+        self.play(self.users[1], 200)
+        self.play(self.users[1], 200)
+        expected = [list(model.objects.order_by("player", "start")
+            .values("player", "start", "points", "games"))
+            for model in (DailyScore, WeeklyScore)]
+
+        DailyScore.objects.all().delete()
+        WeeklyScore.objects.update(points=0)
+        call_command("rebuild_leaderboards", stdout=io.StringIO())
+        self.assertEquals([list(model.objects.order_by("player", "start")
+            .values("player", "start", "points", "games"))
+            for model in (DailyScore, WeeklyScore)], expected)
+
+    def test_rebuild_untimed(self):
+        """Test games from before their time was recorded are left out."""
+        self.play(self.users[0], 500)
+        self.play(self.users[1], 200)
+        Participation.objects.filter(player__user=self.users[0]).update(
+                created=None)
+
+        call_command("rebuild_leaderboards", stdout=io.StringIO())
+        for window in ("day", "week"):
+            self.assertEquals([(player.user.username, points) for
+                player, points in leaderboards.top_players(window)],
+                [("second", 200)])
+        self.assertEquals(leaderboards.top_players()[0][1], 500)
+
+
+class TestTimedGamesMigration(TransactionTestCase):
+    """Class for testing games already played are not timed on migrating."""
+
+    def migrate(self, target):
+        """Migrate the game app to a migration, returning its models."""
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("game", target)])
+        return executor.loader.project_state([("game", target)]).apps
+
+    def tearDown(self):
+        """Migrate back to the latest migration."""
+        call_command("migrate", "game", verbosity=0)
+
+    def test_legacy_games_untimed(self):
+        """Test existing games are left untimed and new ones are timed."""
+        apps = self.migrate("0008_playerstats")
+        user = apps.get_model("auth", "User").objects.create(username="old")
+        player = apps.get_model("game", "Player").objects.create(
+                user_id=user.id)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = apps.get_model("game", "Event").objects.create(title="Old",
+                description="Test", start=now, end=now, latitude=0,
+                longitude=0)
+        apps.get_model("game", "Participation").objects.create(player=player,
+                event=event, score=500)
+
+        apps = self.migrate("0009_score_rollups")
+        games = apps.get_model("game", "Participation").objects
+        self.assertIsNone(games.get().created)
+        new = games.create(player_id=player.id, event_id=event.id,
+                score=200)
+        self.assertIsNotNone(new.created)
+
+
+@override_settings(DATABASE_REPLICAS={"replica1": 1, "replica2": 0})
+class TestReplicaRouter(SimpleTestCase):
+    """Class for testing routing reads to replicas."""
+
+    def setUp(self):
+        """Setup a router and a view recording where it reads from."""
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+        def view(request, write=False):
+            if write:
+                self.router.db_for_write(Event)
+            response = HttpResponse()
+            response.db = self.router.db_for_read(Event)
+            return response
+
+        self.view = routers.use_replica(view)
+        self.middleware = routers.PrimaryPinMiddleware(
+                lambda request: self.view(request, **request.view_kwargs))
+
+    def get(self, method="get", cookies=None, **kwargs):
+        """Make a request through the middleware to the view."""
+        request = getattr(self.factory, method)("/")
+        request.COOKIES.update(cookies or {})
+        request.view_kwargs = kwargs
+        return self.middleware(request)
+
+    def test_reads_from_replica(self):
+        """Test read-only views read from a replica picked by weight."""
+        response = self.get()
+        self.assertEquals(response.db, "replica1")
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEquals(self.router.db_for_read(Event), "default")
+
+    def test_pinned_after_write(self):
+        """Test reads after a write use the primary and pin the client."""
+        response = self.get(write=True)
+        self.assertEquals(response.db, "default")
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        response = self.get(method="post")
+        self.assertEquals(response.db, "default")
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        response = self.get(cookies={routers.PIN_COOKIE: "1"})
+        self.assertEquals(response.db, "default")
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_no_replicas(self):
+        """Test every query uses the primary without replicas."""
+        self.assertEquals(self.get().db, "default")
+
+    def test_allow_migrate(self):
+        """Test replicas are only migrated when they are not mirrors."""
+        with mock.patch.dict(settings.DATABASES, {
+                "replica1": {"TEST": {"MIRROR": "default"}},
+                "replica2": {}, "other": {}}):
+            self.assertEquals([self.router.allow_migrate(db, "game")
+                for db in ("default", "replica1", "replica2", "other")],
+                [True, False, True, False])
+
+
+class TestWarmup(TestCase):
+    """Class for testing the App Engine warmup handler."""
+
+    def setUp(self):
+        """Setup an empty cache."""
+        cache.clear()
+
+    def test_warmup(self):
+        """Test warming up fills the caches and logs the startup times."""
+        with self.assertLogs("hotandcold.startup", "INFO") as logs:
+            response = self.client.get("/_ah/warmup")
+        self.assertEquals(response.status_code, 200)
+        self.assertIn("templates", logs.output[0])
+        self.assertIsNotNone(cache.get(caches.LIVE_EVENTS_KEY))
+        self.assertIsNotNone(cache.get(caches.leaderboard_key("week")))
+
+    def test_live_events_cleared(self):
+        """Test new events show up in the cached live events."""
+        self.assertEquals(caches.get_live_events(), [])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.assertEquals(caches.get_live_events(), [event])
+
+    def test_import_timer(self):
+        """Test the import time of new modules is recorded."""
+        sys.modules.pop("colorsys", None)
+        startup.start()
+        try:
+            importlib.import_module("colorsys")
+        finally:
+            startup.stop()
+        self.assertIn("colorsys", startup.module_times)
+
+
+class TestAPI(TestCase):
+    """Class for testing the JSON API."""
+
+    def setUp(self):
+        """Setup a logged in player and some events."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.events = [Event.objects.create(title="Event " + str(number),
+            description="Test", start=now - datetime.timedelta(hours=1),
+            end=now + datetime.timedelta(hours=number),
+            latitude=50.73722, longitude=-3.53238) for number in range(1, 6)]
+        self.user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        Player.objects.create(user=self.user)
+        self.client.login(username="player", password="P@s5w0rd")
+
+    def test_login_required(self):
+        """Test clients which are not logged in get a 401 response."""
+        self.client.logout()
+        response = self.client.get("/api/v1/events/")
+        self.assertEquals(response.status_code, 401)
+
+    def test_cursor_pagination(self):
+        """Test paging through events with cursors."""
+        titles = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get("/api/v1/events/", {"limit": 2,
+                "cursor": cursor, "fields": "title,status"}).json()
+            self.assertEquals(set(response["results"][0]),
+                    {"title", "status"})
+            titles += [event["title"] for event in response["results"]]
+            cursor = response["next"]
+
+        self.assertEquals(titles, [event.title for event in self.events])
+        response = self.client.get("/api/v1/events/", {"cursor": "nonsense"})
+        self.assertEquals(response.status_code, 400)
+
+        # Cursors which decode but hold values that do not fit the fields.
+        for values in (["garbage", 1], [{"end": 1}, 1]):
+            response = self.client.get("/api/v1/events/", {
+                "cursor": pagination.encode_cursor(values)})
+            self.assertEquals(response.status_code, 400)
+            self.assertIn("error", response.json())
+
+    def test_sparse_fields(self):
+        """Test only the columns of the chosen fields are read."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/events/{}/".format(
+                self.events[0].id), {"fields": "id,title"})
+        self.assertEquals(response.json(), {"id": self.events[0].id,
+            "title": "Event 1"})
+        self.assertNotIn("description", queries[-1]["sql"])
+
+        response = self.client.get("/api/v1/events/", {"fields": "secret"})
+        self.assertEquals(response.status_code, 400)
+
+    def test_submit_score(self):
+        """Test submitting a game updates the leaderboards and profile."""
+        url = "/api/v1/events/{}/games/".format(self.events[0].id)
+        with scored(700):
+            response = self.client.post(url, {"score": 700,
+                "pings": json.loads(PINGS)}, content_type="application/json")
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(response.json()["score"], 700)
+
+        response = self.client.get("/api/v1/events/{}/leaderboard/".format(
+            self.events[0].id), {"fields": "username,score"}).json()
+        self.assertEquals(response["results"], [{"username": "player",
+            "score": 700}])
+        response = self.client.get("/api/v1/users/player/").json()
+        self.assertEquals((response["points"], response["games_played"]),
+                (700, 1))
+
+        response = self.client.post(url, "not json",
+                content_type="application/json")
+        self.assertEquals(response.status_code, 400)
+
+    def test_submit_untrusted(self):
+        """Test games without pings, or for past events, are refused."""
+        url = "/api/v1/events/{}/games/".format(self.events[0].id)
+        response = self.client.post(url, {"score": 5000},
+                content_type="application/json")
+        self.assertEquals(response.status_code, 400)
+
+        self.events[0].end = timezone.now() - datetime.timedelta(minutes=1)
+        self.events[0].save()
+        response = self.client.post(url, {"score": 5000,
+            "pings": json.loads(PINGS)}, content_type="application/json")
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.post("/game/{}/".format(self.events[1].id),
+                {"score": 5000})
+        self.assertEquals(response.status_code, 400)
+        self.assertFalse(Participation.objects.exists())
+        self.assertEquals(Player.objects.get().points, 0)
+
+
+class TestBatchAPI(TestCase):
+    """Class for testing batch changes through the JSON API."""
+
+    def setUp(self):
+        """Setup a logged in game master, an event and treasure chests."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.chests = [TreasureChest.objects.create(name=name, points=100,
+            latitude=50.73722, longitude=-3.53238) for name in ("A", "B")]
+        self.user = User.objects.create_user(username="master",
+                password="P@s5w0rd")
+        Player.objects.create(user=self.user, is_game_master=True)
+        self.client.login(username="master", password="P@s5w0rd")
+
+    def post(self, batch):
+        """Post a batch of treasure chest changes."""
+        return self.client.post("/api/v1/treasure_chests/batch/", batch,
+                content_type="application/json")
+
+    def test_batch_applied(self):
+        """Test creates, updates and deletes are applied together."""
+        response = self.post({
+            "create": [{"name": "C", "points": 50, "latitude": 50.7373,
+                "longitude": -3.5324}],
+            "update": [{"id": self.chests[0].id, "points": 300}],
+            "delete": [self.chests[1].id],
+        })
+        self.assertEquals(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEquals([result["status"] for result in results["create"]
+            + results["update"] + results["delete"]], ["ok", "ok", "ok"])
+
+        new_id = results["create"][0]["id"]
+        self.assertEquals(TreasureChest.objects.get(pk=self.chests[0].id)
+                .points, 300)
+        self.assertEquals(set(EventChest.objects.filter(event=self.event)
+            .values_list("treasure_chest_id", flat=True)),
+            {self.chests[0].id, new_id})
+
+    def test_invalid_batch_not_applied(self):
+        """Test nothing is changed when any item is invalid."""
+        response = self.post({
+            "create": [{"name": "C", "points": 50, "latitude": 50.7373,
+                "longitude": -3.5324}],
+            "update": [{"id": self.chests[0].id, "points": "lots"}],
+            "delete": [12345],
+        })
+        self.assertEquals(response.status_code, 400)
+        results = response.json()["results"]
+        self.assertEquals(results["create"][0]["status"], "ok")
+        self.assertIn("points", results["update"][0]["errors"])
+        self.assertEquals(results["delete"][0]["status"], "not found")
+        self.assertEquals(TreasureChest.objects.count(), 2)
+
+    def test_boolean_ids(self):
+        """Test true and false are not taken as the IDs 1 and 0."""
+        TreasureChest.objects.get_or_create(pk=1, defaults={"name": "One",
+            "points": 100, "latitude": 0, "longitude": 0})
+        for batch in ({"delete": [True]}, {"update": [{"id": True,
+                "points": 300}]}):
+            response = self.post(batch)
+            self.assertEquals(response.status_code, 400)
+        self.assertEquals(TreasureChest.objects.get(pk=1).points, 100)
+
+    def test_game_master_only(self):
+        """Test players cannot make batch changes."""
+        self.user.player.is_game_master = False
+        self.user.player.save()
+        self.assertEquals(self.post({"delete": [self.chests[0].id]})
+                .status_code, 403)
+
+
+class TestNearbyEvents(TestCase):
+    """Class for testing finding live events near a player."""
+
+    def setUp(self):
+        """Setup a logged in player and events around Exeter."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        places = [("Far", 51.5074, -0.1278), ("Near", 50.7372, -3.5324),
+                ("Middle", 50.7236, -3.5275), ("Past", 50.7372, -3.5324)]
+        for title, latitude, longitude in places:
+            start = now - datetime.timedelta(hours=2 if title == "Past"
+                    else 1)
+            Event.objects.create(title=title, description="Test", start=start,
+                    end=start + datetime.timedelta(hours=1.5),
+                    latitude=latitude, longitude=longitude)
+        user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        Player.objects.create(user=user)
+        self.client.login(username="player", password="P@s5w0rd")
+
+    def test_closest_first(self):
+        """Test live events within the radius are ranked by distance."""
+        response = self.client.get("/api/v1/events/nearby/", {
+            "latitude": 50.73722, "longitude": -3.53238,
+            "fields": "title"}).json()
+        self.assertEquals([event["title"] for event in response["results"]],
+                ["Near", "Middle"])
+        self.assertLess(response["results"][0]["distance"],
+                response["results"][1]["distance"])
+
+        response = self.client.get("/api/v1/events/nearby/", {
+            "latitude": 50.73722, "longitude": -3.53238,
+            "radius": 300000, "limit": 1}).json()
+        self.assertEquals(len(response["results"]), 1)
+
+        response = self.client.get("/api/v1/events/nearby/", {
+            "latitude": 91, "longitude": 0})
+        self.assertEquals(response.status_code, 400)
+
+    def test_game_list(self):
+        """Test the game list shows distances when given a location."""
+        response = self.client.get("/game/", {"latitude": 50.73722,
+            "longitude": -3.53238})
+        self.assertEquals([event.title for event
+            in response.context["live_events_list"]], ["Near", "Middle"])
+        self.assertContains(response, "Distance")
+
+
+class TestHeatmap(TestCase):
+    """Class for testing the play activity heatmap."""
+
+    def setUp(self):
+        """Setup a logged in game master and an event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        user = User.objects.create_user(username="master",
+                password="P@s5w0rd")
+        Player.objects.create(user=user, is_game_master=True)
+        self.client.login(username="master", password="P@s5w0rd")
+
+    def play(self, pings):
+        """Submit a game and run the queued tasks."""
+        self.client.post("/game/{}/".format(self.event.id), {"score": 0,
+            "pings": json.dumps(pings)})
+        tasks.run_pending_tasks()
+
+    def test_counts_added(self):
+        """Test presses are counted in cells of every size."""
+        self.play([[50.7, -3.5], [50.7, -3.5], [50.71, -3.51]])
+        self.play([[50.7, -3.5]])
+
+        cell = geo.geohash(50.7, -3.5, 7)
+        self.assertEquals(HeatmapCell.objects.get(kind="ping",
+            geohash=cell).count, 3)
+        self.assertEquals(HeatmapCell.objects.get(kind="ping",
+            geohash=cell[:5]).count, 4)
+
+        expected = list(HeatmapCell.objects.order_by("kind", "geohash")
+                .values_list("kind", "geohash", "count"))
+        call_command("rebuild_heatmap", stdout=io.StringIO())
+        self.assertEquals(list(HeatmapCell.objects.order_by("kind",
+            "geohash").values_list("kind", "geohash", "count")), expected)
+
+    def test_map_view(self):
+        """Test the cells in a map view are given busiest first."""
+        self.play([[50.7, -3.5], [50.7, -3.5], [50.8, -3.6]])
+        response = self.client.get("/api/v1/heatmap/", {"precision": 7,
+            "bbox": "50.6,-3.7,50.9,-3.4"}).json()
+        self.assertEquals([cell[2] for cell in response["cells"]], [2, 1])
+
+        response = self.client.get("/api/v1/heatmap/", {"precision": 7,
+            "bbox": "0,0,1,1"}).json()
+        self.assertEquals(response["cells"], [])
+
+
+class TestListPages(TestCase):
+    """Class for testing the paged events and treasure chests lists."""
+
+    def setUp(self):
+        """Setup a logged in game master, events and treasure chests."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for number in range(7):
+            Event.objects.create(title="Event {}".format(number),
+                    description="Test", start=now,
+                    end=now + datetime.timedelta(hours=number % 3),
+                    latitude=50.73722, longitude=-3.53238)
+            TreasureChest.objects.create(name="Chest {}".format(number),
+                    points=100, latitude=0, longitude=0)
+        user = User.objects.create_user(username="master",
+                password="P@s5w0rd")
+        Player.objects.create(user=user, is_game_master=True)
+        self.client.login(username="master", password="P@s5w0rd")
+
+    def get_all(self, url, name):
+        """Follow the next page links of a list, returning every row."""
+        rows = []
+        response = self.client.get(url)
+        while True:
+            rows += list(response.context[name])
+            if response.context["next_cursor"] is None:
+                return rows
+            response = self.client.get(url, {
+                "cursor": response.context["next_cursor"]})
+
+    @mock.patch("game.views.PAGE_SIZE", 3)
+    def test_pages(self):
+        """Test following the pages gives every row once, in order."""
+        events = self.get_all("/events/", "events_list")
+        self.assertEquals([event.id for event in events],
+                list(Event.objects.order_by("end", "id")
+                    .values_list("id", flat=True)))
+        chests = self.get_all("/treasure_chests/", "treasure_chests_list")
+        self.assertEquals(len(chests), 7)
+        self.assertEquals(set(chests[0]), {"id", "name", "points"})
+
+        response = self.client.get("/events/", {"cursor": "nonsense"})
+        self.assertEquals(response.status_code, 400)
+
+    def test_badly_typed_cursor(self):
+        """Test cursors holding values which do not fit the fields."""
+        for values in (["garbage", 1], [{"end": 1}, 1], ["2021-01-01", "x"]):
+            response = self.client.get("/events/", {
+                "cursor": pagination.encode_cursor(values)})
+            self.assertEquals(response.status_code, 400)
+
+
+class TestEventSearch(TestCase):
+    """Class for testing searching events."""
+
+    def setUp(self):
+        """Setup a logged in player, events and an empty search index."""
+        cache.clear()
+        patcher = mock.patch.object(search, "_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.events = {}
+        for title, description in [("Exeter treasure hunt",
+                "Find the chests around the cathedral"),
+                ("Cathedral run", "A quick game in Exeter"),
+                ("Plymouth hunt", "Chests along the Hoe")]:
+            self.events[title] = Event.objects.create(title=title,
+                    description=description, start=now,
+                    end=now + datetime.timedelta(hours=1),
+                    latitude=50.73722, longitude=-3.53238)
+        user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        Player.objects.create(user=user)
+        self.client.login(username="player", password="P@s5w0rd")
+
+    def titles(self, query, **params):
+        """Return the titles of the events found by a search."""
+        response = self.client.get("/events/", dict(params, q=query))
+        return [event.title for event in response.context["events_list"]]
+
+    def test_ranked(self):
+        """Test matches in the title rank above the description."""
+        self.assertEquals(self.titles("cathedral"), ["Cathedral run",
+            "Exeter treasure hunt"])
+        self.assertEquals(self.titles("exeter"), ["Exeter treasure hunt",
+            "Cathedral run"])
+        self.assertEquals(self.titles("nothing"), [])
+
+    def test_pages(self):
+        """Test following the pages gives every match once."""
+        with mock.patch("game.views.PAGE_SIZE", 1):
+            response = self.client.get("/events/", {"q": "exeter chests"})
+            titles = [response.context["events_list"][0].title]
+            while response.context["next_cursor"]:
+                response = self.client.get("/events/", {"q": "exeter chests",
+                    "cursor": response.context["next_cursor"]})
+                titles.append(response.context["events_list"][0].title)
+        self.assertEquals(sorted(titles), sorted(self.events))
+
+    def test_index_updated(self):
+        """Test the index follows events being saved and deleted."""
+        self.assertEquals(self.titles("plymouth"), ["Plymouth hunt"])
+
+        event = self.events["Plymouth hunt"]
+        event.title = "Torquay hunt"
+        with self.captureOnCommitCallbacks(execute=True):
+            event.save()
+        self.assertEquals(self.titles("plymouth"), [])
+        self.assertEquals(self.titles("torquay"), ["Torquay hunt"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.delete()
+        self.assertEquals(self.titles("torquay"), [])
+
+
+class TestArchive(TestCase):
+    """Class for testing archiving past events."""
+
+    def setUp(self):
+        """Setup a player, an old and a recent event, and games in both."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.old, self.recent = (Event.objects.create(title="Test",
+            description="Test", start=now - datetime.timedelta(days=days),
+            end=now - datetime.timedelta(days=days, hours=-1),
+            latitude=50.73722, longitude=-3.53238) for days in (400, 1))
+        self.chest = TreasureChest.objects.create(name="Chest",
+                latitude=50.73722, longitude=-3.53238)
+        self.user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        self.team = Team.objects.create(name="Red")
+        self.player = Player.objects.create(user=self.user, team=self.team)
+
+        participation, _ = submit_game(self.user, self.old, 500)
+        claim_chests(self.player, [self.chest.id], participation)
+        submit_game(self.user, self.old, 300)
+        submit_game(self.user, self.recent, 200)
+
+    def test_archive(self):
+        """Test old events and their games are moved to the archive."""
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archive_events", days=30, chunk_size=1,
+                    stdout=io.StringIO())
+
+        self.assertEquals(list(Event.objects.values_list("id", flat=True)),
+                [self.recent.id])
+        self.assertEquals(list(ArchivedEvent.objects.values_list("id",
+            flat=True)), [self.old.id])
+        self.assertEquals(sorted(ArchivedParticipation.objects
+            .values_list("score", flat=True)), [300, 500])
+        self.assertEquals(Participation.objects.count(), 1)
+        self.assertFalse(EventChest.objects.filter(event_id=self.old.id)
+                .exists())
+
+        # The claim is kept without its game.
+        claim = ChestClaim.objects.get()
+        self.assertIsNone(claim.participation_id)
+
+    def test_stats_kept(self):
+        """Test archiving keeps statistics and rebuilding them agrees."""
+        self.player.refresh_from_db()
+        points = self.player.points
+        expected_stats = list(PlayerStats.objects.values())
+        expected_daily = list(DailyScore.objects.values("player_id", "start",
+            "points", "games"))
+
+        call_command("archive_events", days=30, stdout=io.StringIO())
+        self.player.refresh_from_db()
+        self.assertEquals(self.player.points, points)
+        self.assertEquals(list(PlayerStats.objects.values()), expected_stats)
+
+        call_command("rebuild_player_stats", stdout=io.StringIO())
+        call_command("rebuild_leaderboards", stdout=io.StringIO())
+        self.assertEquals(list(PlayerStats.objects.values()), expected_stats)
+        self.assertEquals(sorted(DailyScore.objects.values("player_id",
+            "start", "points", "games"), key=lambda row: row["start"]),
+            sorted(expected_daily, key=lambda row: row["start"]))
+
+    def test_delete(self):
+        """Test deleting an event deletes its rows and takes its win away."""
+        stats = PlayerStats.objects.get()
+        self.assertEquals(stats.events_won, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEquals(archive.delete_events([self.old.id],
+                chunk_size=1), 1)
+        self.assertEquals(Participation.objects.count(), 1)
+        self.assertFalse(EventChest.objects.filter(event_id=self.old.id)
+                .exists())
+        self.assertIsNone(ChestClaim.objects.get().participation_id)
+        stats.refresh_from_db()
+        self.assertEquals(stats.events_won, 1)
+        with mock.patch.object(search, "_index", None):
+            events, _ = search.search_events("test")
+        self.assertEquals([event.id for event in events], [self.recent.id])
+
+    def test_delete_totals(self):
+        """Test the deleted games no longer count in any total."""
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.delete_events([self.old.id], chunk_size=1)
+
+        # Only the game in the recent event is left.
+        self.player.refresh_from_db()
+        self.team.refresh_from_db()
+        stats = PlayerStats.objects.get()
+        self.assertEquals(self.player.points, 200)
+        self.assertEquals((stats.games_played, stats.total_score,
+            stats.best_score), (1, 200, 200))
+        self.assertEquals((self.team.points, self.team.games), (200, 1))
+        for rollup in (DailyScore, WeeklyScore):
+            self.assertEquals(list(rollup.objects.values_list("points",
+                "games")), [(200, 1)])
+        self.assertEquals(reconcile.reconcile_points().mismatched, 0)
+
+        # Rebuilding from the games left agrees.
+        expected = list(PlayerStats.objects.values())
+        call_command("rebuild_player_stats", stdout=io.StringIO())
+        self.assertEquals(list(PlayerStats.objects.values()), expected)
+
+
+class TestTeams(TestCase):
+    """Class for testing team scores and the team leaderboard."""
+
+    def setUp(self):
+        """Setup two teams, players in them and an event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.red, self.blue = (Team.objects.create(name=name)
+                for name in ("Red", "Blue"))
+        self.users = [User.objects.create_user(username=username,
+            password="P@s5w0rd") for username in ("first", "second", "third")]
+        for user, team in zip(self.users, (self.red, self.blue, None)):
+            Player.objects.create(user=user, team=team)
+
+    def test_scores_updated(self):
+        """Test games add to the team played for."""
+        # The third player has no team, except for this event.
+        EventTeam.objects.create(event=self.event,
+                player=self.users[2].player, team=self.blue)
+
+        submit_game(self.users[0], self.event, 500)
+        submit_game(self.users[1], self.event, 300)
+        submit_game(self.users[2], self.event, 400)
+
+        self.red.refresh_from_db()
+        self.blue.refresh_from_db()
+        self.assertEquals((self.red.points, self.red.games), (500, 1))
+        self.assertEquals((self.blue.points, self.blue.games), (700, 2))
+
+        self.client.login(username="first", password="P@s5w0rd")
+        response = self.client.get("/leaderboard/teams/")
+        self.assertEquals(list(response.context["top_teams_list"]),
+                [self.blue, self.red])
+
+    def test_rebuild(self):
+        """Test rebuilding gives the same team scores."""
+        submit_game(self.users[0], self.event, 500)
+        submit_game(self.users[1], self.event, 300)
+        submit_game(self.users[2], self.event, 200)
+        expected = list(Team.objects.order_by("pk").values())
+
+        Team.objects.update(points=0, games=0)
+        call_command("rebuild_team_scores", stdout=io.StringIO())
+        self.assertEquals(list(Team.objects.order_by("pk").values()),
+                expected)
+
+    def test_rescore_adjusts_totals(self):
+        """Test re-scoring adjusts every total and the winner."""
+        for user, score in ((self.users[1], None), (self.users[0], 5000)):
+            self.client.login(username=user.username, password="P@s5w0rd")
+            with scored(score) if score else contextlib.nullcontext():
+                self.client.post("/game/{}/".format(self.event.id),
+                        {"score": 0, "pings": PINGS})
+        score = Participation.objects.get(player=self.users[1].player).score
+        self.event.refresh_from_db()
+        self.assertEquals(self.event.winner, self.users[0].player)
+
+        call_command("rescore_participations", "--apply",
+                stdout=io.StringIO())
+
+        # The game scored too high now counts the same as the other.
+        for user, team in zip(self.users, (self.red, self.blue)):
+            user.player.refresh_from_db()
+            team.refresh_from_db()
+            player_stats = PlayerStats.objects.get(pk=user.player.pk)
+            self.assertEquals(user.player.points, score)
+            self.assertEquals((player_stats.total_score,
+                player_stats.best_score), (score, score))
+            self.assertEquals(DailyScore.objects.get(player=user.player)
+                    .points, score)
+            self.assertEquals(WeeklyScore.objects.get(player=user.player)
+                    .points, score)
+            self.assertEquals((team.points, team.games), (score, 1))
+
+        # The first of the tied games wins.
+        self.event.refresh_from_db()
+        self.assertEquals((self.event.top_score, self.event.winner),
+                (score, self.users[1].player))
+        self.assertEquals([PlayerStats.objects.get(pk=user.player.pk)
+            .events_won for user in self.users[:2]], [0, 1])
+
+
+class TestSingleFlight(SimpleTestCase):
+    """Class for testing computing cached values once at a time."""
+
+    def setUp(self):
+        """Setup an empty cache and a count of computed values."""
+        cache.clear()
+        self.computed = []
+
+    def compute(self, value):
+        """Slowly compute a value, recording it was computed."""
+        self.computed.append(value)
+        time.sleep(0.2)
+        return value
+
+    def test_burst(self):
+        """Test a burst of requests computes each value once."""
+        keys = ["first", "second"] * 10
+        barrier = threading.Barrier(len(keys))
+        results = []
+
+        def request(key):
+            barrier.wait()
+            results.append(caches.get_or_compute(key, lambda:
+                self.compute(key), 60))
+
+        threads = [threading.Thread(target=request, args=(key,))
+                for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(sorted(self.computed), ["first", "second"])
+        self.assertEquals(sorted(results), sorted(keys))
+
+    def test_stale(self):
+        """Test the expired value is given while another worker refreshes."""
+        caches.refresh("key", lambda: "old", 0)
+        cache.add("key:lock", True)
+        self.assertEquals(caches.get_or_compute("key", lambda:
+            self.compute("new"), 60), "old")
+        self.assertEquals(self.computed, [])
+
+        cache.delete("key:lock")
+        self.assertEquals(caches.get_or_compute("key", lambda:
+            self.compute("new"), 60), "new")
+
+    def test_lock_taken_over(self):
+        """Test a slow worker does not release a lock taken since."""
+        def compute():
+            # The lock expires and another worker takes it.
+            cache.set("key:lock", "other")
+            return "new"
+
+        self.assertEquals(caches.get_or_compute("key", compute, 60), "new")
+        self.assertEquals(cache.get("key:lock"), "other")
+
+    def test_early_expiry(self):
+        """Test slow values are sometimes refreshed before they expire."""
+        cache.set("key", ("old", time.time() + 1, 0.5))
+        with mock.patch("game.caches.random.random", return_value=0.1):
+            self.assertEquals(caches.get_or_compute("key", lambda:
+                self.compute("new"), 60), "old")
+        with mock.patch("game.caches.random.random", return_value=0.99):
+            self.assertEquals(caches.get_or_compute("key", lambda:
+                self.compute("new"), 60), "new")
+
+
+class TestSubmissionKeys(TestCase):
+    """Class for testing repeated game submissions are only saved once."""
+
+    def setUp(self):
+        """Setup a logged in player and a live event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        self.player = Player.objects.create(user=user)
+        self.client.login(username="player", password="P@s5w0rd")
+        self.url = "/game/{}/".format(self.event.id)
+
+    def test_bad_score(self):
+        """Test games without a whole number score are rejected."""
+        for data in ({"pings": PINGS}, {"score": "high", "pings": PINGS}):
+            self.assertEquals(self.client.post(self.url, data).status_code,
+                    400)
+        self.assertFalse(Participation.objects.exists())
+
+    def test_replayed(self):
+        """Test submitting the game page again redirects to the same game."""
+        key = self.client.get(self.url).context["submission_key"]
+        data = {"score": 500, "pings": PINGS, "key": key}
+        with scored(500):
+            first = self.client.post(self.url, data)
+            second = self.client.post(self.url, data)
+
+            # The cache forgetting the key does not save it again either.
+            cache.clear()
+            third = self.client.post(self.url, data)
+
+        self.assertRedirects(first, "/game_over/{}/".format(
+            Participation.objects.get().id))
+        self.assertEquals(second.url, first.url)
+        self.assertEquals(third.url, first.url)
+        self.player.refresh_from_db()
+        self.assertEquals(self.player.points, 500)
+
+        # A new game page gives a new key.
+        key = self.client.get(self.url).context["submission_key"]
+        self.client.post(self.url, {"score": 300, "pings": PINGS, "key": key})
+        self.assertEquals(Participation.objects.count(), 2)
+
+    def test_api(self):
+        """Test the API gives the same game for a repeated key."""
+        url = "/api/v1/events/{}/games/".format(self.event.id)
+        responses = [self.client.post(url, {"score": 500,
+            "pings": json.loads(PINGS)}, content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="abc") for _ in range(2)]
+        self.assertEquals(responses[0].json(), responses[1].json())
+        self.assertEquals(Participation.objects.count(), 1)
+
+        response = self.client.post(url, {"score": 500},
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="x" * 65)
+        self.assertEquals(response.status_code, 400)
+
+
+class TestPresence(TestCase):
+    """Class for testing counting the players active in live events."""
+
+    def setUp(self):
+        """Setup a logged in player and a live and a past event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.live, self.past = (Event.objects.create(title="Test",
+            description="Test", start=now - datetime.timedelta(days=days),
+            end=now - datetime.timedelta(days=days, hours=-1),
+            latitude=50.73722, longitude=-3.53238) for days in (0, 2))
+        user = User.objects.create_user(username="player",
+                password="P@s5w0rd")
+        self.player = Player.objects.create(user=user)
+        self.client.login(username="player", password="P@s5w0rd")
+
+    def test_heartbeats(self):
+        """Test each player is counted once while they send heartbeats."""
+        url = "/game/{}/heartbeat/".format(self.live.id)
+        self.assertEquals(self.client.post(url).json(), {"active": 1})
+        self.assertEquals(self.client.post(url).json(), {"active": 1})
+        presence.heartbeat(self.live.id, 1000)
+
+        response = self.client.get("/game/")
+        self.assertEquals(response.context["live_events_list"][0]
+                .players_active, 2)
+        response = self.client.get("/api/v1/events/presence/")
+        self.assertEquals(response.json(), {"results": [{"id": self.live.id,
+            "active": 2}]})
+
+        self.assertEquals(self.client.post("/game/{}/heartbeat/".format(
+            self.past.id)).status_code, 403)
+
+    def test_window(self):
+        """Test players move between buckets and expire out of the window."""
+        bucket = presence.current_bucket()
+        with mock.patch("game.presence.current_bucket",
+                return_value=bucket):
+            presence.heartbeat(self.live.id, 1)
+            presence.heartbeat(self.live.id, 2)
+        with mock.patch("game.presence.current_bucket",
+                return_value=bucket + 2):
+            presence.heartbeat(self.live.id, 1)
+            self.assertEquals(presence.get_counts([self.live.id]),
+                    {self.live.id: 2})
+        with mock.patch("game.presence.current_bucket",
+                return_value=bucket + presence.WINDOW_BUCKETS):
+            self.assertEquals(presence.get_counts([self.live.id]),
+                    {self.live.id: 1})
+        with mock.patch("game.presence.current_bucket",
+                return_value=bucket + 2 + presence.WINDOW_BUCKETS):
+            self.assertEquals(presence.get_counts([self.live.id]),
+                    {self.live.id: 0})
+
+
+class TestChestClusters(TestCase):
+    """Class for testing treasure chest clusters for map tiles."""
+
+    def setUp(self):
+        """Setup a logged in game master and treasure chests."""
+        self.chests = [TreasureChest.objects.create(name=name, points=points,
+            latitude=latitude, longitude=longitude)
+            for name, points, latitude, longitude in [
+                ("A", 100, 50.73722, -3.53238),
+                ("B", 200, 50.73750, -3.53200),
+                ("C", 50, 50.37153, -4.14305)]]
+        user = User.objects.create_user(username="master",
+                password="P@s5w0rd")
+        Player.objects.create(user=user, is_game_master=True)
+        self.client.login(username="master", password="P@s5w0rd")
+
+    def get_clusters(self):
+        """Return the totals of every cell."""
+        return [(cluster.geohash, cluster.count, cluster.points,
+            round(cluster.latitude_total, 6), round(cluster.longitude_total, 6))
+            for cluster in ChestCluster.objects.order_by("geohash")]
+
+    def assertMatchesRebuild(self):
+        """Check the updated clusters are the same as recounting them."""
+        updated = self.get_clusters()
+        call_command("rebuild_chest_clusters", stdout=io.StringIO())
+        self.assertEquals(updated, self.get_clusters())
+
+    def test_updated(self):
+        """Test clusters follow treasure chests being saved and deleted."""
+        self.assertEquals(ChestCluster.objects.get(geohash="g").count, 3)
+        self.chests[0].latitude = 50.37
+        self.chests[0].longitude = -4.14
+        self.chests[0].save()
+        self.chests[1].delete()
+        self.assertMatchesRebuild()
+        self.assertEquals(ChestCluster.objects.get(geohash="g").points, 150)
+
+    def test_batch(self):
+        """Test clusters follow batch changes."""
+        response = self.client.post("/api/v1/treasure_chests/batch/", {
+            "create": [{"name": "D", "points": 70, "latitude": 51.5,
+                "longitude": -0.12}],
+            "update": [{"id": self.chests[0].id, "points": 300}],
+            "delete": [self.chests[2].id],
+        }, content_type="application/json")
+        self.assertEquals(response.status_code, 200)
+        self.assertMatchesRebuild()
+
+    def test_tiles(self):
+        """Test tiles give bounded clusters with counts and points."""
+        response = self.client.get(
+            "/api/v1/treasure_chests/clusters/0/0/0/")
+        self.assertEquals(response.json()["clusters"],
+                [[50.73736, -3.53219, 2, 300], [50.37153, -4.14305, 1, 50]])
+
+        # Zoomed into Exeter, the two chests there are apart.
+        x, y = 16062, 11007
+        min_lat, min_lng, max_lat, max_lng = clusters.tile_bounds(15, x, y)
+        self.assertTrue(min_lat < 50.7372 < max_lat)
+        self.assertTrue(min_lng < -3.5324 < max_lng)
+        tile = self.client.get("/api/v1/treasure_chests/clusters/15/{}/{}/"
+                .format(x, y)).json()["clusters"]
+        self.assertEquals(sorted(cluster[2:] for cluster in tile),
+                [[1, 100], [1, 200]])
+
+        response = self.client.get(
+            "/api/v1/treasure_chests/clusters/1/2/0/")
+        self.assertEquals(response.status_code, 400)
+
+
+class TestProfileCache(TestCase):
+    """Class for testing cached profiles."""
+
+    def setUp(self):
+        """Setup two logged in players and an event."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.event = Event.objects.create(title="Test", description="Test",
+                start=now, end=now + datetime.timedelta(hours=1),
+                latitude=50.73722, longitude=-3.53238)
+        self.users = [User.objects.create_user(username=username,
+            password="P@s5w0rd") for username in ("first", "second")]
+        for user in self.users:
+            Player.objects.create(user=user)
+        self.client.login(username="first", password="P@s5w0rd")
+
+    def test_cached(self):
+        """Test profiles are only read again after they change."""
+        with self.assertNumQueries(1):
+            profiles.get_profile_html("first")
+        with self.assertNumQueries(0):
+            self.assertIn("Points: 0", profiles.get_profile_html("first"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_game(self.users[0], self.event, 500)
+        self.assertIn("Points: 500", profiles.get_profile_html("first"))
+
+        self.client.post("/update_email/", {"email": "first@example.com"})
+        response = self.client.get("/users/first/")
+        self.assertContains(response, "Email: first@example.com")
+        self.assertContains(response, "Update Email")
+        self.assertEquals(self.client.get("/users/nobody/").status_code, 404)
+
+    def test_previous_winner(self):
+        """Test losing an event win changes the profile of the winner."""
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_game(self.users[0], self.event, 500)
+        self.assertIn("Events won: 1", profiles.get_profile_html("first"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_game(self.users[1], self.event, 700)
+        self.assertIn("Events won: 0", profiles.get_profile_html("first"))
+
+
+class TestReconcilePoints(TestCase):
+    """Class for testing reconciling player points with their games."""
+
+    def setUp(self):
+        """Setup players with games, one archived."""
+        cache.clear()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.old, self.event = (Event.objects.create(title="Test",
+            description="Test", start=now - datetime.timedelta(days=days),
+            end=now - datetime.timedelta(days=days, hours=-1),
+            latitude=50.73722, longitude=-3.53238) for days in (400, 0))
+        self.users = [User.objects.create_user(username=username,
+            password="P@s5w0rd") for username in ("first", "second", "third")]
+        for user in self.users:
+            Player.objects.create(user=user)
+
+        submit_game(self.users[0], self.old, 500)
+        submit_game(self.users[0], self.event, 300)
+        submit_game(self.users[1], self.event, 200)
+        call_command("archive_events", days=30, stdout=io.StringIO())
+
+    def get_points(self):
+        """Return the points of every player."""
+        return list(Player.objects.order_by("id")
+                .values_list("points", flat=True))
+
+    def test_consistent(self):
+        """Test correct points, including archived games, are left alone."""
+        output = io.StringIO()
+        call_command("reconcile_points", "--apply", stdout=output)
+        self.assertIn("Checked 3 players", output.getvalue())
+        self.assertIn("0 wrong", output.getvalue())
+        self.assertEquals(self.get_points(), [800, 200, 0])
+
+    def test_fixed(self):
+        """Test drifted points are reported, and fixed with --apply."""
+        Player.objects.filter(user=self.users[0]).update(points=700)
+        Player.objects.filter(user=self.users[2]).update(points=50)
+
+        drift = reconcile.reconcile_points(chunk_size=1)
+        self.assertEquals(drift, reconcile.Drift(players=3, mismatched=2,
+            fixed=0, total=-50, absolute=150, largest=100))
+        self.assertEquals(self.get_points(), [700, 200, 50])
+
+        drift = reconcile.reconcile_points(apply=True, chunk_size=1)
+        self.assertEquals(drift.fixed, 2)
+        self.assertEquals(self.get_points(), [800, 200, 0])
@@ -5,7 +5,7 @@ The `urlpatterns` list routes URLs to views.
 
 from django.urls import path
 
-from . import views
+from . import api, views
 
 
 # URL to view routing.
@@ -14,8 +14,14 @@ urlpatterns = [
     path("", views.home, name="home"),
     path("game/", views.game_list, name="game"),
     path("game/<int:event_id>/", views.game, name="play game"),
+    path("game/<int:event_id>/chests/", views.event_chests, name="event chests"),
+    path("game/<int:event_id>/heartbeat/", views.heartbeat, name="heartbeat"),
     path("game_over/<int:participation_id>/", views.game_over, name="game over"),
     path("leaderboard/", views.leaderboard, name="leaderboard"),
+    path("leaderboard/teams/", views.team_leaderboard, name="team leaderboard"),
+    path("sw.js", views.service_worker, name="service worker"),
+    path("_ah/warmup", views.warmup, name="warmup"),
+    path("tasks/run/", views.run_tasks, name="run tasks"),
 
     # Users and authentication.
     path("login/", views.log_in, name="login"),
@@ -37,4 +43,20 @@ urlpatterns = [
     path("treasure_chests/new/", views.create_treasure_chest, name="create treasure chest"),
     path("treasure_chests/<int:treasure_chest_id>/update/", views.update_treasure_chest, name="update treasure chest"),
     path("treasure_chests/<int:treasure_chest_id>/delete/", views.delete_treasure_chest, name="delete treasure chest"),
+
+    # JSON API, version 1.
+    path("api/v1/events/", api.event_list, name="api events"),
+    path("api/v1/events/nearby/", api.nearby_events, name="api nearby events"),
+    path("api/v1/events/presence/", api.event_presence, name="api event presence"),
+    path("api/v1/events/batch/", api.batch, {"batch_type": "events"}, name="api event batch"),
+    path("api/v1/events/<int:event_id>/", api.event_details, name="api event"),
+    path("api/v1/events/<int:event_id>/chests/", api.event_chests, name="api event chests"),
+    path("api/v1/events/<int:event_id>/leaderboard/", api.event_leaderboard, name="api event leaderboard"),
+    path("api/v1/events/<int:event_id>/games/", api.submit_score, name="api submit score"),
+    path("api/v1/treasure_chests/", api.treasure_chest_list, name="api treasure chests"),
+    path("api/v1/treasure_chests/batch/", api.batch, {"batch_type": "treasure_chests"}, name="api treasure chest batch"),
+    path("api/v1/treasure_chests/clusters/<int:zoom>/<int:x>/<int:y>/", api.treasure_chest_clusters, name="api treasure chest clusters"),
+    path("api/v1/heatmap/", api.heatmap_cells, name="api heatmap"),
+    path("api/v1/leaderboard/", api.leaderboard, name="api leaderboard"),
+    path("api/v1/users/<str:username>/", api.user_details, name="api user"),
 ]
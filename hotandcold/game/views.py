@@ -3,18 +3,75 @@
 Handles actual functionality of different views.
 """
 
+import hashlib
+import os
+import time
+
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import PermissionDenied
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render, get_object_or_404
-from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition, require_POST
+
+from hotandcold import startup
 
+from . import leaderboards, nearby, presence, profiles, teams
+from .archive import delete_events
+from .caches import get_leaderboard, get_live_events
 from .models import Event, Player, Participation, TreasureChest
 from .forms import UserRegistrationForm, UserUpdateEmailForm, \
     EventCreationForm, TreasureChestCreationForm
+from .chests import chest_payload, claimed_event_chest_ids
+from .pagination import paginate
+from .ratelimit import ratelimit
+from .routers import use_replica
+from .search import search_events
+from .scoring import parse_pings
+from .submissions import new_submission_key, submit_game
+from .tasks import purge_finished_tasks, requeue_stale_tasks, \
+    run_pending_tasks
+from .warmup import warm_up
+
+
+# Number of rows on each page of the events and treasure chests lists.
+PAGE_SIZE = 50
+
+# Seconds the cron job spends running background tasks, less than the
+# minute between runs.
+RUN_TASKS_SECONDS = 50
+
+# Static files used by every page, precached by the service worker.
+SERVICE_WORKER_STATIC_FILES = [
+    "game/img/fireIcon.png",
+    "game/img/apple-touch-icon.png",
+    "game/vendor/aos/aos.css",
+    "game/vendor/bootstrap/css/bootstrap.min.css",
+    "game/vendor/bootstrap-icons/bootstrap-icons.css",
+    "game/vendor/bootstrap-icons/fonts/bootstrap-icons.woff2",
+    "game/vendor/boxicons/css/boxicons.min.css",
+    "game/vendor/boxicons/fonts/boxicons.woff2",
+    "game/vendor/glightbox/css/glightbox.min.css",
+    "game/vendor/remixicon/remixicon.css",
+    "game/vendor/remixicon/remixicon.woff2",
+    "game/vendor/swiper/swiper-bundle.min.css",
+    "game/css/style.css",
+    "game/vendor/aos/aos.js",
+    "game/vendor/bootstrap/js/bootstrap.bundle.min.js",
+    "game/vendor/glightbox/js/glightbox.min.js",
+    "game/vendor/isotope-layout/isotope.pkgd.min.js",
+    "game/vendor/swiper/swiper-bundle.min.js",
+    "game/vendor/waypoints/noframework.waypoints.js",
+    "game/vendor/php-email-form/validate.js",
+    "game/js/main.js",
+]
 
 
 def home(request):
@@ -31,11 +88,14 @@ def home(request):
     return render(request, "game/home.html", None)
 
 
+@use_replica
 @login_required(login_url="/login")
 def game_list(request):
     """Game list view.
 
-    Shows a list of live games to play.
+    Shows a list of live games to play, with the number of players active
+    in each. If the "latitude" and "longitude" of the player are given, only
+    the closest live games are shown, with their distance.
 
     Arguments:
     request - Django object containing request information.
@@ -46,22 +106,46 @@ def game_list(request):
     # Set the title.
     title = "Game List"
 
-    # Get current datetime and list of events which are live.
-    current_datetime = timezone.now()
-    live_events_list = Event.objects.filter(start__lte=current_datetime,
-            end__gte=current_datetime)
+    # Get list of events which are live, closest first if the location of
+    # the player was given.
+    try:
+        latitude, longitude, radius = nearby.parse_location(request.GET)
+    except ValueError:
+        live_events_list = get_live_events()
+        is_nearby = False
+    else:
+        live_events_list = []
+        for event, distance in nearby.live_events_near(latitude, longitude,
+                radius):
+            event.distance = distance
+            live_events_list.append(event)
+        is_nearby = True
+
+    # Count the players in every event at once.
+    counts = presence.get_counts([event.id for event in live_events_list])
+    for event in live_events_list:
+        event.players_active = counts[event.id]
 
     return render(request, "game/game_list.html", {"title": title,
-        "live_events_list": live_events_list})
+        "live_events_list": live_events_list, "is_nearby": is_nearby})
 
 
+@never_cache
 @login_required(login_url="/login")
+@ratelimit("game")
 def game(request, event_id):
     """Game view.
 
     If the request type is POST and the user is logged in, save the user score
     and redirect the user to the profile page. Otherwise, display the game.
 
+    The positions the button was pressed at must be submitted with the
+    score, which is worked out on the server from them instead of trusting
+    the submitted one (see submissions.submit_game). The game page
+    is given a new submission key, so submitting it again redirects to the
+    same game over page instead of saving another game. It is never cached,
+    so a stored copy cannot give an old key to a new game.
+
     Arguments:
     request - Django object containing request information.
     event_id - ID of event to use.
@@ -78,18 +162,21 @@ def game(request, event_id):
     if request.method == "POST":
         # Check if the user is logged in.
         if request.user.is_authenticated:
-            # Get the score, event, user and player.
-            score = int(request.POST["score"])
+            # Get the score, event, positions and submission key.
+            try:
+                score = int(request.POST["score"])
+            except (KeyError, ValueError):
+                raise BadRequest("The score must be a whole number.")
             event = get_object_or_404(Event, pk=event_id)
-            player = Player.objects.get(user=request.user)
+            pings = parse_pings(request.POST.get("pings", ""))
+            key = request.POST.get("key") or None
 
-            # Increase the player score. 
-            player.points += score
-            player.save()
-
-            # Create participation.
-            participation = Participation(event=event, player=player, score=score)
-            participation.save()
+            # Save the game, unless it was saved before.
+            try:
+                participation, _ = submit_game(request.user, event, score,
+                        pings, key)
+            except ValueError as exception:
+                raise BadRequest(str(exception))
 
             # Redirect to the profile view.
             return redirect("game over", participation_id=participation.id)
@@ -100,13 +187,110 @@ def game(request, event_id):
         # Event is not live, do not allow user to go further.
         raise PermissionDenied
 
-    # Create list of coordinates from treasure chests.
-    treasure_chest_list = [[float(t.latitude), float(t.longitude), t.points] for t in
-            TreasureChest.objects.all()]
+    # The treasure chests are loaded separately (see event_chests), only
+    # the ones the player has already claimed are needed here.
+    claimed_chest_ids = claimed_event_chest_ids(request.user.player, event)
 
     # Show the game.
     return render(request, "game/game.html", {"title": title, "event": event,
-        "treasure_chest_list": treasure_chest_list})
+        "claimed_chest_ids": claimed_chest_ids,
+        "submission_key": new_submission_key(),
+        "heartbeat_seconds": presence.HEARTBEAT_SECONDS})
+
+
+@login_required(login_url="/login")
+@require_POST
+def heartbeat(request, event_id):
+    """Presence heartbeat view.
+
+    Record that the user is playing a live event, sent regularly by the
+    game page (see presence.py).
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event being played.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response with the
+    number of players active in the event.
+    """
+    # Check the event is live, without going to the database.
+    if event_id not in {event.id for event in get_live_events()}:
+        raise PermissionDenied
+
+    presence.heartbeat(event_id, request.user.player.id)
+    return JsonResponse({"active": presence.get_counts([event_id])[event_id]})
+
+
+def can_see_chests(request, event):
+    """Check if the user is allowed to see the treasure chests of an event.
+
+    Arguments:
+    request - Django object containing request information.
+    event (Event) - the event.
+
+    Returns:
+    allowed (bool) - True if the event is live or the user is a game master.
+    """
+    return (event.get_status() == "Live"
+            or request.user.player.is_game_master)
+
+
+def event_chests_etag(request, event_id):
+    """Return the ETag of the treasure chest payload of an event.
+
+    The payload only changes when the chest version of the Event does, so
+    the ETag can be worked out without building it. Users who cannot see
+    the payload get no ETag, so they cannot find out if it has changed.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event.
+
+    Returns:
+    etag (str) - ETag of the payload, None if the event does not exist or
+    the user cannot see it.
+    """
+    event = (Event.objects.filter(pk=event_id)
+            .only("start", "end", "chest_version").first())
+    if event is None or not can_see_chests(request, event):
+        return None
+
+    return "{}.{}.{}".format(event_id, event.chest_version,
+            request.GET.get("since", ""))
+
+
+@login_required(login_url="/login")
+@condition(etag_func=event_chests_etag)
+def event_chests(request, event_id):
+    """Event treasure chests view.
+
+    Give the treasure chests in play for an event as compact JSON. If the
+    "since" parameter is given, only treasure chests changed since that
+    chest version are included (see chests.chest_payload). Browsers keep
+    the response but check the ETag before using it again.
+
+    Arguments:
+    request - Django object containing request information.
+    event_id (int) - ID of the event.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response.
+    """
+    # Get event and check the user is allowed to see its treasure chests.
+    event = get_object_or_404(Event, pk=event_id)
+    if not can_see_chests(request, event):
+        raise PermissionDenied
+
+    # Get the version the client already has.
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        since = None
+
+    response = JsonResponse(chest_payload(event, since))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @login_required(login_url="/login")
@@ -133,11 +317,13 @@ def game_over(request, participation_id):
         "participation": participation})
 
 
+@use_replica
 @login_required(login_url="/login")
 def leaderboard(request):
     """Leaderboard view.
 
-    Display the top 10 players by total score.
+    Display the top 10 players by total score. The "window" parameter can
+    be "day" or "week" to rank players by their points today or this week.
 
     Arguments:
     request - Django object containing request information.
@@ -147,11 +333,123 @@ def leaderboard(request):
     """
     title = "Leaderboard"
 
-    top_players_list = Player.objects.order_by("-points")[:10]
+    # Get the window to rank players over.
+    window = request.GET.get("window", "all")
+    if window not in leaderboards.WINDOWS:
+        window = "all"
+
+    top_players_list = get_leaderboard(window)
     return render(request, "game/leaderboard.html", {"title": title,
-        "top_players_list": top_players_list})
+        "top_players_list": top_players_list, "window": window})
+
+
+@use_replica
+@login_required(login_url="/login")
+def team_leaderboard(request):
+    """Team leaderboard view.
+
+    Display the top 10 teams by total score.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    render - Django function to give a HTTP response with a template.
+    """
+    title = "Team leaderboard"
+
+    top_teams_list = teams.top_teams()
+    return render(request, "game/team_leaderboard.html", {"title": title,
+        "top_teams_list": top_teams_list})
+
+
+def service_worker(request):
+    """Service worker view.
+
+    Give the service worker script which makes the game work offline. It is
+    served by the app rather than as a static file so that it can control
+    every page. The cache version is worked out from the static files, so
+    browsers download them again when any of them change.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    render - Django function to give a HTTP response with a template.
+    """
+    # Work out the cache version from the static files.
+    version = hashlib.md5()
+    for path in SERVICE_WORKER_STATIC_FILES:
+        version.update(path.encode())
+        full_path = finders.find(path)
+        if full_path:
+            version.update(str(os.path.getmtime(full_path)).encode())
+
+    response = render(request, "game/sw.js", {
+        "version": version.hexdigest()[:12],
+        "static_url": static(""),
+        "static_files": [static(path) for path in SERVICE_WORKER_STATIC_FILES],
+        }, content_type="application/javascript")
+
+    # Browsers should always check for a new service worker.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def warmup(request):
+    """App Engine warmup view.
+
+    Called by App Engine when a new instance starts, before it is given any
+    traffic. Does the slow work of a first request and logs how long
+    starting the instance took.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    HttpResponse - Django object giving an empty response.
+    """
+    with startup.step("warmup"):
+        warm_up()
+
+    startup.stop()
+    startup.log_report()
+    return HttpResponse()
+
+
+def run_tasks(request):
+    """App Engine cron view for background tasks.
+
+    Called every minute by App Engine cron (see cron.yaml), as App Engine
+    standard cannot keep a run_worker process running. Runs queued tasks,
+    such as heatmap updates, for up to RUN_TASKS_SECONDS. App Engine drops
+    the X-Appengine-Cron header from requests which do not come from cron.
+
+    Arguments:
+    request - Django object containing request information.
+
+    Returns:
+    JsonResponse - Django object to give a JSON HTTP response with the
+    number of tasks run.
+    """
+    if request.headers.get("X-Appengine-Cron") != "true":
+        raise PermissionDenied
+
+    # Run tasks until the queue is empty or the time is up.
+    requeue_stale_tasks()
+    purge_finished_tasks()
+    deadline = time.monotonic() + RUN_TASKS_SECONDS
+    count = 0
+    while time.monotonic() < deadline:
+        ran = run_pending_tasks()
+        if not ran:
+            break
+        count += ran
 
+    return JsonResponse({"tasks": count})
 
+
+@ratelimit("login")
 def log_in(request):
     """Login view.
 
@@ -212,6 +510,7 @@ def log_out(request):
     return redirect("home")
 
 
+@ratelimit("register")
 def register(request):
     """Account creation/registration view.
 
@@ -257,6 +556,7 @@ def register(request):
         "form": form})
 
 
+@use_replica
 @login_required(login_url="/login")
 def user_details(request, username):
     """User details view.
@@ -271,14 +571,16 @@ def user_details(request, username):
     Returns:
     render - Django function to give a HTTP response with a template.
     """
-    # Get user by username.
-    user = get_object_or_404(User, username=username)
+    # Get the details of the user, from the cache if they have not changed.
+    profile_html = profiles.get_profile_html(username)
+    if profile_html is None:
+        raise Http404
 
     # Set title to include username.
     title = "Profile: " + username
 
     return render(request, "game/user.html", {"title": title,
-        "show_user": user})
+        "username": username, "profile_html": profile_html})
 
 
 @login_required(login_url="/login")
@@ -311,9 +613,11 @@ def update_user_email(request):
             user = request.user
             email = form.cleaned_data.get("email")
             
-            # Save the new user details.
+            # Save the new user details and stop showing the cached
+            # profile.
             user.email = email
             user.save()
+            profiles.bump_version(user.username)
 
             # Show message of success to user.
             messages.success(request, "User email updated successfully!")
@@ -330,11 +634,16 @@ def update_user_email(request):
         "form": form})
 
 
+@use_replica
 @login_required(login_url="/login")
 def list_events(request):
     """List events view.
 
-    Shows a list of all events.
+    Shows a page of events ordered by the end datetime, only reading the
+    displayed columns. The "cursor" parameter gives the page after the one
+    it came from (see pagination.py). If the "q" parameter is given, the
+    events matching it are shown instead, most relevant first (see
+    search.py).
 
     Arguments:
     request - Django object containing request information.
@@ -345,13 +654,26 @@ def list_events(request):
     # Set title.
     title = "List Events"
 
-    # Get list of events ordered by the end datetime.
-    events_list = Event.objects.order_by("end")
+    # Get a page of the events matching the search, or of every event
+    # ordered by the end datetime.
+    query = request.GET.get("q", "").strip()
+    if query:
+        try:
+            events_list, next_cursor = search_events(query,
+                    request.GET.get("cursor"), PAGE_SIZE)
+        except ValueError:
+            raise BadRequest("Invalid cursor.")
+    else:
+        events_list, next_cursor = get_page(request,
+                Event.objects.only("id", "title", "start", "end"),
+                ["end", "id"])
 
     return render(request, "game/list_events.html", {"title": title,
-        "events_list": events_list})
+        "events_list": events_list, "next_cursor": next_cursor,
+        "query": query})
 
 
+@use_replica
 @login_required(login_url="/login")
 def event_details(request, event_id):
     """Event details view.
@@ -411,10 +733,12 @@ def create_event(request):
             end = form.cleaned_data.get("end")
             latitude = form.cleaned_data.get("latitude")
             longitude = form.cleaned_data.get("longitude")
+            game_bound = form.cleaned_data.get("game_bound")
 
             # Create event with fields.
             event = Event(title=title, description=description, start=start,
-                    end=end, latitude=latitude, longitude=longitude)
+                    end=end, latitude=latitude, longitude=longitude,
+                    game_bound=game_bound)
             event.save()
 
             # Show message of success to user.
@@ -473,6 +797,7 @@ def update_event(request, event_id):
             event.end = form.cleaned_data.get("end")
             event.latitude = form.cleaned_data.get("latitude")
             event.longitude = form.cleaned_data.get("longitude")
+            event.game_bound = form.cleaned_data.get("game_bound")
 
             # Save the event.
             event.save()
@@ -494,6 +819,7 @@ def update_event(request, event_id):
         "end": event.end,
         "latitude": event.latitude,
         "longitude": event.longitude,
+        "game_bound": event.game_bound,
         })
     return render(request, "game/modify_object.html", {"title": title,
         "form": form, "object": event, "modification": "Update",
@@ -518,8 +844,8 @@ def delete_event(request, event_id):
     # Check if the user is a game master.
     check_user_is_game_master(request)
 
-    # Delete the object.
-    Event.objects.filter(pk=event_id).delete()
+    # Delete the object and its games, taking away its win.
+    delete_events([event_id])
 
     # Display message informing the user object has been deleted.
     messages.success(request, "Event " + str(event_id) + " deleted!")
@@ -528,11 +854,13 @@ def delete_event(request, event_id):
     return redirect("list events")
 
 
+@use_replica
 @login_required(login_url="/login")
 def list_treasure_chests(request):
     """TreasureChest list view.
 
-    Shows a list of all treasure chests.
+    Shows a page of treasure chests. The "cursor" parameter gives the page
+    after the one it came from (see pagination.py).
 
     Arguments:
     request - Django object containing request information.
@@ -546,11 +874,13 @@ def list_treasure_chests(request):
     # Set title.
     title = "List Treasure Chests"
 
-    # Get list of treasure chests.
-    treasure_chests_list = TreasureChest.objects.all()
+    # Get a page of treasure chests, only reading the displayed columns.
+    treasure_chests_list, next_cursor = get_page(request,
+            TreasureChest.objects.values("id", "name", "points"), ["id"])
 
     return render(request, "game/list_treasure_chests.html", {"title": title,
-        "treasure_chests_list": treasure_chests_list})
+        "treasure_chests_list": treasure_chests_list,
+        "next_cursor": next_cursor})
 
 
 @login_required(login_url="/login")
@@ -746,6 +1076,25 @@ def check_user_is_game_master(request):
         raise PermissionDenied
 
 
+def get_page(request, queryset, ordering):
+    """Get the page of a list given by the "cursor" parameter.
+
+    Arguments:
+    request - Django object containing request information.
+    queryset (QuerySet) - rows of the list.
+    ordering (list) - fields to order by, ending with a unique field.
+
+    Returns:
+    rows (list) - rows on the page.
+    next_cursor (str) - cursor of the next page, None if this is the last.
+    """
+    try:
+        return paginate(queryset, ordering, request.GET.get("cursor"),
+                PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("Invalid cursor.")
+
+
 def display_error_messages(request, form):
     """Display error messages from forms.
 
@@ -0,0 +1,83 @@
+"""Instance warmup used in game app.
+
+Used for doing the work the first request on a new App Engine instance
+would otherwise pay for. App Engine sends a request to /_ah/warmup before
+giving the instance traffic, which opens the database connections, loads
+the URL configuration, compiles the templates, imports the modules Django
+loads lazily and fills the caches.
+
+Each step is timed with the startup profiler, see hotandcold/startup.py.
+"""
+
+import importlib
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from hotandcold import startup
+
+from . import caches, leaderboards
+
+
+# Modules imported by Django the first time they are used.
+LAZY_MODULES = [
+    "django.contrib.sessions.backends.db",
+    "django.contrib.messages.storage.fallback",
+    "django.contrib.auth.password_validation",
+    "django.templatetags.static",
+]
+
+
+def get_template_names():
+    """Return the name of every template in the game app.
+
+    Returns:
+    names (list) - template names, such as "game/home.html".
+    """
+    directory = os.path.join(apps.get_app_config("game").path, "templates")
+
+    names = []
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            # Skip hidden files such as .DS_Store.
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(root, file_name)
+            names.append(os.path.relpath(path, directory).replace(os.sep, "/"))
+
+    return sorted(names)
+
+
+def warm_up():
+    """Do the work of a first request ahead of time.
+
+    Returns:
+    None.
+    """
+    with startup.step("database connections"):
+        for alias in settings.DATABASES:
+            connections[alias].ensure_connection()
+
+    with startup.step("url configuration"):
+        get_resolver().url_patterns
+
+    with startup.step("lazy imports"):
+        for module_name in LAZY_MODULES:
+            importlib.import_module(module_name)
+        get_hashers()
+
+    # Templates are compiled once and kept by the cached template loader,
+    # which is used when DEBUG is off.
+    with startup.step("templates"):
+        for name in get_template_names():
+            get_template(name)
+
+    with startup.step("caches"):
+        caches.fill_live_events()
+        for window in ["all"] + list(leaderboards.WINDOWS):
+            caches.fill_leaderboard(window)
@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'game.routers.PrimaryPinMiddleware',
 ]
 
 ROOT_URLCONF = 'hotandcold.urls'
@@ -95,6 +96,80 @@ else:
         }
     }
 
+# Read replicas, used by views decorated with @use_replica (see
+# game/routers.py). DATABASE_REPLICA_HOSTS is a comma separated list of
+# host[:port][=weight], for example "10.0.0.2=2,10.0.0.3" or a Cloud SQL
+# socket path. Each replica is a copy of the primary settings with its own
+# host. For trying replicas locally, add the aliases to DATABASES (two
+# SQLite files work) and list them in DATABASE_REPLICAS, then migrate them
+# with "migrate --database <alias>" and copy the data of the primary into
+# them (see game/routers.py).
+DATABASE_REPLICAS = {}
+for index, replica in enumerate(filter(None,
+        os.getenv("DATABASE_REPLICA_HOSTS", "").split(","))):
+    host, _, weight = replica.strip().partition("=")
+    alias = "replica{}".format(index + 1)
+    DATABASES[alias] = dict(DATABASES["default"], HOST=host,
+            TEST={"MIRROR": "default"})
+    if not host.startswith("/") and ":" in host:
+        DATABASES[alias]["HOST"], DATABASES[alias]["PORT"] = \
+            host.rsplit(":", 1)
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ["game.routers.ReplicaRouter"]
+
+# Seconds a client reads from the primary for after writing, giving the
+# replicas time to catch up.
+REPLICA_PIN_SECONDS = 5
+
+
+# Caches.
+# See https://docs.djangoproject.com/en/4.0/topics/cache/
+# The local memory cache is per process, set MEMCACHED_LOCATION to share the
+# cache (and rate limits) between instances. This needs pymemcache.
+if os.getenv("MEMCACHED_LOCATION", None):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": os.getenv("MEMCACHED_LOCATION"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
+# Logging.
+# See https://docs.djangoproject.com/en/4.0/topics/logging/
+# Startup times are logged at INFO level so cold starts can be tracked.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "hotandcold.startup": {
+            "handlers": ["console"],
+            "level": "INFO",
+        },
+    },
+}
+
+
+# Rate limiting policies, (capacity per user, period in seconds, capacity per
+# IP address). See game/ratelimit.py.
+RATELIMIT_POLICIES = {
+    "game": (10, 60, 300),
+    "login": (5, 60, 60),
+    "register": (3, 300, 30),
+}
+
 
 # Password validation.
 # See https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -0,0 +1,154 @@
+"""Startup profiling for hotandcold project.
+
+Used for tracking the cold start latency of new App Engine instances. The
+time taken by each initialisation step (loading Django, warming up) is
+always recorded. When the PROFILE_STARTUP environment variable is set, the
+import time of every module is recorded as well, both including the modules
+it imports (cumulative) and on its own (self).
+
+The report is logged once the instance has warmed up, see game/warmup.py.
+"""
+
+import contextlib
+import logging
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Import times of modules, name to (cumulative seconds, self seconds).
+module_times = {}
+
+# Times of initialisation steps, (name, seconds) in the order they ran.
+step_times = []
+
+# Time spent importing the children of each module being imported.
+_child_times = []
+
+
+class ImportTimer:
+    """Meta path finder recording how long each module takes to import.
+
+    Finds modules with the other finders and wraps the loader so running
+    the module is timed.
+    """
+
+    def find_spec(self, name, path, target=None):
+        """Find a module and time it when it is loaded.
+
+        Arguments:
+        name (str) - full name of the module.
+        path (list) - search path of the parent package.
+        target (module) - module being reloaded.
+
+        Returns:
+        spec (ModuleSpec) - spec of the module, or None if not found.
+        """
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        # Built in and frozen modules are loaded by classes, which are
+        # shared and cannot be wrapped.
+        loader = spec.loader
+        if isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            _child_times.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                children = _child_times.pop()
+                if _child_times:
+                    _child_times[-1] += total
+                module_times[name] = (total, total - children)
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+
+_import_timer = ImportTimer()
+
+
+def start():
+    """Start recording module import times.
+
+    Returns:
+    None.
+    """
+    if _import_timer not in sys.meta_path:
+        sys.meta_path.insert(0, _import_timer)
+
+
+def stop():
+    """Stop recording module import times.
+
+    Returns:
+    None.
+    """
+    if _import_timer in sys.meta_path:
+        sys.meta_path.remove(_import_timer)
+
+
+@contextlib.contextmanager
+def step(name):
+    """Context manager recording the time taken by an initialisation step.
+
+    Arguments:
+    name (str) - name of the step.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        step_times.append((name, time.perf_counter() - start_time))
+
+
+def report(limit=20):
+    """Return the recorded startup times.
+
+    Arguments:
+    limit (int) - number of the slowest modules to include.
+
+    Returns:
+    report (dict) - "steps" with the time of each step, and "modules" with
+    the (name, cumulative, self) times of the modules slowest on their own.
+    """
+    slowest = sorted(module_times.items(), key=lambda item: item[1][1],
+            reverse=True)[:limit]
+    return {
+        "steps": [(name, round(seconds, 4)) for name, seconds in step_times],
+        "modules": [(name, round(total, 4), round(own, 4))
+            for name, (total, own) in slowest],
+    }
+
+
+def log_report(limit=20):
+    """Log the recorded startup times.
+
+    Arguments:
+    limit (int) - number of the slowest modules to include.
+
+    Returns:
+    None.
+    """
+    startup_report = report(limit)
+    lines = ["Startup steps:"]
+    lines += ["  {:<30} {:8.1f} ms".format(name, seconds * 1000)
+        for name, seconds in startup_report["steps"]]
+    if startup_report["modules"]:
+        lines.append("Slowest imports (self, cumulative):")
+        lines += ["  {:<50} {:8.1f} ms {:8.1f} ms".format(name, own * 1000,
+            total * 1000) for name, total, own in startup_report["modules"]]
+    logger.info("\n".join(lines))
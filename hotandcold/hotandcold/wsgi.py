@@ -2,14 +2,24 @@
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Set the PROFILE_STARTUP environment variable to record the import time of
+every module, reported after the warmup request (see hotandcold/startup.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 """
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+from hotandcold import startup
+
+if os.getenv("PROFILE_STARTUP", None):
+    startup.start()
+
+with startup.step("django imports"):
+    from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hotandcold.settings')
 
-application = get_wsgi_application()
+with startup.step("django setup"):
+    application = get_wsgi_application()